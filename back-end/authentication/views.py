@@ -1,5 +1,4 @@
 from django.contrib.auth import authenticate, login
-from django.core.mail import send_mail
 from rest_framework import generics, status
 from rest_framework.permissions import IsAdminUser, IsAuthenticated, AllowAny
 from rest_framework.response import Response
@@ -9,6 +8,7 @@ from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework_simplejwt.tokens import RefreshToken
 from .models import User, PasswordResetToken
 from .serializers import UserSerializer, RegisterSerializer, LoginSerializer, ChangePasswordSerializer
+from documents.utils.outbox import enqueue_email
 
 
 class UserListView(generics.ListCreateAPIView):
@@ -66,12 +66,12 @@ class RequestPasswordResetView(APIView):
             return Response({"error": "Utilisateur non trouvé"}, status=status.HTTP_404_NOT_FOUND)
         reset_token = PasswordResetToken.generate_token(user)
         email_message = f"Votre code de réinitialisation du mot de passe est : {reset_token.token}"
-        send_mail(
+        # Envoyé par `manage.py send_outbox`, pas pendant la requête
+        enqueue_email(
             'Demande de réinitialisation du mot de passe',
             email_message,
-            'no-reply@agriconnect.com',
             [user.email],
-            fail_silently=False,
+            from_email='no-reply@agriconnect.com',
         )
         return Response({"message": "Code de réinitialisation envoyé à votre email"}, status=status.HTTP_200_OK)
 
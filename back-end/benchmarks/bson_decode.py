@@ -0,0 +1,100 @@
+"""BSON decoding strategies for the read-only listings (files, search, notifications).
+
+Run from back-end/: python benchmarks/bson_decode.py [--items 10000] [--threads 8] [--requests 64]
+
+A listing reply is simulated by the BSON of N projected documents. Each strategy
+decodes it and builds the response items (projector), the way a view does:
+
+- default: pymongo's C decoder into dicts, conversions done by the projector
+- registry: read_codec_options(), TypeRegistry decoders turning ObjectId into
+  str and datetimes into ISO strings during the decode (what the views use)
+- registry (ObjectId): only the ObjectId decoder
+- raw: RawBSONDocument, fields decoded on access
+
+Each strategy serves --requests listings from --threads threads (load test),
+the script reports CPU time per listing, listings per second and the peak
+memory of one listing.
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'masterdrive.settings')
+
+import django
+
+django.setup()
+
+import bson
+from bson.codec_options import CodecOptions, TypeRegistry
+from bson.raw_bson import RawBSONDocument
+
+from documents.projectors import FILE_LIST, NOTIFICATION, ObjectIdAsString, read_codec_options
+from serializers import make_files, make_notifications
+
+
+STRATEGIES = {
+    'default': CodecOptions(),
+    'registry': read_codec_options(),
+    'registry (ObjectId)': CodecOptions(type_registry=TypeRegistry([ObjectIdAsString()])),
+    'raw': CodecOptions(document_class=RawBSONDocument),
+}
+
+
+def reply(documents, projector):
+    # What the server sends back for find(query, projector.projection)
+    return b''.join(
+        bson.encode({key: document[key] for key in projector.projection if key in document})
+        for document in documents
+    )
+
+
+def serve(data, codec_options, projector):
+    return projector.many(bson.decode_all(data, codec_options))
+
+
+def load_test(data, codec_options, projector, threads, requests):
+    cpu, wall = time.process_time(), time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        for _ in pool.map(lambda _: serve(data, codec_options, projector), range(requests)):
+            pass
+    return (time.process_time() - cpu) / requests, requests / (time.perf_counter() - wall)
+
+
+def peak_memory(data, codec_options, projector):
+    tracemalloc.start()
+    serve(data, codec_options, projector)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--items', type=int, default=10000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=64)
+    args = parser.parse_args()
+
+    cases = [
+        ('files', make_files(args.items), FILE_LIST),
+        ('notifications', make_notifications(args.items), NOTIFICATION),
+    ]
+    print(f'{args.items} items per listing, {args.requests} listings on {args.threads} threads')
+    print(f'{"listing":<15}{"strategy":<22}{"CPU ms":>9}{"listings/s":>12}{"peak MB":>9}')
+    for name, documents, projector in cases:
+        data = reply(documents, projector)
+        expected = serve(data, STRATEGIES['default'], projector)
+        for strategy, codec_options in STRATEGIES.items():
+            assert serve(data, codec_options, projector) == expected, f'{strategy}: different output'
+            cpu, throughput = load_test(data, codec_options, projector, args.threads, args.requests)
+            peak = peak_memory(data, codec_options, projector)
+            print(f'{name:<15}{strategy:<22}{cpu * 1000:>9.1f}{throughput:>12.1f}{peak / 1024 / 1024:>9.1f}')
+
+
+if __name__ == '__main__':
+    main()
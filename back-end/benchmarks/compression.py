@@ -0,0 +1,120 @@
+"""CPU cost vs. storage savings of zstd compression at rest.
+
+Run from back-end/: python benchmarks/compression.py [--size-mb 32] [--levels 1 3 9]
+
+For each sample type it reports the compression ratio, compress and decompress
+throughput per level, and the cost of the upload-time compressibility probe,
+so STORAGE_COMPRESSION_LEVEL / _MIN_RATIO can be tuned against the disk and
+network bandwidth of the deployment.
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import random
+import string
+import time
+import zipfile
+
+import zstandard
+
+MB = 1024 * 1024
+PROBE_SIZE = 64 * 1024
+
+
+def sample_csv(size):
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(['id', 'date', 'client', 'montant', 'statut'])
+    i = 0
+    while out.tell() < size:
+        writer.writerow([i, f'2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}', f'client-{i % 500}',
+                         f'{random.random() * 100000:.2f}', random.choice(['payé', 'en attente', 'annulé'])])
+        i += 1
+    return out.getvalue().encode()[:size]
+
+
+def sample_text(size):
+    words = [''.join(random.choices(string.ascii_lowercase, k=random.randint(2, 10))) for _ in range(2000)]
+    text = ' '.join(random.choices(words, k=size // 5))
+    return text.encode()[:size]
+
+
+def sample_json(size):
+    records = []
+    total = 0
+    while total < size:
+        record = json.dumps({'id': len(records), 'tags': ['a', 'b'], 'owner': f'user{len(records) % 50}',
+                             'score': random.random()})
+        records.append(record)
+        total += len(record) + 1
+    return '\n'.join(records).encode()[:size]
+
+
+def sample_office(size):
+    # docx/xlsx are ZIP containers: already deflated, barely compressible
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('word/document.xml', sample_text(size * 3))
+    return buffer.getvalue()[:size]
+
+
+def sample_random(size):
+    # Stands in for JPEG / MP4 / encrypted content
+    return os.urandom(size)
+
+
+SAMPLES = {
+    'csv': sample_csv,
+    'text': sample_text,
+    'json': sample_json,
+    'office (zip)': sample_office,
+    'media (random)': sample_random,
+}
+
+
+def timed(fn, repeat=3):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def stream_compress(data, level):
+    compressor = zstandard.ZstdCompressor(level=level).compressobj()
+    parts = [compressor.compress(data[i:i + MB]) for i in range(0, len(data), MB)]
+    parts.append(compressor.flush())
+    return b''.join(parts)
+
+
+def stream_decompress(blob):
+    reader = zstandard.ZstdDecompressor().stream_reader(io.BytesIO(blob), read_size=MB)
+    return sum(len(chunk) for chunk in iter(lambda: reader.read(MB), b''))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size-mb', type=int, default=32)
+    parser.add_argument('--levels', type=int, nargs='+', default=[1, 3, 9])
+    args = parser.parse_args()
+    size = args.size_mb * MB
+
+    print(f'{"sample":<16}{"level":>6}{"ratio":>8}{"saved":>9}{"comp MB/s":>11}{"decomp MB/s":>13}{"probe ms":>10}')
+    for name, make in SAMPLES.items():
+        data = make(size)
+        probe_time, _ = timed(lambda: zstandard.ZstdCompressor(level=1).compress(data[:PROBE_SIZE]))
+        for level in args.levels:
+            compress_time, blob = timed(lambda: stream_compress(data, level))
+            decompress_time, _ = timed(lambda: stream_decompress(blob))
+            ratio = len(data) / len(blob)
+            print(f'{name:<16}{level:>6}{ratio:>8.2f}{1 - 1 / ratio:>9.0%}'
+                  f'{len(data) / MB / compress_time:>11.0f}{len(data) / MB / decompress_time:>13.0f}'
+                  f'{probe_time * 1000:>10.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""Throughput and latency of a running server under N concurrent clients.
+
+Run from back-end/ against a server started separately, once per server kind:
+
+    gunicorn masterdrive.wsgi --workers 2 --threads 8
+    uvicorn masterdrive.asgi:application --workers 2
+
+    python benchmarks/concurrency.py --url http://127.0.0.1:8000/api/v1/files/ \\
+        --token <access token> --concurrency 8 64 256 --pid <pid of the server>
+
+Each level keeps N connections busy for --duration seconds (standard library
+asyncio client, HTTP/1.1 keep-alive) and reports requests per second, p50 /
+p99 latency, errors and the peak RSS of the server processes (--pid and its
+children, read from /proc, Linux only). Compare the two servers at equal
+memory: the WSGI one needs a thread per in-flight request, the ASGI one does
+not.
+"""
+import argparse
+import asyncio
+import os
+import time
+from urllib.parse import urlsplit
+
+
+def rss(pid):
+    """Resident memory of pid and its children, in bytes."""
+    total, pids = 0, [pid]
+    while pids:
+        current = pids.pop()
+        try:
+            with open(f'/proc/{current}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1]) * 1024
+            with open(f'/proc/{current}/task/{current}/children') as f:
+                pids.extend(int(child) for child in f.read().split())
+        except FileNotFoundError:
+            continue
+    return total
+
+
+async def read_response(reader):
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('connection closed')
+    status = int(status_line.split()[1])
+    length, chunked = None, False
+    while (line := await reader.readline()) not in (b'\r\n', b''):
+        name, _, value = line.decode('latin-1').partition(':')
+        name = name.strip().lower()
+        if name == 'content-length':
+            length = int(value)
+        elif name == 'transfer-encoding' and 'chunked' in value.lower():
+            chunked = True
+    if chunked:
+        while size := int((await reader.readline()).split(b';')[0], 16):
+            await reader.readexactly(size + 2)
+        await reader.readline()
+    elif length:
+        await reader.readexactly(length)
+    return status
+
+
+async def client(url, headers, deadline, latencies, errors):
+    parts = urlsplit(url)
+    target = parts.path + (f'?{parts.query}' if parts.query else '')
+    request = (f'GET {target} HTTP/1.1\r\nHost: {parts.netloc}\r\n' + ''.join(
+        f'{name}: {value}\r\n' for name, value in headers.items()) + '\r\n').encode()
+    connection = None
+    while time.perf_counter() < deadline:
+        try:
+            if connection is None:
+                connection = await asyncio.open_connection(parts.hostname, parts.port or 80)
+            reader, writer = connection
+            start = time.perf_counter()
+            writer.write(request)
+            status = await read_response(reader)
+            latencies.append(time.perf_counter() - start)
+            if status >= 400:
+                errors.append(status)
+        except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError, IndexError) as e:
+            errors.append(type(e).__name__)
+            if connection is not None:
+                connection[1].close()
+            connection = None
+    if connection is not None:
+        connection[1].close()
+
+
+async def run_level(args, concurrency):
+    headers = {'Authorization': f'Bearer {args.token}'} if args.token else {}
+    latencies, errors = [], []
+    peak = 0
+    deadline = time.perf_counter() + args.duration
+    tasks = [
+        asyncio.create_task(client(args.url, headers, deadline, latencies, errors))
+        for _ in range(concurrency)
+    ]
+    start = time.perf_counter()
+    while not all(task.done() for task in tasks):
+        if args.pid:
+            peak = max(peak, rss(args.pid))
+        await asyncio.sleep(0.1)
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+
+    def percentile(p):
+        return latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000 if latencies else 0
+
+    print(f'{concurrency:>12}{len(latencies) / elapsed:>10.1f}{percentile(0.5):>9.1f}'
+          f'{percentile(0.99):>9.1f}{len(errors):>8}{peak / 1024 / 1024:>10.1f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', required=True)
+    parser.add_argument('--token', default=os.environ.get('BENCH_TOKEN'), help='JWT access token')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[8, 64, 256])
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--pid', type=int, help='server (master) process, to sample its memory')
+    args = parser.parse_args()
+
+    print(f'{args.url}, {args.duration:g}s per level')
+    print(f'{"concurrency":>12}{"req/s":>10}{"p50 ms":>9}{"p99 ms":>9}{"errors":>8}{"peak MB":>10}')
+    for concurrency in args.concurrency:
+        asyncio.run(run_level(args, concurrency))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""Encode time and allocations of MongoJSONRenderer: stdlib encoder vs. orjson.
+
+Run from back-end/: python benchmarks/json_render.py [--files 10000] [--repeat 5]
+
+The payload is a file listing as the views return it: raw Mongo documents with
+ObjectIds, datetimes, tags, permissions and activities. Both outputs are
+decoded and compared before timing so a speedup never hides a difference.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from django.conf import settings
+
+settings.configure()
+
+from bson import ObjectId
+from rest_framework.renderers import JSONRenderer
+
+import jsonrender
+
+
+def make_listing(count):
+    now = datetime.now()
+    owners = [str(i) for i in range(1, 51)]
+    listing = []
+    for i in range(count):
+        uploaded = now - timedelta(minutes=random.randint(0, 500000))
+        listing.append({
+            '_id': ObjectId(),
+            'title': f'Rapport mensuel {i}',
+            'description': 'Export comptable, version validée par la direction',
+            'type': random.choice(['pdf', 'image', 'video', 'other']),
+            'original_filename': f'rapport-{i}.pdf',
+            'file_path': f'{uuid.uuid4().hex}.pdf',
+            'size': random.randint(1000, 50 * 1024 * 1024),
+            'checksum': f'sha256:{uuid.uuid4().hex * 2}',
+            'owner_id': random.choice(owners),
+            'author': 'Awa Ndiaye',
+            'folder': str(ObjectId()) if i % 3 else None,
+            'tags': random.sample(['finance', '2024', 'rh', 'contrat', 'dakar', 'urgent'], 3),
+            'uploaded_at': uploaded,
+            'updated_at': uploaded + timedelta(hours=1),
+            'is_favorite': i % 7 == 0,
+            'is_trashed': False,
+            'permissions': [
+                {'user_id': random.choice(owners), 'access_level': 'view', 'granted_at': uploaded}
+            ],
+            'activities': [
+                {'id': str(uuid.uuid4()), 'user_id': random.choice(owners), 'action': 'download',
+                 'timestamp': uploaded + timedelta(hours=h)} for h in range(3)
+            ],
+        })
+    return listing
+
+
+def measure(render, data, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = render(data)
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    render(data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak, output
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--files', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    if jsonrender.orjson is None:
+        sys.exit('orjson is not installed (pip install orjson)')
+
+    data = make_listing(args.files)
+    renderer = jsonrender.MongoJSONRenderer()
+    renderers = {
+        'stdlib + default()': lambda d: JSONRenderer.render(renderer, d),
+        'orjson': renderer.render,
+    }
+
+    results = {name: measure(render, data, args.repeat) for name, render in renderers.items()}
+    outputs = [json.loads(output) for _, _, output in results.values()]
+    assert all(output == outputs[0] for output in outputs), 'renderers disagree'
+
+    baseline = results['stdlib + default()'][0]
+    print(f'{args.files} files, {len(results["orjson"][2]) / 1024 / 1024:.1f} MB of JSON')
+    print(f'{"renderer":<22}{"encode ms":>11}{"speedup":>9}{"peak alloc MB":>15}')
+    for name, (elapsed, peak, _) in results.items():
+        print(f'{name:<22}{elapsed * 1000:>11.1f}{baseline / elapsed:>8.1f}x{peak / 1024 / 1024:>15.1f}')
+
+
+if __name__ == '__main__':
+    main()
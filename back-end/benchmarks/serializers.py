@@ -0,0 +1,118 @@
+"""Listing serialization: DRF serializers vs. the compiled projectors.
+
+Run from back-end/: python benchmarks/serializers.py [--files 10000] [--repeat 5]
+
+Both paths get the same raw Mongo documents. The script first checks that the
+projector output is identical to the serializer output (including documents
+with missing optional fields and None values), then times each path per item.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'masterdrive.settings')
+
+import django
+
+django.setup()
+
+from bson import ObjectId
+
+from documents.projectors import FILE_LIST, NOTIFICATION
+from documents.serializers import FileListSerializer, NotificationSerializer
+
+
+def make_files(count):
+    now = datetime.now()
+    files = []
+    for i in range(count):
+        uploaded = now - timedelta(minutes=random.randint(0, 500000), microseconds=random.randint(0, 999999))
+        files.append({
+            '_id': ObjectId(),
+            'title': f'Rapport mensuel {i}',
+            'description': 'Export comptable',
+            'type': random.choice(['pdf', 'image', 'video', 'other']),
+            'author': 'Awa Ndiaye',
+            'owner_id': str(i % 50),
+            'size': random.randint(1000, 50 * 1024 * 1024),
+            'uploaded_at': uploaded,
+            'updated_at': uploaded + timedelta(hours=1) if i % 10 else None,
+            'is_favorite': i % 7 == 0,
+            'tags': random.sample(['finance', '2024', 'rh', 'contrat', 'dakar'], 2 + i % 3),
+            'activities': [{'id': str(uuid.uuid4()), 'action': 'view', 'timestamp': uploaded}],
+        })
+    return files
+
+
+def make_notifications(count):
+    now = datetime.now()
+    notifications = []
+    for i in range(count):
+        notification = {
+            '_id': ObjectId(),
+            'user_id': str(i % 50),
+            'type': random.choice(['share', 'comment', 'edit', 'system']),
+            'message': f'Awa a partagé le fichier {i}',
+            'created_at': now - timedelta(minutes=i),
+            'is_read': i % 2 == 0,
+            'details': {'access_level': 'view'},
+        }
+        if i % 3:
+            notification['file'] = ObjectId()
+        if i % 2 == 0:
+            notification['read_at'] = now
+        if i % 5 == 0:
+            del notification['details'], notification['is_read']
+        notifications.append(notification)
+    return notifications
+
+
+def with_id(documents):
+    # What the views used to do before handing documents to the serializer
+    result = []
+    for document in documents:
+        document = dict(document)
+        result.append({'id': str(document.pop('_id')), **document})
+    return result
+
+
+def timed(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--files', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    cases = [
+        ('files', make_files(args.files), FileListSerializer, FILE_LIST),
+        ('notifications', make_notifications(args.files), NotificationSerializer, NOTIFICATION),
+    ]
+
+    print(f'{"listing":<15}{"items":>7}{"serializer ms":>15}{"projector ms":>14}{"us/item":>15}{"speedup":>9}')
+    for name, documents, serializer_class, projector in cases:
+        renamed = with_id(documents)
+        expected = [dict(item) for item in serializer_class(renamed, many=True).data]
+        assert projector.many(documents) == expected, f'{name}: projector output differs'
+
+        serializer_time = timed(lambda: serializer_class(with_id(documents), many=True).data, args.repeat)
+        projector_time = timed(lambda: projector.many(documents), args.repeat)
+        per_item = f'{serializer_time / len(documents) * 1e6:.1f} -> {projector_time / len(documents) * 1e6:.2f}'
+        print(f'{name:<15}{len(documents):>7}{serializer_time * 1000:>15.1f}{projector_time * 1000:>14.1f}'
+              f'{per_item:>15}{serializer_time / projector_time:>8.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""Memory cost of idle notification streams on a running ASGI server.
+
+Run from back-end/ against `uvicorn masterdrive.asgi:application --workers 1`:
+
+    python benchmarks/sse_idle.py --url http://127.0.0.1:8000/api/v1/notifications/stream/ \\
+        --token <access token> --connections 100 1000 5000 --pid <pid of the server>
+
+For each level the script opens N streams, waits for them to settle, and
+reports the server RSS growth per connection and how many streams received
+their heartbeat (the server's NOTIFICATION_STREAM_HEARTBEAT must be shorter
+than --hold). Raise the open files limit (ulimit -n) on both sides for large
+levels.
+"""
+import argparse
+import asyncio
+import os
+import time
+from urllib.parse import urlsplit
+
+from concurrency import rss
+
+
+async def open_stream(url, token):
+    parts = urlsplit(url)
+    reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+    writer.write((
+        f'GET {parts.path}?token={token} HTTP/1.1\r\nHost: {parts.netloc}\r\n'
+        'Accept: text/event-stream\r\n\r\n'
+    ).encode())
+    status_line = await reader.readline()
+    if b' 200 ' not in status_line:
+        writer.close()
+        raise ConnectionError(status_line.decode().strip())
+    return reader, writer
+
+
+async def count_heartbeats(reader, deadline):
+    beats = 0
+    while (remaining := deadline - time.perf_counter()) > 0:
+        try:
+            line = await asyncio.wait_for(reader.readline(), remaining)
+        except asyncio.TimeoutError:
+            break
+        if not line:
+            break
+        beats += b': ping' in line
+    return beats
+
+
+async def run_level(args, count):
+    baseline = rss(args.pid)
+    started = time.perf_counter()
+    results = await asyncio.gather(*(open_stream(args.url, args.token) for _ in range(count)),
+                                   return_exceptions=True)
+    streams = [result for result in results if not isinstance(result, BaseException)]
+    connect_time = time.perf_counter() - started
+
+    deadline = time.perf_counter() + args.hold
+    counting = asyncio.gather(*(count_heartbeats(reader, deadline) for reader, _ in streams))
+    await asyncio.sleep(args.hold / 2)
+    loaded = rss(args.pid)
+    beats = await counting
+    for _, writer in streams:
+        writer.close()
+
+    per_connection = (loaded - baseline) / len(streams) if streams else 0
+    print(f'{count:>12}{len(streams):>8}{connect_time:>11.2f}{(loaded - baseline) / 1024 / 1024:>12.1f}'
+          f'{per_connection / 1024:>12.1f}{sum(1 for b in beats if b):>12}')
+    await asyncio.sleep(2)  # let the server drop the closed streams
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', required=True)
+    parser.add_argument('--token', default=os.environ.get('BENCH_TOKEN'), required=not os.environ.get('BENCH_TOKEN'))
+    parser.add_argument('--connections', type=int, nargs='+', default=[100, 1000])
+    parser.add_argument('--hold', type=float, default=40, help='seconds each level stays connected')
+    parser.add_argument('--pid', type=int, required=True, help='server process, to sample its memory')
+    args = parser.parse_args()
+
+    print(f'{"connections":>12}{"open":>8}{"connect s":>11}{"RSS +MB":>12}{"KB/conn":>12}{"heartbeats":>12}')
+    for count in args.connections:
+        asyncio.run(run_level(args, count))
+
+
+if __name__ == '__main__':
+    main()
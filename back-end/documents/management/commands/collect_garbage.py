@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from documents.utils.gc import collect_garbage
+from documents.utils.jobs import create_job, run_job
+
+
+class Command(BaseCommand):
+    help = 'Delete (or quarantine) stored blobs that no document or version references'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be reclaimed')
+        parser.add_argument('--quarantine', action='store_true',
+                            help='Move orphans to GC_QUARANTINE_PATH instead of deleting them')
+        parser.add_argument('--grace-hours', type=float, default=settings.GC_GRACE_PERIOD / 3600,
+                            help='Ignore blobs modified more recently than this')
+        parser.add_argument('--spill-threshold', type=int, default=settings.GC_SPILL_THRESHOLD,
+                            help='Referenced names kept in memory before spilling sorted runs to disk')
+
+    def handle(self, *args, **options):
+        job = create_job('blob_gc', None, {
+            'dry_run': options['dry_run'],
+            'quarantine': options['quarantine'],
+            'grace_hours': options['grace_hours'],
+        })
+        report = run_job(
+            job['_id'],
+            lambda job_id: collect_garbage(
+                grace_period=options['grace_hours'] * 3600,
+                quarantine=options['quarantine'],
+                dry_run=options['dry_run'],
+                spill_threshold=options['spill_threshold'],
+            )
+        )
+        if report is None:
+            self.stderr.write('Garbage collection failed, see the job document for details.')
+            return
+
+        verb = 'Would reclaim' if options['dry_run'] else 'Reclaimed'
+        self.stdout.write(
+            f"Scanned {report['scanned']} blobs against {report['referenced']} references: "
+            f"{report['orphans']} orphans. {verb} {report['bytes_reclaimed']} bytes "
+            f"({report['errors']} errors)."
+        )
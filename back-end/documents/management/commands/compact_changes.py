@@ -0,0 +1,27 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from documents.utils.changes import compact
+
+
+class Command(BaseCommand):
+    help = 'Drop superseded change journal entries, and those older than CHANGES_RETENTION_DAYS'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.CHANGES_RETENTION_DAYS,
+                            help='Retention period in days')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep running, compacting every --interval seconds')
+        parser.add_argument('--interval', type=int, default=settings.CHANGES_COMPACT_INTERVAL)
+
+    def handle(self, *args, **options):
+        while True:
+            superseded, expired = compact(options['days'])
+            if superseded or expired:
+                self.stdout.write(f'Deleted {superseded} superseded and {expired} expired change entries.')
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
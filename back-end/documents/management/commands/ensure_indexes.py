@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from documents.utils.indexes import ensure_indexes
+
+
+class Command(BaseCommand):
+    help = 'Create the MongoDB indexes used by the API'
+
+    def handle(self, *args, **options):
+        for collection_name, names in ensure_indexes().items():
+            self.stdout.write(f"{collection_name}: {', '.join(names)}")
@@ -0,0 +1,25 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from documents.utils.jobs import fail_stale_jobs
+
+
+class Command(BaseCommand):
+    help = 'Fail the background jobs left running by a restarted worker and delete their staged archives'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep running, sweeping every --interval seconds')
+        parser.add_argument('--interval', type=int, default=settings.JOB_SWEEP_INTERVAL)
+
+    def handle(self, *args, **options):
+        while True:
+            failed = fail_stale_jobs()
+            if failed:
+                self.stdout.write(f'Failed {failed} stale jobs.')
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from documents.utils.comments import migrate_embedded
+
+
+class Command(BaseCommand):
+    help = 'Move the comments embedded in file documents to the comments collection'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+
+    def handle(self, *args, **options):
+        files, comments = migrate_embedded(options['batch_size'])
+        self.stdout.write(f'Moved {comments} comments of {files} files.')
@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from documents.storage import get_storage
+from documents.storage.local import LocalStorage
+from documents.utils.storage import SHARDED, migrate_to_sharded
+from documents.utils.throttle import RateLimiter
+
+
+class Command(BaseCommand):
+    help = 'Move blobs from the flat storage root into the sharded ab/cd/<name> layout'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--moves-per-second', type=int, default=0,
+                            help='Throttle file moves, 0 for unlimited')
+
+    def handle(self, *args, **options):
+        if not isinstance(get_storage(), LocalStorage):
+            raise CommandError('The storage layout only applies to the local filesystem backend.')
+        if settings.DOCUMENT_STORAGE_LAYOUT != SHARDED:
+            raise CommandError("Set DOCUMENT_STORAGE_LAYOUT = 'sharded' before migrating.")
+
+        def on_batch(batch, moved):
+            self.stdout.write(f'Batch {batch}: {moved} files moved so far.')
+
+        result = migrate_to_sharded(
+            batch_size=options['batch_size'],
+            limiter=RateLimiter(options['moves_per_second']),
+            on_batch=on_batch,
+        )
+        self.stdout.write(f"Done: {result['moved']} files moved, {result['failed']} could not be moved.")
@@ -0,0 +1,35 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from documents.utils.jobs import create_job, run_job
+from documents.utils.retention import prune_versions
+
+
+class Command(BaseCommand):
+    help = 'Apply the version retention policies and release the blobs of pruned versions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report what each policy would remove')
+        parser.add_argument('--owner', help='Only apply the policies of this user id')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep running, pruning every --interval seconds')
+        parser.add_argument('--interval', type=int, default=settings.VERSION_PRUNE_INTERVAL)
+
+    def handle(self, *args, **options):
+        while True:
+            job = create_job('prune_versions', None, {'dry_run': options['dry_run'], 'owner_id': options['owner']})
+            reports = run_job(job['_id'], prune_versions, options['dry_run'], options['owner']) or []
+            for report in reports:
+                scope = f"folder {report['folder_id']}" if report['folder_id'] else 'all files'
+                self.stdout.write(
+                    f"Policy {report['policy_id']} (user {report['owner_id']}, {scope}): "
+                    f"{report['versions_pruned']} versions in {report['files_pruned']}/{report['files_scanned']} files, "
+                    f"{report['bytes_reclaimed']} bytes {'reclaimable' if options['dry_run'] else 'reclaimed'}."
+                )
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,37 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from documents.utils.jobs import create_job, run_job
+from documents.utils.trash import purge_expired_trash, resume_stalled_purges
+
+
+class Command(BaseCommand):
+    help = 'Permanently delete files that stayed in the trash longer than TRASH_RETENTION_DAYS'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.TRASH_RETENTION_DAYS,
+                            help='Retention period in days')
+        parser.add_argument('--batch-size', type=int, default=settings.TRASH_PURGE_BATCH_SIZE)
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep running, purging every --interval seconds')
+        parser.add_argument('--interval', type=int, default=settings.TRASH_PURGE_INTERVAL)
+
+    def handle(self, *args, **options):
+        while True:
+            resumed = resume_stalled_purges()
+            if resumed:
+                self.stdout.write(f'Resumed {resumed} stalled purge jobs.')
+
+            job = create_job('trash_retention', None, {'days': options['days']})
+            result = run_job(job['_id'], purge_expired_trash, options['days'], options['batch_size'])
+            if result:
+                self.stdout.write(
+                    f"Purged {result['deleted']} files trashed before {result['cutoff']:%Y-%m-%d %H:%M}, "
+                    f"{result['bytes_reclaimed']} bytes reclaimed."
+                )
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
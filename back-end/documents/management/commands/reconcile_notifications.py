@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from documents.utils.notifications import reconcile_unread
+
+
+class Command(BaseCommand):
+    help = 'Recompute the unread notification counters from the notifications'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only reconcile this user id')
+
+    def handle(self, *args, **options):
+        fixes = reconcile_unread(options['user'])
+        for user_id, before, after in fixes:
+            self.stdout.write(f'User {user_id}: unread {before} -> {after}')
+        self.stdout.write(f'{len(fixes)} counters corrected.')
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from documents.utils.quotas import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Recompute quota usage from the stored documents and drop stale upload reservations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only reconcile this user id')
+
+    def handle(self, *args, **options):
+        fixes = reconcile(options['user'])
+        for fix in fixes:
+            self.stdout.write(
+                f"User {fix['user_id']}: used {fix['used_before']} -> {fix['used']}, "
+                f"reserved {fix['reserved_before']} -> {fix['reserved']}"
+            )
+        self.stdout.write(f'{len(fixes)} quotas corrected.')
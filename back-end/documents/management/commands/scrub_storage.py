@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from documents.utils.jobs import create_job, run_job
+from documents.utils.scrub import scrub_storage
+
+
+class Command(BaseCommand):
+    help = 'Re-hash stored blobs and report missing or corrupted versions to integrity_reports'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.SCRUB_WORKERS)
+        parser.add_argument('--rate-mb', type=float,
+                            default=(settings.SCRUB_BYTES_PER_SECOND or 0) / (1024 * 1024),
+                            help='Maximum read bandwidth in MB/s, 0 for unlimited')
+        parser.add_argument('--batch-size', type=int, default=settings.SCRUB_BATCH_SIZE)
+        parser.add_argument('--resume', action='store_true',
+                            help='Continue from the checkpoint of an interrupted run')
+
+    def handle(self, *args, **options):
+        job = create_job('storage_scrub', None, {'resume': options['resume']})
+        totals = run_job(
+            job['_id'], scrub_storage,
+            workers=options['workers'],
+            bytes_per_second=int(options['rate_mb'] * 1024 * 1024),
+            batch_size=options['batch_size'],
+            resume=options['resume'],
+        )
+        if totals is None:
+            self.stderr.write('Scrub failed, run again with --resume to continue from the checkpoint.')
+            return
+
+        self.stdout.write(
+            f"Checked {totals['versions']} versions of {totals['files']} files: {totals['ok']} ok, "
+            f"{totals['backfilled']} checksums backfilled, {totals['missing']} missing, "
+            f"{totals['mismatch']} corrupted, {totals['unreadable']} unreadable."
+        )
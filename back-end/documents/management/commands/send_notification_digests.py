@@ -0,0 +1,25 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from documents.utils.notifications import send_digests
+
+
+class Command(BaseCommand):
+    help = 'Summarise the queued comment / edit notifications of users who chose an hourly or daily digest'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep running, checking every --interval seconds')
+        parser.add_argument('--interval', type=int, default=settings.NOTIFICATION_DIGEST_CHECK_INTERVAL)
+
+    def handle(self, *args, **options):
+        while True:
+            sent = send_digests()
+            if sent:
+                self.stdout.write(f'Sent {sent} notification digests.')
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
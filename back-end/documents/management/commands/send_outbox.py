@@ -0,0 +1,30 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from documents.utils.outbox import requeue_stalled, send_pending
+
+
+class Command(BaseCommand):
+    help = 'Send the queued emails (password resets, notification digests) over one connection'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.EMAIL_OUTBOX_BATCH_SIZE)
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep running, sending every --interval seconds')
+        parser.add_argument('--interval', type=int, default=settings.EMAIL_OUTBOX_INTERVAL)
+
+    def handle(self, *args, **options):
+        while True:
+            requeued = requeue_stalled()
+            if requeued:
+                self.stdout.write(f'Requeued {requeued} messages of a stalled sender.')
+
+            stats = send_pending(options['batch_size'])
+            if stats['sent'] or stats['failed']:
+                self.stdout.write(f"Sent {stats['sent']} emails, {stats['failed']} messages failed.")
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -1,24 +1,33 @@
 from django.db import models
+from django.conf import settings
 from django.contrib.auth.models import User
 from mongoengine import (
     Document, EmbeddedDocument, StringField, DateTimeField, 
     ListField, ReferenceField, BooleanField, IntField,
     EmbeddedDocumentField, EmbeddedDocumentListField,
-    FileField, DictField, CASCADE
+    FileField, DictField, ObjectIdField, BinaryField, CASCADE
 )
 from datetime import datetime
 import os
 import uuid
 
-class Comment(EmbeddedDocument):
-    """Embedded document for file comments"""
+class Comment(Document):
+    """File comment or reply (documents/utils/comments.py)"""
     id = StringField(primary_key=True, default=lambda: str(uuid.uuid4()))
+    file_id = ObjectIdField(required=True)
+    parent_id = StringField(null=True)  # top-level comment replied to
     user_id = StringField(required=True)
     text = StringField(required=True)
+    reply_count = IntField(default=0)
     created_at = DateTimeField(default=datetime.now)
     updated_at = DateTimeField(default=datetime.now)
     
-    meta = {'allow_inheritance': True}
+    meta = {
+        'collection': 'comments',
+        'indexes': [
+            {'fields': ['file_id', 'parent_id', '-created_at', '-id']}
+        ]
+    }
 
 class FileVersion(EmbeddedDocument):
     """Embedded document for file versions"""
@@ -26,6 +35,10 @@ class FileVersion(EmbeddedDocument):
     file_path = StringField(required=True)
     version_number = IntField(required=True)
     size = IntField(required=True)
+    checksum = StringField()  # "sha256:<hex>" of the original bytes
+    encoding = StringField(null=True)  # 'zstd' when compressed at rest
+    stored_size = IntField()  # bytes used in storage, `size` is the original size
+    delta_base = StringField(null=True)  # snapshot blob this delta version is rebuilt from
     created_at = DateTimeField(default=datetime.now)
     created_by = StringField(required=True)
     
@@ -81,6 +94,10 @@ class File(Document):
     file_path = StringField(required=True, unique=True)
     original_filename = StringField(required=True)
     size = IntField(required=True)  # Size in bytes
+    checksum = StringField()  # checksum of the current version
+    encoding = StringField(null=True)
+    stored_size = IntField()
+    delta_base = StringField(null=True)
     
     owner_id = StringField(required=True)
     folder = ReferenceField(Folder, null=True)
@@ -92,10 +109,13 @@ class File(Document):
     is_favorite = BooleanField(default=False)
     is_trashed = BooleanField(default=False)
     trashed_at = DateTimeField()
+    purge_job = ObjectIdField()  # set once an empty-trash / retention job owns the file
     
     permissions = EmbeddedDocumentListField(FilePermission)
     versions = EmbeddedDocumentListField(FileVersion)
-    comments = EmbeddedDocumentListField(Comment)
+    comment_count = IntField(default=0)  # comments and replies, in the comments collection
+    revision = IntField(default=1)  # bumped by every metadata edit and new version (ETag / If-Match)
+    version_seq = IntField(default=1)  # last version number handed out
     activities = EmbeddedDocumentListField(FileActivity)
     
     meta = {
@@ -109,7 +129,9 @@ class File(Document):
             {'fields': ['folder']},
             {'fields': ['uploaded_at']},
             {'fields': ['is_favorite']},
-            {'fields': ['is_trashed']}
+            {'fields': ['is_trashed']},
+            {'fields': ['is_trashed', 'trashed_at']},
+            {'fields': ['purge_job'], 'sparse': True}
         ]
     }
     
@@ -134,12 +156,186 @@ class Notification(Document):
     is_read = BooleanField(default=False)
     read_at = DateTimeField()
     details = DictField()
+    count = IntField(default=1)  # coalesced events
+    first_created_at = DateTimeField()  # first event of a coalesced notification
+    coalesce_key = StringField()  # recipient:type:file:window, unset once read
+    updated_at = DateTimeField(default=datetime.now)  # moved by merged events, polled by the streams
     
     meta = {
         'collection': 'notifications',
         'indexes': [
-            {'fields': ['user_id']},
-            {'fields': ['is_read']},
-            {'fields': ['created_at']}
+            {'fields': ['user_id', 'is_read', '-created_at', '-_id']},
+            {'fields': ['user_id', 'updated_at']},
+            {'fields': ['read_at'],
+             'expireAfterSeconds': settings.NOTIFICATION_READ_RETENTION_DAYS * 24 * 60 * 60,
+             'partialFilterExpression': {'is_read': True}},
+            {'fields': ['coalesce_key'], 'unique': True,
+             'partialFilterExpression': {'coalesce_key': {'$exists': True}}}
+        ]
+    }
+
+class NotificationPreference(Document):
+    """Digest choice of a user; events waiting for it are kept in notification_digest_queue"""
+    id = StringField(primary_key=True)  # user id
+    digest = StringField(null=True, choices=['hourly', 'daily'])
+    last_digest_at = DateTimeField()
+    
+    meta = {
+        'collection': 'notification_preferences',
+        'indexes': [
+            {'fields': ['digest'], 'sparse': True}
+        ]
+    }
+
+class NotificationCounter(Document):
+    """Unread notifications of a user (badge), moved with $inc by the notification writers"""
+    id = StringField(primary_key=True)  # user id
+    unread = IntField(default=0)
+    
+    meta = {
+        'collection': 'notification_counters'
+    }
+
+class OutboxEmail(Document):
+    """Email waiting for `manage.py send_outbox` (documents/utils/outbox.py)"""
+    subject = StringField(required=True)
+    body = StringField(required=True)
+    to = ListField(StringField())
+    from_email = StringField()
+    batch_key = StringField(null=True)  # messages sharing it are sent as one digest
+    status = StringField(choices=['pending', 'sending', 'sent', 'failed'], default='pending')
+    attempts = IntField(default=0)
+    last_error = StringField(null=True)
+    created_at = DateTimeField(default=datetime.now)
+    next_attempt_at = DateTimeField()
+    claim = StringField(null=True)  # sender run holding the message
+    claimed_at = DateTimeField()
+    sent_at = DateTimeField(null=True)
+    
+    meta = {
+        'collection': 'email_outbox',
+        'indexes': [
+            {'fields': ['status', 'batch_key', 'next_attempt_at']},
+            {'fields': ['claim'], 'sparse': True}
+        ]
+    }
+
+class ChunkSyncSession(Document):
+    """Block-level upload of a new version in progress (documents/utils/chunk_sync.py)"""
+    file_id = ObjectIdField(required=True)
+    user_id = StringField(required=True)
+    base_version = StringField(null=True)  # current version when the upload started, chunks are copied from it
+    base_path = StringField()  # its blob at that time (sessions opened before base_version)
+    base_encoding = StringField(null=True)
+    chunks = ListField(ListField())  # [hash, size, offset in the base or None]
+    missing = ListField(StringField())
+    size = IntField()
+    checksum = StringField(null=True)
+    committing_until = DateTimeField()  # set while a request assembles it (one commit per session)
+    created_at = DateTimeField(default=datetime.now)
+    expires_at = DateTimeField()
+
+    meta = {
+        'collection': 'chunk_sync_sessions',
+        'indexes': [
+            {'fields': ['expires_at'], 'expireAfterSeconds': 0}
+        ]
+    }
+
+class ChunkSyncChunk(Document):
+    """Chunk uploaded to a ChunkSyncSession"""
+    session_id = ObjectIdField(required=True)
+    hash = StringField(required=True)  # sha256, hex
+    data = BinaryField()
+    created_at = DateTimeField(default=datetime.now)
+
+    meta = {
+        'collection': 'chunk_sync_chunks',
+        'indexes': [
+            {'fields': ['session_id', 'hash'], 'unique': True},
+            {'fields': ['created_at'], 'expireAfterSeconds': settings.CHUNK_SYNC_SESSION_TTL}
+        ]
+    }
+
+class ChangeEntry(Document):
+    """Journal entry of GET /api/v1/changes/ (documents/utils/changes.py)"""
+    user_id = StringField(required=True)
+    seq = IntField(required=True)  # per user, from change_sequences
+    kind = StringField(choices=['file', 'folder'], required=True)
+    object_id = ObjectIdField(required=True)
+    at = DateTimeField(default=datetime.now)
+
+    meta = {
+        'collection': 'changes',
+        'indexes': [
+            {'fields': ['user_id', 'seq'], 'unique': True},
+            {'fields': ['user_id', 'kind', 'object_id', 'seq']},
+            {'fields': ['at']}
+        ]
+    }
+
+class ChangeSequence(Document):
+    """Last change number of a user, _id is the user id"""
+    id = StringField(primary_key=True)
+    seq = IntField(default=0)
+    compacted = IntField(default=0)  # tokens below it get a 410
+
+    meta = {
+        'collection': 'change_sequences'
+    }
+
+class IdempotencyKey(Document):
+    """Idempotency-Key of a POST (documents/utils/idempotency.py), _id is <user id>:<key>"""
+    id = StringField(primary_key=True)
+    user_id = StringField(required=True)
+    key = StringField(required=True)
+    status = StringField(choices=['processing', 'completed'], default='processing')
+    lock = StringField(null=True)  # token of the request running it
+    locked_until = DateTimeField(null=True)  # taken over by a retry after this
+    fingerprint = StringField(null=True)  # sha256 of method, path and body
+    response = DictField()  # {status, data, headers} replayed to duplicates
+    created_at = DateTimeField(default=datetime.now)
+    expires_at = DateTimeField()
+
+    meta = {
+        'collection': 'idempotency_keys',
+        'indexes': [
+            {'fields': ['expires_at'], 'expireAfterSeconds': 0}
+        ]
+    }
+
+class RetentionPolicy(Document):
+    """Version retention rules of a user, or of one of their folders"""
+    owner_id = StringField(required=True)
+    folder_id = StringField(null=True)  # None: all the user's files without a folder policy
+    keep_last = IntField(null=True)
+    keep_daily = IntField(null=True)  # periods back from now, -1 = forever
+    keep_weekly = IntField(null=True)
+    keep_monthly = IntField(null=True)
+    last_run = DictField()  # report of the last prune_versions run
+    versions_pruned_total = IntField(default=0)
+    bytes_reclaimed_total = IntField(default=0)
+    created_at = DateTimeField(default=datetime.now)
+    updated_at = DateTimeField(default=datetime.now)
+    
+    meta = {
+        'collection': 'retention_policies',
+        'indexes': [
+            {'fields': ['owner_id', 'folder_id'], 'unique': True}
         ]
-    }
\ No newline at end of file
+    }
+
+class Quota(Document):
+    """Storage quota of a user, counters updated atomically with $inc"""
+    id = StringField(primary_key=True)  # user id
+    limit = IntField(null=True)  # bytes, None for unlimited
+    used = IntField(default=0)
+    reserved = IntField(default=0)  # uploads in progress
+    available = IntField(default=0)  # limit - used - reserved
+    reservations = ListField(DictField())  # {id, amount, created_at}
+    updated_at = DateTimeField(default=datetime.now)
+    reconciled_at = DateTimeField()
+    
+    meta = {
+        'collection': 'quotas'
+    }
@@ -0,0 +1,219 @@
+"""Read-only fast path for the list serializers.
+
+A projector turns raw Mongo documents into the exact dicts the matching DRF
+serializer produces. The field list is compiled once into a single function
+(one dict literal), so listing N documents costs N function calls instead of
+N serializer instances walking their fields. `projection` lets the views fetch
+only the fields that end up in the response.
+"""
+import functools
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from bson import ObjectId
+from bson.codec_options import CodecOptions, TypeDecoder, TypeRegistry
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import ISO_8601
+from rest_framework.fields import BooleanField
+from rest_framework.settings import api_settings
+
+from .serializers import NotificationSerializer
+
+# What to do when a field is missing from the document, as DRF's Field.get_attribute does
+REQUIRED = 'required'  # KeyError
+SKIP = 'skip'  # key left out of the output (not required, read only)
+
+
+class Default:
+    """Value used when the field is missing (`default=` or `allow_null=True` fields)."""
+
+    def __init__(self, value):
+        self.value = value
+
+
+NULL = Default(None)
+ZERO = timedelta(0)
+
+
+def to_str(value):
+    return str(value)
+
+
+def to_int(value):
+    return int(value)
+
+
+def to_bool(value):
+    if value in BooleanField.TRUE_VALUES:
+        return True
+    if value in BooleanField.FALSE_VALUES:
+        return False
+    return bool(value)
+
+
+def current_timezone():
+    return timezone.get_current_timezone() if settings.USE_TZ else None
+
+
+def to_datetime(value, tz):
+    # DateTimeField.to_representation: naive values are taken in the current time zone
+    if not value:
+        return None
+    if isinstance(value, str) or api_settings.DATETIME_FORMAT is None:
+        return value
+
+    if tz is not None and value.tzinfo is None and tz.utcoffset(value) == ZERO \
+            and api_settings.DATETIME_FORMAT.lower() == ISO_8601:
+        # Naive UTC datetimes, what pymongo returns: make_aware() would only add '+00:00'
+        return value.isoformat() + 'Z'
+    if tz is not None:
+        value = value.astimezone(tz) if timezone.is_aware(value) else timezone.make_aware(value, tz)
+    elif timezone.is_aware(value):
+        value = timezone.make_naive(value, dt_timezone.utc)
+
+    if api_settings.DATETIME_FORMAT.lower() != ISO_8601:
+        return value.strftime(api_settings.DATETIME_FORMAT)
+    value = value.isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+to_datetime.needs_timezone = True  # gets the time zone resolved once per call to the projector
+
+
+def to_dict(value):
+    return {str(key): item for key, item in value.items()}
+
+
+def list_of(convert):
+    # Items are converted without a time zone: no datetime lists in the serializers
+    def to_list(value):
+        return [None if item is None else convert(item) for item in value]
+    return to_list
+
+
+def choice_of(choices):
+    lookup = {str(choice): choice for choice in choices}
+
+    def to_choice(value):
+        if value == '':
+            return value
+        return lookup.get(str(value), value)
+    return to_choice
+
+
+class ObjectIdAsString(TypeDecoder):
+    bson_type = ObjectId
+
+    def transform_bson(self, value):
+        return str(value)
+
+
+class DatetimeAsISO(TypeDecoder):
+    bson_type = datetime
+
+    def __init__(self, tz):
+        self.tz = tz
+
+    def transform_bson(self, value):
+        return to_datetime(value, self.tz)
+
+
+@functools.lru_cache(maxsize=None)
+def read_codec_options():
+    """Codec options converting ObjectIds and datetimes while pymongo decodes the reply.
+
+    For read-only listings: the projectors then pass these values through as is
+    (to_str / to_datetime accept strings). Datetimes use the default time zone,
+    the views never activate another one.
+    """
+    return CodecOptions(type_registry=TypeRegistry([ObjectIdAsString(), DatetimeAsISO(current_timezone())]))
+
+
+class Projector:
+    """Compiled document -> response dict mapping.
+
+    fields: (name, source key, converter, missing) tuples in output order.
+    Converters never see None, a None value is output as None like DRF does.
+    The current time zone is looked up once per call, not once per datetime.
+    """
+
+    def __init__(self, fields):
+        self.fields = tuple(fields)
+        self.projection = {source: 1 for _, source, _, _ in self.fields}
+        self._project = self._compile()
+
+    def _compile(self):
+        namespace = {}
+        literal, statements = [], []
+        for i, (name, source, convert, missing) in enumerate(self.fields):
+            namespace[f'c{i}'] = convert
+            if isinstance(missing, Default):
+                namespace[f'm{i}'] = missing.value
+                read = f'd.get({source!r}, m{i})'
+            else:
+                read = f'd[{source!r}]' if missing == REQUIRED else f'd.get({source!r})'
+            args = 'v, tz' if getattr(convert, 'needs_timezone', False) else 'v'
+            value = f'(None if (v := {read}) is None else c{i}({args}))'
+
+            if missing == SKIP:
+                statements.append(f'    if {source!r} in d: r[{name!r}] = {value}')
+            elif statements:
+                # Keep the declaration order once a field may be skipped
+                statements.append(f'    r[{name!r}] = {value}')
+            else:
+                literal.append(f'{name!r}: {value}')
+
+        source = 'def project(d, tz):\n    r = {' + ', '.join(literal) + '}\n'
+        source += ''.join(line + '\n' for line in statements)
+        source += '    return r\n'
+        exec(compile(source, f'<projector {id(self):x}>', 'exec'), namespace)
+        return namespace['project']
+
+    def __call__(self, document):
+        return self._project(document, current_timezone())
+
+    def many(self, documents):
+        project = self._project
+        tz = current_timezone()
+        return [project(document, tz) for document in documents]
+
+
+# Mirrors FileListSerializer. `id` is read from `_id`, so views don't need to rename it
+FILE_LIST = Projector([
+    ('id', '_id', to_str, REQUIRED),
+    ('title', 'title', to_str, REQUIRED),
+    ('type', 'type', to_str, REQUIRED),
+    ('author', 'author', to_str, REQUIRED),
+    ('size', 'size', to_int, REQUIRED),
+    ('uploaded_at', 'uploaded_at', to_datetime, REQUIRED),
+    ('updated_at', 'updated_at', to_datetime, REQUIRED),
+    ('is_favorite', 'is_favorite', to_bool, REQUIRED),
+    ('tags', 'tags', list_of(to_str), REQUIRED),
+])
+
+# Mirrors CommentSerializer, user_name is added by the view
+COMMENT = Projector([
+    ('id', '_id', to_str, REQUIRED),
+    ('user_id', 'user_id', to_str, REQUIRED),
+    ('text', 'text', to_str, REQUIRED),
+    ('parent_id', 'parent_id', to_str, NULL),
+    ('reply_count', 'reply_count', to_int, Default(0)),
+    ('created_at', 'created_at', to_datetime, SKIP),
+    ('updated_at', 'updated_at', to_datetime, SKIP),
+])
+
+# Mirrors NotificationSerializer
+NOTIFICATION = Projector([
+    ('id', '_id', to_str, REQUIRED),
+    ('user_id', 'user_id', to_str, REQUIRED),
+    ('type', 'type', choice_of(NotificationSerializer().fields['type'].choices), REQUIRED),
+    ('message', 'message', to_str, REQUIRED),
+    ('file', 'file', to_str, NULL),
+    ('created_at', 'created_at', to_datetime, SKIP),
+    ('is_read', 'is_read', to_bool, Default(False)),
+    ('read_at', 'read_at', to_datetime, NULL),
+    ('details', 'details', to_dict, SKIP),
+    ('count', 'count', to_int, Default(1)),
+])
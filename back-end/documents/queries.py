@@ -0,0 +1,387 @@
+"""Mongo reads and writes shared by the sync views and their async counterparts.
+
+The builders below describe a query or an update; fetch / fetch_one / execute
+run it with pymongo, afetch / afetch_one / aexecute with motor, so the WSGI and
+ASGI paths always send the same thing to the server.
+"""
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import NamedTuple
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from django.conf import settings
+from pymongo import ReturnDocument
+
+from .projectors import COMMENT, FILE_LIST, NOTIFICATION, read_codec_options
+from .utils.mongodb import get_async_collection, get_collection
+
+READ_ACCESS = ('view', 'edit', 'admin')
+WRITE_ACCESS = ('edit', 'admin')
+SEARCH_LIMIT = 100
+EPOCH = datetime(1970, 1, 1)  # Mongo datetimes are naive UTC
+
+
+class Query(NamedTuple):
+    collection: str
+    filter: dict
+    sort: list = None
+    limit: int = 0
+    projector: object = None  # projectors.Projector, documents are returned raw without one
+    fields: dict = None  # projection of the raw documents, when there is no projector
+
+    @property
+    def projection(self):
+        return self.projector.projection if self.projector else self.fields
+
+    @property
+    def codec_options(self):
+        # Projected listings are decoded straight into response values
+        return read_codec_options() if self.projector else None
+
+
+class Update(NamedTuple):
+    collection: str
+    filter: dict
+    update: dict
+
+
+class FindAndUpdate(NamedTuple):
+    """An update returning the updated document, in the same round trip."""
+    collection: str
+    filter: dict
+    update: dict
+    fields: dict = None
+
+
+def _cursor(collection, query):
+    cursor = collection.find(query.filter, query.projection)
+    if query.sort:
+        cursor = cursor.sort(query.sort)
+    if query.limit:
+        cursor = cursor.limit(query.limit)
+    return cursor
+
+
+def _result(query, documents):
+    return query.projector.many(documents) if query.projector else documents
+
+
+def fetch(query):
+    collection = get_collection(query.collection, codec_options=query.codec_options)
+    return _result(query, list(_cursor(collection, query)))
+
+
+async def afetch(query):
+    collection = get_async_collection(query.collection, codec_options=query.codec_options)
+    return _result(query, await _cursor(collection, query).to_list(None))
+
+
+def fetch_one(query):
+    return get_collection(query.collection).find_one(query.filter, query.projection)
+
+
+async def afetch_one(query):
+    return await get_async_collection(query.collection).find_one(query.filter, query.projection)
+
+
+def execute(update):
+    return get_collection(update.collection).update_one(update.filter, update.update)
+
+
+async def aexecute(update):
+    return await get_async_collection(update.collection).update_one(update.filter, update.update)
+
+
+def find_and_update(query):
+    return get_collection(query.collection).find_one_and_update(
+        query.filter, query.update, query.fields, return_document=ReturnDocument.AFTER
+    )
+
+
+async def afind_and_update(query):
+    return await get_async_collection(query.collection).find_one_and_update(
+        query.filter, query.update, query.fields, return_document=ReturnDocument.AFTER
+    )
+
+
+def readable_by(user_id):
+    """Filter of the files can_read() lets user_id read."""
+    return {'$or': [
+        {'owner_id': user_id},
+        {'permissions': {'$elemMatch': {'user_id': user_id, 'access_level': {'$in': list(READ_ACCESS)}}}},
+    ]}
+
+
+def can_read(file, user_id):
+    """Owner, or a permission with at least view access."""
+    if file.get('owner_id') == user_id:
+        return True
+    return any(
+        perm.get('user_id') == user_id and perm.get('access_level') in READ_ACCESS
+        for perm in file.get('permissions', [])
+    )
+
+
+def can_write(file, user_id):
+    """Owner, or a permission with edit access."""
+    if file.get('owner_id') == user_id:
+        return True
+    return any(
+        perm.get('user_id') == user_id and perm.get('access_level') in WRITE_ACCESS
+        for perm in file.get('permissions', [])
+    )
+
+
+def file_list(user_id):
+    return Query(
+        'documents',
+        {'owner_id': user_id, 'is_trashed': False},
+        sort=[('uploaded_at', -1)],
+        projector=FILE_LIST,
+    )
+
+
+def search(user_id, text, file_type=None, field='all'):
+    """Files the user owns or was shared, matching `text` (case insensitive regex)."""
+    access_filter = {
+        '$or': [
+            {'owner_id': user_id},
+            {'permissions.user_id': user_id}
+        ],
+        'is_trashed': False
+    }
+    if file_type:
+        access_filter['type'] = file_type
+
+    if field == 'title':
+        search_filter = {'title': {'$regex': text, '$options': 'i'}}
+    elif field == 'author':
+        search_filter = {'author': {'$regex': text, '$options': 'i'}}
+    elif field == 'description':
+        search_filter = {'description': {'$regex': text, '$options': 'i'}}
+    elif field == 'tags':
+        search_filter = {'tags': {'$elemMatch': {'$regex': text, '$options': 'i'}}}
+    else:
+        search_filter = {
+            '$or': [
+                {'title': {'$regex': text, '$options': 'i'}},
+                {'author': {'$regex': text, '$options': 'i'}},
+                {'description': {'$regex': text, '$options': 'i'}},
+                {'tags': {'$elemMatch': {'$regex': text, '$options': 'i'}}},
+                {'original_filename': {'$regex': text, '$options': 'i'}}
+            ]
+        }
+
+    return Query(
+        'documents',
+        {'$and': [access_filter, search_filter]},
+        sort=[('updated_at', -1)],
+        limit=SEARCH_LIMIT,
+        projector=FILE_LIST,
+    )
+
+
+def notifications(user_id, unread_only=False, limit=50, before=None):
+    """A page of the user's feed, newest first.
+
+    `before` is the (created_at, _id) key of the last item of the previous
+    page (parse_page_cursor). Both is_read values are listed for the
+    full feed so it is also read in order from the (user_id, is_read,
+    created_at, _id) index.
+    """
+    query = {'user_id': user_id, 'is_read': False if unread_only else {'$in': [False, True]}}
+    if before:
+        created_at, notification_id = before
+        query['created_at'] = {'$lte': created_at}
+        query['$nor'] = [{'created_at': created_at, '_id': {'$gte': notification_id}}]
+    return Query(
+        'notifications',
+        query,
+        sort=[('created_at', -1), ('_id', -1)],
+        limit=limit,
+        projector=NOTIFICATION,
+    )
+
+
+def page_cursor(item):
+    """Cursor of the page after `item` (a projected item), None without created_at."""
+    if not item.get('created_at'):
+        return None
+    created_at = datetime.fromisoformat(item['created_at'])
+    if created_at.tzinfo is not None:
+        created_at = created_at.astimezone(timezone.utc).replace(tzinfo=None)
+    return f"{(created_at - EPOCH) // timedelta(milliseconds=1)}_{item['id']}"
+
+
+def parse_page_cursor(cursor, parse_id=ObjectId):
+    """(created_at, _id) of a cursor, ValueError when it is malformed."""
+    milliseconds, _, item_id = cursor.partition('_')
+    try:
+        return EPOCH + timedelta(milliseconds=int(milliseconds)), parse_id(item_id)
+    except InvalidId as e:
+        raise ValueError(str(e))
+
+
+def notifications_after(user_id, after_id, limit):
+    """Notifications newer than after_id, oldest first (resuming an event stream)."""
+    return Query(
+        'notifications',
+        {'user_id': user_id, '_id': {'$gt': after_id}},
+        sort=[('_id', 1)],
+        limit=limit,
+        projector=NOTIFICATION,
+    )
+
+
+def new_notifications(user_ids, since):
+    """Notifications of any of user_ids created or merged into after since, oldest first."""
+    return Query(
+        'notifications',
+        {'user_id': {'$in': list(user_ids)}, 'updated_at': {'$gt': since}},
+        sort=[('updated_at', 1)],
+        projector=NOTIFICATION,
+    )
+
+
+def comments(file_id, parent_id=None, limit=50, before=None):
+    """A page of a file's comments (the replies to parent_id), newest first, keyset like notifications."""
+    query = {'file_id': file_id, 'parent_id': parent_id}
+    if before:
+        created_at, comment_id = before
+        query['created_at'] = {'$lte': created_at}
+        query['$nor'] = [{'created_at': created_at, '_id': {'$gte': comment_id}}]
+    return Query(
+        'comments',
+        query,
+        sort=[('created_at', -1), ('_id', -1)],
+        limit=limit,
+        projector=COMMENT,
+    )
+
+
+def file_by_id(file_id):
+    return Query('documents', {'_id': file_id})
+
+
+def _activity(user_id, action):
+    return {
+        'id': str(uuid.uuid4()),
+        'user_id': user_id,
+        'action': action,
+        'timestamp': datetime.now()
+    }
+
+
+# Detail fields besides the embedded arrays, which are sliced
+DETAIL_FIELDS = (
+    'title', 'type', 'description', 'author', 'tags', 'file_path', 'original_filename', 'size',
+    'checksum', 'encoding', 'stored_size', 'delta_base', 'owner_id', 'folder', 'uploaded_at',
+    'updated_at', 'last_opened', 'is_favorite', 'is_trashed', 'trashed_at', 'comment_count',
+    'revision', 'version_seq',
+)
+
+
+def revision_filter(revision):
+    """Condition on the file's revision (optimistic concurrency), no condition for None.
+
+    Files from before revisions were counted have none, they are revision 0.
+    """
+    if revision is None:
+        return {}
+    return {'revision': revision} if revision else {'revision': {'$in': [0, None]}}
+
+
+def update_file(file_id, revision, update):
+    """Apply `update` to the file if it is still at `revision`, bumping it; returns the detail."""
+    return FindAndUpdate(
+        'documents',
+        {'_id': file_id, **revision_filter(revision)},
+        {**update, '$inc': {**update.get('$inc', {}), 'revision': 1}},
+        fields=detail_fields(),
+    )
+
+
+def init_version_seq(file):
+    """Start the version sequence of a file created before it existed at its highest version."""
+    last = max((v.get('version_number', 0) for v in file.get('versions', [])), default=0)
+    # Conditional: whoever runs first wins, the others set nothing
+    return Update('documents', {'_id': file['_id'], 'version_seq': {'$exists': False}}, {'$set': {'version_seq': last}})
+
+
+def allocate_version(file_id, revision=None):
+    """Reserve the next version number of a file (and bump its revision), atomically across nodes."""
+    return FindAndUpdate(
+        'documents',
+        {'_id': file_id, **revision_filter(revision)},
+        {'$inc': {'version_seq': 1, 'revision': 1}},
+        fields={'version_seq': 1, 'revision': 1},
+    )
+
+
+def _size(field):
+    return {'$size': {'$ifNull': [f'${field}', []]}}
+
+
+def file_detail(file_id, user_id):
+    """Open a file the user can read: records the view and returns the document, None otherwise.
+
+    Only the latest FILE_DETAIL_SLICE versions and activities and the first
+    grantees are returned, with the full counts (MongoDB 4.4+ projection).
+    """
+    return FindAndUpdate(
+        'documents',
+        {'_id': file_id, **readable_by(user_id)},
+        record_view(file_id, user_id).update,
+        fields=detail_fields(),
+    )
+
+
+def detail_fields():
+    latest = settings.FILE_DETAIL_SLICE
+    return {
+        **{field: 1 for field in DETAIL_FIELDS},
+        'versions': {'$slice': -latest},
+        'activities': {'$slice': -latest},
+        'permissions': {'$slice': latest},
+        'version_count': _size('versions'),
+        'activity_count': _size('activities'),
+        'permission_count': _size('permissions'),
+    }
+
+
+def embedded_page(file_id, field, offset=0, limit=None):
+    """Raw file with a page of an embedded array (newest items last) and its size in `count`.
+
+    Pass the document to newest_first() for the items, newest first.
+    """
+    fields = {'owner_id': 1, 'permissions': 1, 'count': _size(field)}
+    if limit:
+        # Counted from the end; trimmed by newest_first() when it runs past the start
+        fields[field] = {'$slice': [-(offset + limit), limit]}
+    else:
+        fields[field] = 1
+    return Query('documents', {'_id': file_id}, fields=fields)
+
+
+def newest_first(document, field, offset=0, limit=None):
+    items = document.get(field) or []
+    if limit:
+        items = items[:max(document.get('count', 0) - offset, 0)]
+    else:
+        items = items[:len(items) - offset] if offset else items
+    return items[::-1]
+
+
+def record_view(file_id, user_id):
+    """Opening a file: last_opened (recent files) and a 'view' activity."""
+    return Update('documents', {'_id': file_id}, {
+        '$set': {'last_opened': datetime.now()},
+        '$push': {'activities': _activity(user_id, 'view')}
+    })
+
+
+def record_download(file_id, user_id):
+    return Update('documents', {'_id': file_id}, {
+        '$push': {'activities': _activity(user_id, 'download')}
+    })
@@ -34,7 +34,10 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
 class CommentSerializer(serializers.Serializer):
     id = serializers.CharField(read_only=True)
     user_id = serializers.CharField()
+    user_name = serializers.CharField(read_only=True, required=False)
     text = serializers.CharField()
+    parent_id = serializers.CharField(allow_null=True, required=False)
+    reply_count = serializers.IntegerField(read_only=True, default=0)
     created_at = serializers.DateTimeField(read_only=True)
     updated_at = serializers.DateTimeField(read_only=True)
 
@@ -95,7 +98,7 @@ class FileSerializer(serializers.Serializer):
     
     permissions = FilePermissionSerializer(many=True, required=False)
     versions = FileVersionSerializer(many=True, read_only=True)
-    comments = CommentSerializer(many=True, read_only=True)
+    comment_count = serializers.IntegerField(read_only=True, default=0)
     activities = FileActivitySerializer(many=True, read_only=True)
     
     extension = serializers.CharField(read_only=True)
@@ -121,6 +124,7 @@ class NotificationSerializer(serializers.Serializer):
     is_read = serializers.BooleanField(default=False)
     read_at = serializers.DateTimeField(allow_null=True, required=False)
     details = serializers.DictField(required=False)
+    count = serializers.IntegerField(default=1)  # events merged into this notification
 
 class FileUploadSerializer(serializers.Serializer):
     file = serializers.FileField()
@@ -0,0 +1,20 @@
+import threading
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .base import StorageBackend, StoredObject
+
+_storage = None
+_lock = threading.Lock()
+
+
+def get_storage():
+    """The configured backend (DOCUMENT_STORAGE_BACKEND), one instance per process."""
+    global _storage
+    if _storage is None:
+        with _lock:
+            if _storage is None:
+                backend = import_string(settings.DOCUMENT_STORAGE_BACKEND)
+                _storage = backend(**getattr(settings, 'DOCUMENT_STORAGE_OPTIONS', {}))
+    return _storage
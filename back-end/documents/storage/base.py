@@ -0,0 +1,57 @@
+from collections import namedtuple
+
+# size in bytes, modified as a POSIX timestamp
+StoredObject = namedtuple('StoredObject', ['name', 'size', 'modified'])
+
+
+class StorageBackend:
+    """Where document blobs live. Names are the bare `file_path` values kept in Mongo."""
+
+    def save(self, name, chunks):
+        """Stream an iterable of bytes into `name`, returns the number of bytes written."""
+        raise NotImplementedError
+
+    def open(self, name):
+        """Readable binary file-like object, raises FileNotFoundError if the blob is missing."""
+        raise NotImplementedError
+
+    def open_range(self, name, start, end):
+        """Iterator over the bytes start..end (inclusive, like an HTTP Range)."""
+        raise NotImplementedError
+
+    def stat(self, name):
+        """StoredObject for the blob, None if it does not exist."""
+        raise NotImplementedError
+
+    def exists(self, name):
+        return self.stat(name) is not None
+
+    def delete(self, name):
+        """Remove the blob, returns the number of bytes freed (0 if it was missing)."""
+        raise NotImplementedError
+
+    def delete_many(self, names, sizes=None):
+        """Best effort bulk delete, blobs that fail are skipped (the GC will catch them).
+
+        sizes ({name: stored bytes}, from Mongo) saves backends that cannot
+        report what they freed a lookup per blob.
+        """
+        freed = 0
+        for name in names:
+            try:
+                freed += self.delete(name)
+            except OSError:
+                continue
+        return freed
+
+    def iter_objects(self):
+        """Every stored blob, used by the garbage collector."""
+        raise NotImplementedError
+
+    def quarantine(self, name):
+        """Set a blob aside instead of deleting it."""
+        raise NotImplementedError
+
+    def disk_usage(self):
+        """(total, used, free) bytes of the underlying volume, None when unbounded."""
+        return None
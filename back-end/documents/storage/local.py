@@ -0,0 +1,78 @@
+import os
+import shutil
+
+from django.conf import settings
+
+from ..utils import storage as layout
+from .base import StorageBackend, StoredObject
+
+READ_SIZE = 1024 * 1024
+
+
+class LocalStorage(StorageBackend):
+    """Blobs on the local filesystem under DOCUMENT_STORAGE_PATH (sharded or flat layout)."""
+
+    def save(self, name, chunks):
+        size = 0
+        with open(layout.path_for_write(name), 'wb+') as destination:
+            for chunk in chunks:
+                destination.write(chunk)
+                size += len(chunk)
+        return size
+
+    def open(self, name):
+        return layout.open_blob(name)
+
+    def open_range(self, name, start, end):
+        f = layout.open_blob(name)  # raise FileNotFoundError now, not once streaming
+        f.seek(start)
+        return self._iter_range(f, end - start + 1)
+
+    def _iter_range(self, f, remaining):
+        with f:
+            while remaining > 0:
+                chunk = f.read(min(READ_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+    def stat(self, name):
+        for path in layout.candidate_paths(name):
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            return StoredObject(os.path.basename(name), st.st_size, st.st_mtime)
+        return None
+
+    def delete(self, name):
+        return layout.remove_blob(name)
+
+    def iter_objects(self):
+        root = layout.storage_root()
+        stack = [root]
+        while stack:
+            directory = stack.pop()
+            try:
+                entries = os.scandir(directory)
+            except FileNotFoundError:
+                continue
+            with entries:
+                for entry in entries:
+                    if entry.name.startswith('.'):
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        st = entry.stat(follow_symlinks=False)
+                        yield StoredObject(entry.name, st.st_size, st.st_mtime)
+
+    def quarantine(self, name):
+        source = layout.resolve_path(name)
+        destination = os.path.join(settings.GC_QUARANTINE_PATH, os.path.relpath(source, layout.storage_root()))
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        shutil.move(source, destination)
+
+    def disk_usage(self):
+        return shutil.disk_usage(layout.storage_root())
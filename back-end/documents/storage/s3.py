@@ -0,0 +1,143 @@
+from django.core.exceptions import ImproperlyConfigured
+
+from .base import StorageBackend, StoredObject
+
+try:
+    import boto3
+    from botocore.config import Config
+    from botocore.exceptions import ClientError
+except ImportError:  # optional dependency, only needed with this backend
+    boto3 = None
+
+MIN_PART_SIZE = 5 * 1024 * 1024  # S3 rejects smaller multipart parts (except the last one)
+DELETE_BATCH = 1000  # DeleteObjects limit
+
+
+class S3Storage(StorageBackend):
+    """Blobs in an S3-compatible bucket (AWS, MinIO, Ceph RGW...).
+
+    Options (DOCUMENT_STORAGE_OPTIONS): bucket, prefix, endpoint_url, region_name,
+    access_key, secret_key, part_size, max_pool_connections.
+    """
+
+    def __init__(self, bucket, prefix='documents/', endpoint_url=None, region_name=None,
+                 access_key=None, secret_key=None, part_size=8 * 1024 * 1024,
+                 max_pool_connections=50):
+        if boto3 is None:
+            raise ImproperlyConfigured('S3Storage needs boto3: pip install boto3')
+        self.bucket = bucket
+        self.prefix = prefix
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        # One client per process: botocore keeps a pool of keep-alive connections
+        self.client = boto3.session.Session().client(
+            's3',
+            endpoint_url=endpoint_url,
+            region_name=region_name,
+            aws_access_key_id=access_key,
+            aws_secret_access_key=secret_key,
+            config=Config(max_pool_connections=max_pool_connections, retries={'mode': 'standard'}),
+        )
+
+    def _key(self, name):
+        return f'{self.prefix}{name}'
+
+    def save(self, name, chunks):
+        """Buffer up to part_size and send a multipart upload, a single PUT for small blobs."""
+        key = self._key(name)
+        buffer = bytearray()
+        parts = []
+        upload_id = None
+        size = 0
+        try:
+            for chunk in chunks:
+                buffer += chunk
+                size += len(chunk)
+                if len(buffer) >= self.part_size:
+                    if upload_id is None:
+                        upload_id = self.client.create_multipart_upload(Bucket=self.bucket, Key=key)['UploadId']
+                    parts.append(self._upload_part(key, upload_id, len(parts) + 1, bytes(buffer)))
+                    buffer.clear()
+
+            if upload_id is None:
+                self.client.put_object(Bucket=self.bucket, Key=key, Body=bytes(buffer))
+                return size
+
+            if buffer:
+                parts.append(self._upload_part(key, upload_id, len(parts) + 1, bytes(buffer)))
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket, Key=key, UploadId=upload_id, MultipartUpload={'Parts': parts}
+            )
+            return size
+        except Exception:
+            if upload_id is not None:
+                self.client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+            raise
+
+    def _upload_part(self, key, upload_id, number, body):
+        response = self.client.upload_part(
+            Bucket=self.bucket, Key=key, UploadId=upload_id, PartNumber=number, Body=body
+        )
+        return {'PartNumber': number, 'ETag': response['ETag']}
+
+    def _get(self, name, **kwargs):
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self._key(name), **kwargs)['Body']
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+                raise FileNotFoundError(name) from e
+            raise
+
+    def open(self, name):
+        return self._get(name)
+
+    def open_range(self, name, start, end):
+        return self._get(name, Range=f'bytes={start}-{end}').iter_chunks(1024 * 1024)
+
+    def stat(self, name):
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=self._key(name))
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+                return None
+            raise
+        return StoredObject(name, head['ContentLength'], head['LastModified'].timestamp())
+
+    def delete(self, name):
+        return self.delete_many([name])
+
+    def delete_many(self, names, sizes=None):
+        freed = 0
+        names = list(names)
+        for i in range(0, len(names), DELETE_BATCH):
+            batch = names[i:i + DELETE_BATCH]
+            if sizes is None:
+                # DeleteObjects does not report sizes: without the caller's, one HEAD per blob
+                batch_sizes = {name: stat.size for name in batch if (stat := self.stat(name))}
+                batch = list(batch_sizes)
+                if not batch:
+                    continue
+            else:
+                batch_sizes = sizes
+            response = self.client.delete_objects(
+                Bucket=self.bucket,
+                Delete={'Objects': [{'Key': self._key(name)} for name in batch], 'Quiet': True}
+            )
+            failed = {error['Key'] for error in response.get('Errors', [])}
+            freed += sum(batch_sizes.get(name) or 0 for name in batch if self._key(name) not in failed)
+        return freed
+
+    def iter_objects(self):
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for obj in page.get('Contents', []):
+                name = obj['Key'][len(self.prefix):]
+                if name and not name.startswith('.'):
+                    yield StoredObject(name, obj['Size'], obj['LastModified'].timestamp())
+
+    def quarantine(self, name):
+        self.client.copy_object(
+            Bucket=self.bucket,
+            Key=f'{self.prefix}.quarantine/{name}',
+            CopySource={'Bucket': self.bucket, 'Key': self._key(name)},
+        )
+        self.delete(name)
@@ -0,0 +1,923 @@
+import gzip
+import io
+import os
+import random
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+from unittest import mock
+
+import mongomock
+import zstandard
+from bson import ObjectId
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail.backends.locmem import EmailBackend
+from django.test import RequestFactory, TestCase, override_settings
+from moto import mock_aws
+from rest_framework.test import APIClient
+
+from documents import queries, storage
+from documents.storage import get_storage
+from documents.storage.local import LocalStorage
+from documents.storage.s3 import S3Storage
+from documents.utils import mongodb
+
+
+class MongoTestCase(TestCase):
+    """Runs against an in-memory Mongo (mongomock) and a temporary local document store."""
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        os.makedirs(f'{media}/documents')  # like settings.py
+        settings_override = override_settings(
+            MEDIA_ROOT=media,
+            DOCUMENT_STORAGE_BACKEND='documents.storage.local.LocalStorage',
+            DOCUMENT_STORAGE_OPTIONS={},
+            DOCUMENT_STORAGE_PATH=f'{media}/documents',
+            UPLOAD_STAGING_PATH=f'{media}/staging',
+            GC_QUARANTINE_PATH=f'{media}/quarantine',
+            STORAGE_DISK_HIGH_WATERMARK=1,
+            STORAGE_DISK_MIN_FREE=0,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        previous_client, previous_storage = mongodb._client, storage._storage
+        mongodb._client, storage._storage = mongomock.MongoClient(), None
+
+        def restore():
+            mongodb._client, storage._storage = previous_client, previous_storage
+        self.addCleanup(restore)
+        # The file views open their own client
+        views_db = mock.patch('documents.views.files.get_db', mongodb.get_db)
+        views_db.start()
+        self.addCleanup(views_db.stop)
+
+    @property
+    def db(self):
+        return mongodb.get_db()
+
+    def create_user(self, email='owner@example.com', cellphone='770000001'):
+        return get_user_model().objects.create_user(email, 'Test', 'User', cellphone, 'password')
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def upload(self, client, name='notes.txt', data=b'hello', headers=None):
+        return client.post('/api/v1/files/', {
+            'file': SimpleUploadedFile(name, data),
+            'title': name,
+        }, format='multipart', headers=headers)
+
+    def store(self, name, data):
+        get_storage().save(name, [data])
+        return name
+
+
+class TrashPurgeTests(MongoTestCase):
+
+    def trashed_file(self, owner_id, name, data=b'content', days_ago=60, **fields):
+        self.store(name, data)
+        document = {
+            '_id': ObjectId(),
+            'owner_id': owner_id,
+            'file_path': name,
+            'size': len(data),
+            'stored_size': len(data),
+            'versions': [{'id': name, 'file_path': name, 'size': len(data), 'stored_size': len(data)}],
+            'permissions': [],
+            'is_trashed': True,
+            'trashed_at': datetime.now() - timedelta(days=days_ago),
+            **fields,
+        }
+        self.db.documents.insert_one(document)
+        return document
+
+    def test_claim_skips_files_claimed_by_another_job(self):
+        from documents.utils.trash import claim_trash
+
+        self.trashed_file('u1', 'a.txt', purge_job=ObjectId())
+        self.trashed_file('u1', 'b.txt')
+
+        self.assertEqual(claim_trash(ObjectId(), {'owner_id': 'u1'}), 1)
+        self.assertEqual(claim_trash(ObjectId(), {'owner_id': 'u1'}), 0)
+
+    def test_retention_leaves_files_held_by_a_live_purge(self):
+        from documents.utils.trash import purge_expired_trash
+
+        other_job = ObjectId()
+        held = self.trashed_file('u1', 'held.txt', purge_job=other_job)
+        expired = self.trashed_file('u1', 'expired.txt')
+        recent = self.trashed_file('u1', 'recent.txt', days_ago=1)
+
+        totals = purge_expired_trash(ObjectId(), retention_days=30)
+
+        self.assertEqual(totals['deleted'], 1)
+        self.assertEqual(totals['bytes_reclaimed'], len(b'content'))
+        remaining = {doc['_id'] for doc in self.db.documents.find()}
+        self.assertEqual(remaining, {held['_id'], recent['_id']})
+        self.assertEqual(self.db.documents.find_one({'_id': held['_id']})['purge_job'], other_job)
+        self.assertTrue(get_storage().exists('held.txt'))
+        self.assertFalse(get_storage().exists(expired['file_path']))
+
+    def test_purge_claimed_frees_blobs_and_quota(self):
+        from documents.utils.quotas import adjust_usage, get_quota
+        from documents.utils.trash import claim_trash, purge_claimed
+
+        adjust_usage('u1', 14)
+        self.trashed_file('u1', 'a.txt')
+        self.trashed_file('u1', 'b.txt')
+        job_id = ObjectId()
+        claim_trash(job_id, {'owner_id': 'u1'})
+
+        result = purge_claimed(job_id)
+
+        self.assertEqual(result, {'deleted': 2, 'bytes_reclaimed': 14})
+        self.assertEqual(self.db.documents.count_documents({}), 0)
+        self.assertEqual(get_quota('u1')['used'], 0)
+        self.assertEqual(list(get_storage().iter_objects()), [])
+
+    def test_stalled_purge_is_resumed(self):
+        from documents.utils.jobs import create_job
+        from documents.utils.trash import claim_trash, resume_stalled_purges
+
+        job = create_job('empty_trash', 'u1')
+        self.trashed_file('u1', 'a.txt')
+        claim_trash(job['_id'], {'owner_id': 'u1'})
+        self.db.jobs.update_one(
+            {'_id': job['_id']},
+            {'$set': {'status': 'running', 'updated_at': datetime.now() - timedelta(hours=1)}}
+        )
+
+        self.assertEqual(resume_stalled_purges(), 1)
+        self.assertEqual(self.db.documents.count_documents({}), 0)
+        self.assertEqual(self.db.jobs.find_one({'_id': job['_id']})['status'], 'completed')
+
+    def test_killed_retention_purge_is_finished(self):
+        from documents.utils.jobs import create_job, fail_stale_jobs, run_job
+        from documents.utils.trash import purge_expired_trash, resume_stalled_purges
+
+        self.trashed_file('u1', 'a.txt')
+        self.trashed_file('u1', 'b.txt')
+        job = create_job('trash_retention', None)
+        # The worker dies between the claim and the purge
+        with mock.patch('documents.utils.trash.purge_claimed', side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                run_job(job['_id'], purge_expired_trash, 30)
+        self.assertEqual(self.db.documents.count_documents({'purge_job': job['_id']}), 2)
+        self.db.jobs.update_one({'_id': job['_id']}, {'$set': {'updated_at': datetime.now() - timedelta(hours=1)}})
+
+        self.assertEqual(fail_stale_jobs(), 0)
+        self.assertEqual(resume_stalled_purges(), 1)
+
+        self.assertEqual(self.db.documents.count_documents({}), 0)
+        self.assertEqual(list(get_storage().iter_objects()), [])
+        self.assertEqual(self.db.jobs.find_one({'_id': job['_id']})['status'], 'completed')
+
+    def test_stalled_purge_is_resumed_once(self):
+        from documents.utils.jobs import create_job
+        from documents.utils.trash import claim_trash, resume_stalled_purges
+
+        job = create_job('empty_trash', 'u1')
+        self.trashed_file('u1', 'a.txt')
+        claim_trash(job['_id'], {'owner_id': 'u1'})
+        self.db.jobs.update_one({'_id': job['_id']}, {'$set': {'updated_at': datetime.now() - timedelta(hours=1)}})
+        concurrent = []
+
+        def run_job(job_id, target):
+            # Another purger sweeping while this one runs the job
+            concurrent.append(resume_stalled_purges())
+
+        with mock.patch('documents.utils.trash.run_job', side_effect=run_job) as runs:
+            self.assertEqual(resume_stalled_purges(), 1)
+
+        self.assertEqual(runs.call_count, 1)
+        self.assertEqual(concurrent, [0])
+
+
+class StorageBackendTests:
+    """Contract shared by the storage backends, mixed into a MongoTestCase per backend."""
+
+    def make_storage(self):
+        raise NotImplementedError
+
+    def setUp(self):
+        super().setUp()
+        self.storage = self.make_storage()
+
+    def test_save_and_read_back(self):
+        self.assertEqual(self.storage.save('blob1', [b'hello ', b'world']), 11)
+
+        with self.storage.open('blob1') as f:
+            self.assertEqual(f.read(), b'hello world')
+        self.assertEqual(b''.join(self.storage.open_range('blob1', 6, 10)), b'world')
+        stat = self.storage.stat('blob1')
+        self.assertEqual((stat.name, stat.size), ('blob1', 11))
+
+    def test_missing_blob(self):
+        self.assertIsNone(self.storage.stat('missing'))
+        self.assertFalse(self.storage.exists('missing'))
+        with self.assertRaises(FileNotFoundError):
+            self.storage.open('missing')
+        with self.assertRaises(FileNotFoundError):
+            self.storage.open_range('missing', 0, 10)
+
+    def test_delete_many_reports_freed_bytes(self):
+        self.storage.save('blob1', [b'12345'])
+        self.storage.save('blob2', [b'123'])
+
+        self.assertEqual(self.storage.delete_many(['blob1', 'blob2', 'missing']), 8)
+        self.assertEqual(list(self.storage.iter_objects()), [])
+
+    def test_iter_objects(self):
+        self.storage.save('blob1', [b'12345'])
+        self.storage.save('blob2', [b'123'])
+
+        objects = {obj.name: obj.size for obj in self.storage.iter_objects()}
+        self.assertEqual(objects, {'blob1': 5, 'blob2': 3})
+
+    def test_quarantine_hides_the_blob(self):
+        self.storage.save('blob1', [b'12345'])
+
+        self.storage.quarantine('blob1')
+
+        self.assertFalse(self.storage.exists('blob1'))
+        self.assertEqual(list(self.storage.iter_objects()), [])
+
+
+class LocalStorageTests(StorageBackendTests, MongoTestCase):
+
+    def make_storage(self):
+        return LocalStorage()
+
+
+class S3StorageTests(StorageBackendTests, MongoTestCase):
+
+    def make_storage(self):
+        aws = mock_aws()
+        aws.start()
+        self.addCleanup(aws.stop)
+        storage = S3Storage('docs-bucket', region_name='us-east-1', access_key='test', secret_key='test')
+        storage.client.create_bucket(Bucket='docs-bucket')
+        return storage
+
+    def test_multipart_upload(self):
+        self.storage.part_size = 5 * 1024 * 1024
+        data = bytes(range(256)) * (6 * 1024 * 1024 // 256)
+
+        self.assertEqual(self.storage.save('big', [data[:4 << 20], data[4 << 20:]]), len(data))
+
+        self.assertEqual(self.storage.stat('big').size, len(data))
+        self.assertEqual(b''.join(self.storage.open_range('big', 5 << 20, (5 << 20) + 9)),
+                         data[5 << 20:(5 << 20) + 10])
+
+    def test_delete_many_with_sizes_skips_head_requests(self):
+        self.storage.save('blob1', [b'12345'])
+        self.storage.save('blob2', [b'123'])
+
+        with mock.patch.object(self.storage.client, 'head_object') as head:
+            freed = self.storage.delete_many(['blob1', 'blob2'], {'blob1': 5, 'blob2': 3})
+
+        head.assert_not_called()
+        self.assertEqual(freed, 8)
+        self.assertEqual(list(self.storage.iter_objects()), [])
+
+
+class BlobEncodingTests(MongoTestCase):
+
+    def setUp(self):
+        super().setUp()
+        rng = random.Random(0)
+        self.random_data = rng.randbytes(1024 * 1024)
+        words = [b'alpha', b'beta', b'gamma', b'delta', b'epsilon', b'zeta']
+        self.text = b' '.join(rng.choice(words) for _ in range(200000))
+
+    def read(self, name, encoding, start=0, end=None):
+        from documents.utils.compression import iter_content
+        return b''.join(iter_content(name, encoding, start, end))
+
+    def test_compressible_blob_is_stored_zstd(self):
+        from documents.utils.ingest import write_blob
+
+        blob = write_blob('text', [self.text[i:i + 10000] for i in range(0, len(self.text), 10000)])
+
+        self.assertEqual(blob['encoding'], 'zstd')
+        self.assertLess(blob['stored_size'], len(self.text) // 2)
+        self.assertEqual(self.read('text', 'zstd'), self.text)
+        self.assertEqual(self.read('text', 'zstd', 100000, 100099), self.text[100000:100100])
+
+    def test_download_content_encoding(self):
+        client = self.client_for(self.create_user())
+        file_id = self.upload(client, 'words.txt', self.text).data['id']
+        url = f'/api/v1/files/{file_id}/download/'
+
+        zstd = client.get(url, headers={'Accept-Encoding': 'zstd, gzip'})
+        gzipped = client.get(url, headers={'Accept-Encoding': 'gzip, deflate'})
+        identity = client.get(url)
+        ranged = client.get(url, headers={'Accept-Encoding': 'gzip', 'Range': 'bytes=10-19'})
+
+        self.assertEqual(zstd['Content-Encoding'], 'zstd')
+        self.assertEqual(zstandard.ZstdDecompressor().decompressobj().decompress(b''.join(zstd.streaming_content)),
+                         self.text)
+        self.assertEqual(gzipped['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(b''.join(gzipped.streaming_content)), self.text)
+        self.assertFalse(identity.has_header('Content-Encoding'))
+        self.assertEqual(b''.join(identity.streaming_content), self.text)
+        self.assertEqual(ranged.status_code, 206)
+        self.assertFalse(ranged.has_header('Content-Encoding'))
+        self.assertEqual(b''.join(ranged.streaming_content), self.text[10:20])
+
+    def test_incompressible_blob_is_stored_raw(self):
+        from documents.utils.ingest import write_blob
+
+        blob = write_blob('random', [self.random_data])
+
+        self.assertIsNone(blob['encoding'])
+        self.assertEqual(blob['stored_size'], len(self.random_data))
+        self.assertEqual(self.read('random', None, 10, 19), self.random_data[10:20])
+
+    def write_version(self, base_data, new_data, base_encoding=None):
+        from documents.utils.delta import write_delta
+        from documents.utils.ingest import write_blob
+
+        base = {'file_path': 'v1', **write_blob('v1', [base_data])}
+        blob = write_blob('v2', [new_data])
+        return write_delta('v2.delta', 'v2', blob['encoding'], base)
+
+    def test_delta_round_trip(self):
+        edited = self.random_data[:500000] + b'inserted bytes' + self.random_data[500000:]
+
+        stored_size, literal_size = self.write_version(self.random_data, edited)
+
+        self.assertLess(stored_size, len(edited) // 2)
+        self.assertLess(literal_size, len(edited) // 2)
+        self.assertEqual(self.read('v2.delta', 'delta'), edited)
+
+    def test_delta_ranged_reads(self):
+        edited = self.random_data[:500000] + b'inserted bytes' + self.random_data[500000:]
+        self.write_version(self.random_data, edited)
+
+        for start, end in [(0, 0), (499990, 500020), (700000, 800000), (len(edited) - 5, len(edited) - 1)]:
+            self.assertEqual(self.read('v2.delta', 'delta', start, end), edited[start:end + 1])
+        self.assertEqual(self.read('v2.delta', 'delta', 1000), edited[1000:])
+
+    def test_delta_against_compressed_base(self):
+        edited = self.text[:300000] + b' changed ' + self.text[300000:]
+
+        self.write_version(self.text, edited)
+
+        self.assertEqual(self.read('v2.delta', 'delta'), edited)
+        self.assertEqual(self.read('v2.delta', 'delta', 299990, 300020), edited[299990:300021])
+
+    def test_corrupt_delta_raises_delta_error(self):
+        from documents.utils.compression import DeltaError
+        from documents.utils.delta import MAGIC
+
+        edited = self.random_data[:500000] + b'inserted bytes' + self.random_data[500000:]
+        self.write_version(self.random_data, edited)
+        with get_storage().open('v2.delta') as f:
+            blob = f.read()
+
+        corruptions = {
+            'bad magic': b'XXXXXX' + blob[len(MAGIC):],
+            'truncated header': blob[:len(MAGIC) + 10],
+            'truncated literals': blob[:-100],
+            'bad header': MAGIC + (2).to_bytes(4, 'big') + b'{]',
+            'missing keys': MAGIC + (2).to_bytes(4, 'big') + b'{}',
+        }
+        for case, data in corruptions.items():
+            with self.subTest(case):
+                get_storage().save('corrupt', [data])
+                with self.assertRaises(DeltaError):
+                    self.read('corrupt', 'delta')
+
+
+class QuotaTests(MongoTestCase):
+
+    def test_reserve_then_settle_with_stored_size(self):
+        from documents.utils.quotas import Reservation, get_quota, set_limit
+
+        set_limit('u1', 1000)
+        reservation = Reservation('u1', 600).acquire()
+        quota = get_quota('u1')
+        self.assertEqual((quota['reserved'], quota['available']), (600, 400))
+
+        reservation.settle(250)
+        reservation.release()  # no-op once settled
+
+        quota = get_quota('u1')
+        self.assertEqual((quota['used'], quota['reserved'], quota['available']), (250, 0, 750))
+        self.assertEqual(quota['reservations'], [])
+
+    def test_release_gives_the_reservation_back(self):
+        from documents.utils.quotas import Reservation, get_quota, set_limit
+
+        set_limit('u1', 1000)
+        with Reservation('u1', 600):
+            pass
+
+        quota = get_quota('u1')
+        self.assertEqual((quota['used'], quota['reserved'], quota['available']), (0, 0, 1000))
+
+    def test_concurrent_reservations_cannot_overcommit(self):
+        from documents.utils.quotas import QuotaExceeded, Reservation, get_quota, set_limit
+
+        set_limit('u1', 1000)
+        Reservation('u1', 600).acquire()
+        with self.assertRaises(QuotaExceeded):
+            Reservation('u1', 600).acquire()
+        Reservation('u1', 400).acquire()
+
+        self.assertEqual(get_quota('u1')['available'], 0)
+
+    def test_lowering_the_limit_accounts_for_reservations(self):
+        from documents.utils.quotas import QuotaExceeded, Reservation, adjust_usage, reserve, set_limit
+
+        adjust_usage('u1', 300)
+        Reservation('u1', 200).acquire()
+
+        self.assertEqual(set_limit('u1', 600)['available'], 100)
+        with self.assertRaises(QuotaExceeded):
+            Reservation('u1', 101).acquire()
+        self.assertIsNone(set_limit('u1', None)['limit'])
+        reserve('u1', 10 ** 12)
+
+    def test_settle_after_the_reservation_expired(self):
+        from documents.utils.quotas import Reservation, get_quota, reconcile, set_limit
+
+        set_limit('u1', 1000)
+        reservation = Reservation('u1', 600).acquire()
+        self.db.quotas.update_one({'_id': 'u1'}, {'$set': {'reservations.0.created_at': datetime(2000, 1, 1)}})
+        reconcile('u1')
+        self.assertEqual(get_quota('u1')['reserved'], 0)
+
+        reservation.settle(250)
+
+        quota = get_quota('u1')
+        self.assertEqual((quota['used'], quota['reserved'], quota['available']), (250, 0, 750))
+
+    def test_upload_over_quota_is_rejected_before_writing(self):
+        from documents.utils.quotas import get_quota, set_limit
+
+        user = self.create_user()
+        set_limit(str(user.id), 100)
+
+        response = self.client_for(user).post('/api/v1/files/', {
+            'file': SimpleUploadedFile('big.bin', b'x' * 1000),
+            'title': 'big',
+        }, format='multipart')
+
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(self.db.documents.count_documents({}), 0)
+        self.assertEqual(list(get_storage().iter_objects()), [])
+        self.assertEqual(get_quota(str(user.id))['reserved'], 0)
+
+    def test_upload_settles_the_stored_size(self):
+        from documents.utils.quotas import get_quota, set_limit
+
+        user = self.create_user()
+        set_limit(str(user.id), 100000)
+
+        response = self.client_for(user).post('/api/v1/files/', {
+            'file': SimpleUploadedFile('notes.bin', bytes(range(256)) * 4),
+            'title': 'notes',
+        }, format='multipart')
+
+        self.assertEqual(response.status_code, 201, response.data)
+        quota = get_quota(str(user.id))
+        self.assertEqual((quota['used'], quota['reserved']), (1024, 0))
+        self.assertEqual(quota['available'], 100000 - 1024)
+
+
+class FailingEmailBackend(EmailBackend):
+    """locmem backend whose server rejects every message."""
+
+    def send_messages(self, messages):
+        raise ConnectionError('server unavailable')
+
+
+@override_settings(EMAIL_OUTBOX_RATE=0, EMAIL_OUTBOX_MAX_ATTEMPTS=3, EMAIL_OUTBOX_RETRY_DELAY=60,
+                   EMAIL_DIGEST_DELAY=600)
+class EmailOutboxTests(MongoTestCase):
+
+    def make_due(self, query=None):
+        self.db.email_outbox.update_many(
+            query or {}, {'$set': {'next_attempt_at': datetime.now() - timedelta(seconds=1)}}
+        )
+
+    def test_plain_messages_are_sent_one_by_one(self):
+        from documents.utils.outbox import enqueue_email, send_pending
+
+        enqueue_email('First', 'one', ['a@example.com'])
+        enqueue_email('Second', 'two', ['b@example.com'])
+
+        self.assertEqual(send_pending(), {'sent': 2, 'failed': 0})
+        self.assertEqual([message.subject for message in mail.outbox], ['First', 'Second'])
+        self.assertEqual(self.db.email_outbox.count_documents({'status': 'sent'}), 2)
+        self.assertEqual(send_pending(), {'sent': 0, 'failed': 0})
+
+    def test_batched_messages_wait_and_go_out_as_one_email(self):
+        from documents.utils.outbox import enqueue_email, send_pending
+
+        enqueue_email('Notification', 'shared a.txt', ['a@example.com'], batch_key='notifications:1')
+        enqueue_email('Notification', 'commented b.txt', ['a@example.com'], batch_key='notifications:1')
+        enqueue_email('Notification', 'shared c.txt', ['b@example.com'], batch_key='notifications:2')
+
+        self.assertEqual(send_pending(), {'sent': 0, 'failed': 0})
+
+        self.make_due({'body': {'$ne': 'commented b.txt'}})
+        self.assertEqual(send_pending(), {'sent': 2, 'failed': 0})
+
+        digests = {message.to[0]: message for message in mail.outbox}
+        self.assertEqual(digests['a@example.com'].subject, '2 nouvelles notifications')
+        self.assertIn('shared a.txt', digests['a@example.com'].body)
+        self.assertIn('commented b.txt', digests['a@example.com'].body)
+        self.assertEqual(digests['b@example.com'].body, 'shared c.txt')
+
+    def test_batch_size_limits_each_run(self):
+        from documents.utils.outbox import enqueue_email, send_pending
+
+        for i in range(5):
+            enqueue_email(f'Message {i}', 'body', ['a@example.com'])
+
+        self.assertEqual(send_pending(batch_size=2), {'sent': 2, 'failed': 0})
+        self.assertEqual(send_pending(batch_size=2), {'sent': 2, 'failed': 0})
+        self.assertEqual(send_pending(batch_size=2), {'sent': 1, 'failed': 0})
+        self.assertEqual(len(mail.outbox), 5)
+
+    def test_failures_back_off_then_give_up(self):
+        from documents.utils.outbox import enqueue_email, send_pending
+
+        message = enqueue_email('Hello', 'body', ['a@example.com'])
+        delays = []
+        for _ in range(2):
+            before = datetime.now()
+            self.assertEqual(send_pending(connection=FailingEmailBackend()), {'sent': 0, 'failed': 1})
+            stored = self.db.email_outbox.find_one({'_id': message['_id']})
+            self.assertEqual(stored['status'], 'pending')
+            self.assertIn('server unavailable', stored['last_error'])
+            delays.append(round((stored['next_attempt_at'] - before).total_seconds()))
+            # Still backing off: not picked up again
+            self.assertEqual(send_pending(), {'sent': 0, 'failed': 0})
+            self.make_due()
+        self.assertEqual(delays, [60, 120])
+
+        self.assertEqual(send_pending(connection=FailingEmailBackend()), {'sent': 0, 'failed': 1})
+        stored = self.db.email_outbox.find_one({'_id': message['_id']})
+        self.assertEqual((stored['status'], stored['attempts']), ('failed', 3))
+        self.make_due()
+        self.assertEqual(send_pending(), {'sent': 0, 'failed': 0})
+        self.assertEqual(mail.outbox, [])
+
+    def test_digest_claim_leaves_messages_in_backoff(self):
+        from documents.utils.outbox import enqueue_email, send_pending
+
+        enqueue_email('Notification', 'first', ['a@example.com'], batch_key='notifications:1')
+        self.make_due()
+        send_pending(connection=FailingEmailBackend())
+        # A newer message of the same key becomes due while the failed one backs off
+        enqueue_email('Notification', 'second', ['a@example.com'], batch_key='notifications:1')
+        self.make_due({'body': 'second'})
+
+        self.assertEqual(send_pending(), {'sent': 1, 'failed': 0})
+        self.assertEqual(mail.outbox[0].body, 'second')
+        self.assertEqual(self.db.email_outbox.find_one({'body': 'first'})['status'], 'pending')
+
+    def test_unreachable_server_requeues_everything_claimed(self):
+        from documents.utils.outbox import enqueue_email, send_pending
+
+        class UnreachableBackend(EmailBackend):
+            def open(self):
+                raise ConnectionError('connection refused')
+
+        enqueue_email('First', 'one', ['a@example.com'])
+        enqueue_email('Second', 'two', ['b@example.com'])
+
+        self.assertEqual(send_pending(connection=UnreachableBackend()), {'sent': 0, 'failed': 2})
+        self.assertEqual(self.db.email_outbox.count_documents({'status': 'pending', 'attempts': 1, 'claim': None}), 2)
+
+
+def counts_free_detail_fields(detail_fields=queries.detail_fields):
+    # mongomock has no aggregation expressions ($size) in projections
+    return {field: value for field, value in detail_fields().items() if not field.endswith('_count')}
+
+
+@override_settings(VERSION_DELTA_ENABLED=False)
+class RevisionPreconditionTests(MongoTestCase):
+
+    def setUp(self):
+        super().setUp()
+        detail_fields = mock.patch('documents.queries.detail_fields', counts_free_detail_fields)
+        detail_fields.start()
+        self.addCleanup(detail_fields.stop)
+        self.client = self.client_for(self.create_user())
+        response = self.upload(self.client)
+        self.assertEqual(response.status_code, 201, response.data)
+        self.file_id = response.data['id']
+        self.url = f'/api/v1/files/{self.file_id}/'
+
+    def test_update_with_current_revision(self):
+        response = self.client.put(self.url, {'title': 'renamed'}, format='json', headers={'If-Match': '"1"'})
+
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response['ETag'], '"2"')
+        self.assertEqual(self.db.documents.find_one({'_id': ObjectId(self.file_id)})['revision'], 2)
+
+    def test_stale_revision_is_rejected(self):
+        self.client.put(self.url, {'title': 'first'}, format='json', headers={'If-Match': '"1"'})
+
+        response = self.client.put(self.url, {'title': 'second'}, format='json', headers={'If-Match': '"1"'})
+
+        self.assertEqual(response.status_code, 412)
+        self.assertEqual(response.data['revision'], 2)
+        self.assertEqual(response['ETag'], '"2"')
+        self.assertEqual(self.db.documents.find_one({'_id': ObjectId(self.file_id)})['title'], 'first')
+
+    def test_revision_in_the_body(self):
+        self.client.put(self.url, {'title': 'first'}, format='json')
+
+        response = self.client.put(self.url, {'title': 'second', 'revision': 1}, format='json')
+
+        self.assertEqual(response.status_code, 412)
+
+    def test_without_precondition_last_writer_wins(self):
+        self.client.put(self.url, {'title': 'first'}, format='json')
+        response = self.client.put(self.url, {'title': 'second'}, format='json', headers={'If-Match': '*'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.db.documents.find_one({'_id': ObjectId(self.file_id)})['title'], 'second')
+
+    def test_malformed_if_match(self):
+        response = self.client.put(self.url, {'title': 'x'}, format='json', headers={'If-Match': '"abc"'})
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_new_version_with_stale_revision_is_rejected(self):
+        self.client.put(self.url, {'title': 'renamed'}, format='json')
+        blobs_before = {obj.name for obj in get_storage().iter_objects()}
+
+        response = self.client.post(f'{self.url}versions/', {'file': SimpleUploadedFile('notes.txt', b'v2')},
+                                    format='multipart', headers={'If-Match': '"1"'})
+
+        self.assertEqual(response.status_code, 412)
+        self.assertEqual({obj.name for obj in get_storage().iter_objects()}, blobs_before)
+        self.assertEqual(len(self.db.documents.find_one({'_id': ObjectId(self.file_id)})['versions']), 1)
+
+    def test_new_version_bumps_the_revision(self):
+        response = self.client.post(f'{self.url}versions/', {'file': SimpleUploadedFile('notes.txt', b'v2')},
+                                    format='multipart', headers={'If-Match': '"1"'})
+
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response['ETag'], '"2"')
+        self.assertEqual(response.data['version_number'], 2)
+
+
+class IdempotencyKeyTests(MongoTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user()
+        self.client = self.client_for(self.user)
+
+    def test_retry_replays_the_first_response(self):
+        first = self.upload(self.client, headers={'Idempotency-Key': 'upload-1'})
+        retry = self.upload(self.client, headers={'Idempotency-Key': 'upload-1'})
+
+        self.assertEqual(first.status_code, 201, first.data)
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertFalse(first.has_header('Idempotent-Replayed'))
+        self.assertEqual(retry.data['id'], first.data['id'])
+        self.assertEqual(self.db.documents.count_documents({}), 1)
+
+    def test_without_a_key_every_request_runs(self):
+        self.upload(self.client)
+        self.upload(self.client)
+
+        self.assertEqual(self.db.documents.count_documents({}), 2)
+
+    def test_keys_are_scoped_to_the_user(self):
+        other = self.client_for(self.create_user('other@example.com', '770000002'))
+
+        self.upload(self.client, headers={'Idempotency-Key': 'same'})
+        response = self.upload(other, headers={'Idempotency-Key': 'same'})
+
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(response.has_header('Idempotent-Replayed'))
+        self.assertEqual(self.db.documents.count_documents({}), 2)
+
+    def test_key_reused_for_another_request(self):
+        self.upload(self.client, 'a.txt', headers={'Idempotency-Key': 'upload-1'})
+
+        response = self.upload(self.client, 'b.txt', headers={'Idempotency-Key': 'upload-1'})
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(self.db.documents.count_documents({}), 1)
+
+    def test_duplicate_while_the_first_request_runs(self):
+        self.db.idempotency_keys.insert_one({
+            '_id': f'{self.user.id}:upload-1', 'status': 'processing', 'lock': 'other-worker',
+            'locked_until': datetime.now() + timedelta(minutes=5),
+        })
+
+        response = self.upload(self.client, headers={'Idempotency-Key': 'upload-1'})
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(self.db.documents.count_documents({}), 0)
+
+    def test_lock_of_a_dead_worker_is_taken_over(self):
+        self.db.idempotency_keys.insert_one({
+            '_id': f'{self.user.id}:upload-1', 'status': 'processing', 'lock': 'dead-worker',
+            'locked_until': datetime.now() - timedelta(seconds=1),
+        })
+
+        response = self.upload(self.client, headers={'Idempotency-Key': 'upload-1'})
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.db.idempotency_keys.find_one()['status'], 'completed')
+
+    def test_errors_are_not_replayed(self):
+        from documents.utils.quotas import set_limit
+
+        set_limit(str(self.user.id), 10)
+        self.assertEqual(self.upload(self.client, headers={'Idempotency-Key': 'upload-1'}).status_code, 413)
+        set_limit(str(self.user.id), None)
+
+        response = self.upload(self.client, headers={'Idempotency-Key': 'upload-1'})
+
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(response.has_header('Idempotent-Replayed'))
+
+    def test_comment_retry_adds_one_comment(self):
+        file_id = self.upload(self.client).data['id']
+        url = f'/api/v1/files/{file_id}/comments/'
+
+        first = self.client.post(url, {'text': 'Looks good'}, format='json', headers={'Idempotency-Key': 'c1'})
+        retry = self.client.post(url, {'text': 'Looks good'}, format='json', headers={'Idempotency-Key': 'c1'})
+
+        self.assertEqual(first.status_code, 200, first.data)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(self.db.comments.count_documents({}), 1)
+
+    def test_key_too_long(self):
+        response = self.upload(self.client, headers={'Idempotency-Key': 'k' * 256})
+
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(VERSION_DELTA_ENABLED=False, VERSION_DELTA_MIN_SIZE=0)
+class ChunkSyncTests(MongoTestCase):
+
+    def setUp(self):
+        super().setUp()
+        detail_fields = mock.patch('documents.queries.detail_fields', counts_free_detail_fields)
+        detail_fields.start()
+        self.addCleanup(detail_fields.stop)
+        self.client = self.client_for(self.create_user())
+        rng = random.Random(0)
+        self.v1 = rng.randbytes(512 * 1024)
+        self.v2 = self.v1[:200000] + b'second version' + self.v1[200000:]
+        self.v3 = self.v2[:400000] + b'third version' + self.v2[400000:]
+        response = self.upload(self.client, 'data.bin', self.v1)
+        self.file_id = response.data['id']
+        self.url = f'/api/v1/files/{self.file_id}/versions/'
+        response = self.client.post(self.url, {'file': SimpleUploadedFile('data.bin', self.v2)}, format='multipart')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.v2_id = response.data['id']
+
+    def sync(self, data):
+        """Start a sync session for `data`, returns (session url, {hash: chunk} the server lacks)."""
+        from documents.utils.chunking import chunk_digest, iter_chunks
+
+        chunks = [(chunk_digest(chunk).hex(), chunk) for _, chunk in iter_chunks(io.BytesIO(data))]
+        response = self.client.post(f'{self.url}sync/', {
+            'chunks': [{'hash': digest, 'size': len(chunk)} for digest, chunk in chunks],
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        missing = {digest: chunk for digest, chunk in chunks if digest in response.data['missing']}
+        self.assertLess(len(missing), len(chunks))
+        return f"{self.url}sync/{response.data['session_id']}/", missing
+
+    def current_content(self):
+        from documents.utils.compression import iter_content
+
+        file = self.db.documents.find_one({'_id': ObjectId(self.file_id)})
+        return b''.join(iter_content(file['file_path'], file.get('encoding')))
+
+    def test_commit_after_the_base_was_delta_encoded(self):
+        from documents.utils.delta import encode_version
+
+        session_url, missing = self.sync(self.v3)
+        old_blob = self.db.documents.find_one({'_id': ObjectId(self.file_id)})['file_path']
+        # The background encoding of v2 finishes while the client uploads its chunks
+        self.assertEqual(encode_version(None, ObjectId(self.file_id), self.v2_id)['status'], 'delta')
+        self.assertFalse(get_storage().exists(old_blob))
+
+        self.client.put(session_url, {
+            digest: SimpleUploadedFile(digest, chunk) for digest, chunk in missing.items()
+        }, format='multipart')
+        response = self.client.post(session_url, format='json')
+
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data['version_number'], 3)
+        self.assertEqual(self.current_content(), self.v3)
+
+    def test_base_delta_encoded_during_the_assembly(self):
+        from documents.utils import chunk_sync
+        from documents.utils.delta import encode_version
+
+        session_url, missing = self.sync(self.v3)
+        self.client.put(session_url, {
+            digest: SimpleUploadedFile(digest, chunk) for digest, chunk in missing.items()
+        }, format='multipart')
+        write_blob = chunk_sync.write_blob
+        # The full copy disappears under the first read, the second one reads the delta
+        calls = []
+
+        def flaky_write_blob(stored_name, chunks):
+            calls.append(stored_name)
+            if len(calls) == 1:
+                encode_version(None, ObjectId(self.file_id), self.v2_id)
+            return write_blob(stored_name, chunks)
+
+        with mock.patch('documents.utils.chunk_sync.write_blob', flaky_write_blob):
+            response = self.client.post(session_url, format='json')
+
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(len(calls), 2)
+        self.assertFalse(get_storage().exists(calls[0]))
+        self.assertEqual(self.current_content(), self.v3)
+
+    def test_commit_after_the_base_was_pruned(self):
+        session_url, missing = self.sync(self.v3)
+        self.client.put(session_url, {
+            digest: SimpleUploadedFile(digest, chunk) for digest, chunk in missing.items()
+        }, format='multipart')
+        self.db.documents.update_one({'_id': ObjectId(self.file_id)}, {'$pull': {'versions': {'id': self.v2_id}}})
+
+        response = self.client.post(session_url, format='json')
+
+        self.assertEqual(response.status_code, 409)
+
+
+class AsyncViewErrorTests(MongoTestCase):
+
+    def setUp(self):
+        super().setUp()
+        from documents.views.async_views import AsyncAPIView
+
+        user = self.create_user()
+        authenticate = mock.patch.object(AsyncAPIView, 'authenticate', mock.AsyncMock(return_value=(user, None)))
+        authenticate.start()
+        self.addCleanup(authenticate.stop)
+
+    async def test_malformed_file_id_is_not_found(self):
+        from documents.views.async_views import AsyncFileDetailView, AsyncFileDownloadView
+
+        for view in (AsyncFileDetailView, AsyncFileDownloadView):
+            with self.subTest(view.__name__):
+                response = await view.as_view()(RequestFactory().get('/'), file_id='not-an-id')
+                self.assertEqual(response.status_code, 404)
+
+    async def test_unexpected_errors_are_logged_not_returned(self):
+        from documents.views.async_views import AsyncFileDetailView
+
+        with mock.patch('documents.queries.afind_and_update', side_effect=RuntimeError('mongodb://secret@db')), \
+                self.assertLogs('documents.views.async_views', 'ERROR') as logs:
+            response = await AsyncFileDetailView.as_view()(RequestFactory().get('/'), file_id=str(ObjectId()))
+
+        self.assertEqual(response.status_code, 500)
+        self.assertNotIn(b'secret', response.content)
+        self.assertIn('mongodb://secret@db', logs.output[0])
+
+
+@override_settings(NOTIFICATION_PAGE_SIZE=2, NOTIFICATION_PAGE_MAX=3)
+class NotificationFeedTests(MongoTestCase):
+
+    def params(self, **query):
+        from documents.views.notifications import feed_params
+        return feed_params(RequestFactory().get('/', query))
+
+    def test_limit_is_clamped(self):
+        for limit, expected in [(None, 2), ('0', 1), ('-5', 1), ('3', 3), ('1000', 3)]:
+            with self.subTest(limit=limit):
+                query = {'limit': limit} if limit is not None else {}
+                self.assertEqual(self.params(**query)[1], expected)
+
+    def test_invalid_limit_and_cursor(self):
+        client = self.client_for(self.create_user())
+
+        response = client.get('/api/v1/notifications/', {'limit': 'ten'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['detail'], 'limit must be a number.')
+
+        response = client.get('/api/v1/notifications/', {'before': '123_not-an-id'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['detail'], 'Invalid cursor.')
@@ -28,13 +28,20 @@ class FileVersionDict(TypedDict):
     file_path: str
     version_number: int
     size: int
+    checksum: Optional[str]
+    encoding: Optional[str]
+    stored_size: Optional[int]
+    delta_base: Optional[str]
     created_at: datetime
     created_by: str
 
 class CommentDict(TypedDict):
     id: str
+    file_id: str
+    parent_id: Optional[str]
     user_id: str
     text: str
+    reply_count: int
     created_at: datetime
     updated_at: datetime
 
@@ -55,6 +62,10 @@ class FileDict(TypedDict):
     file_path: str
     original_filename: str
     size: int
+    checksum: Optional[str]
+    encoding: Optional[str]
+    stored_size: Optional[int]
+    delta_base: Optional[str]
     owner_id: str
     folder: Optional[str]
     uploaded_at: datetime
@@ -65,7 +76,9 @@ class FileDict(TypedDict):
     trashed_at: Optional[datetime]
     permissions: List[FilePermissionDict]
     versions: List[FileVersionDict]
-    comments: List[CommentDict]
+    comment_count: int
+    revision: int
+    version_seq: int
     activities: List[FileActivityDict]
 
 # Notification types
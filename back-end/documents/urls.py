@@ -11,6 +11,7 @@ urlpatterns = [
     
     # File management endpoints
     path('files/', views.FileListView.as_view(), name='file-list'),
+    path('files/batch/', views.FileBatchUploadView.as_view(), name='file-batch-upload'),
     path('files/<str:file_id>/', views.FileDetailView.as_view(), name='file-detail'),
     path('files/<str:file_id>/download/', views.FileDownloadView.as_view(), name='file-download'),
     path('files/<str:file_id>/preview/', views.FilePreviewView.as_view(), name='file-preview'),
@@ -37,8 +38,15 @@ urlpatterns = [
     
     # Versions
     path('files/<str:file_id>/versions/', views.FileVersionsView.as_view(), name='file-versions'),
+    path('files/<str:file_id>/versions/sync/', views.FileVersionSyncView.as_view(), name='file-version-sync'),
+    path('files/<str:file_id>/versions/sync/<str:session_id>/', views.FileVersionSyncSessionView.as_view(),
+         name='file-version-sync-session'),
     path('files/<str:file_id>/versions/<str:version_id>/', views.FileVersionDetailView.as_view(), name='file-version-detail'),
     
+    # Version retention
+    path('retention-policies/', views.RetentionPolicyListView.as_view(), name='retention-policies'),
+    path('retention-policies/<str:policy_id>/', views.RetentionPolicyDetailView.as_view(), name='retention-policy-detail'),
+    
     # Activity
     path('files/<str:file_id>/activity/', views.FileActivityView.as_view(), name='file-activity'),
     path('activity/', views.UserActivityView.as_view(), name='user-activity'),
@@ -46,8 +54,20 @@ urlpatterns = [
     # Recent files
     path('recent/', views.RecentFilesView.as_view(), name='recent-files'),
     
+    # Background jobs
+    path('jobs/<str:job_id>/', views.JobDetailView.as_view(), name='job-detail'),
+    
+    # Quotas
+    path('quota/', views.QuotaView.as_view(), name='quota'),
+    path('admin/quotas/<str:user_id>/', views.AdminQuotaView.as_view(), name='admin-quota'),
+    
+    # Storage integrity (admin)
+    path('admin/integrity/', views.IntegrityReportView.as_view(), name='integrity-reports'),
+    
     # Notifications
     path('notifications/', views.NotificationsView.as_view(), name='notifications'),
+    path('notifications/unread-count/', views.UnreadNotificationCountView.as_view(), name='notifications-unread-count'),
+    path('notifications/preferences/', views.NotificationPreferencesView.as_view(), name='notification-preferences'),
     path('notifications/mark-read/', views.MarkNotificationsReadView.as_view(), name='mark-notifications-read'),
     
     # Folders
@@ -58,6 +78,9 @@ urlpatterns = [
     # Search
     path('search/', views.SearchView.as_view(), name='search'),
     
+    # Delta sync
+    path('changes/', views.ChangesView.as_view(), name='changes'),
+    
     # Tri
     path('files/sort/date/', views.files.FileSortByDateView.as_view(), name='files-sort-date'),
     path('files/sort/type/', views.files.FileSortByTypeView.as_view(), name='files-sort-type'),
@@ -0,0 +1,26 @@
+"""documents.urls with the async views in place of their sync versions (ASGI)."""
+from django.urls import path
+
+from . import urls
+from .views import async_views
+
+ASYNC_VIEWS = {
+    'file-list': async_views.AsyncFileListView,
+    'file-detail': async_views.AsyncFileDetailView,
+    'file-download': async_views.AsyncFileDownloadView,
+    'notifications': async_views.AsyncNotificationsView,
+    'notifications-unread-count': async_views.AsyncUnreadNotificationCountView,
+    'search': async_views.AsyncSearchView,
+}
+
+# Same routes in the same order (files/batch/ must still win over files/<file_id>/)
+urlpatterns = [
+    path(str(pattern.pattern), ASYNC_VIEWS[pattern.name].as_view(), name=pattern.name)
+    if pattern.name in ASYNC_VIEWS else pattern
+    for pattern in urls.urlpatterns
+]
+
+# Push only works under ASGI, WSGI clients keep polling notifications/
+urlpatterns.append(
+    path('notifications/stream/', async_views.AsyncNotificationStreamView.as_view(), name='notifications-stream')
+)
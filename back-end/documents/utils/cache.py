@@ -0,0 +1,132 @@
+import functools
+import hashlib
+import time
+
+from bson import ObjectId
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import patch_vary_headers
+from pymongo import UpdateOne
+from rest_framework import status
+from rest_framework.response import Response
+
+from . import changes
+from .mongodb import get_async_collection, get_collection
+
+# Cached listings are keyed by a per-user generation counter kept in Mongo (shared
+# by every worker process): any write that can change what a user sees bumps
+# their counter, which retires all their cached responses and ETags at once.
+GENERATIONS = 'cache_generations'
+
+
+def get_generation(user_id):
+    document = get_collection(GENERATIONS).find_one({'_id': user_id})
+    return document['generation'] if document else 0
+
+
+async def aget_generation(user_id):
+    document = await get_async_collection(GENERATIONS).find_one({'_id': user_id})
+    return document['generation'] if document else 0
+
+
+def _generation_updates(user_ids):
+    return [
+        UpdateOne({'_id': user_id}, {'$inc': {'generation': 1}}, upsert=True)
+        for user_id in {str(user_id) for user_id in user_ids if user_id}
+    ]
+
+
+def bump_generation(*user_ids):
+    updates = _generation_updates(user_ids)
+    if updates:
+        get_collection(GENERATIONS).bulk_write(updates, ordered=False)
+
+
+def _audience(document):
+    users = {document.get('owner_id')}
+    users.update(perm.get('user_id') for perm in document.get('permissions', []))
+    return users
+
+
+def _folder_audience(folder_ids):
+    folder_ids = [ObjectId(folder_id) for folder_id in folder_ids if folder_id and ObjectId.is_valid(folder_id)]
+    if not folder_ids:
+        return set()
+    users = set()
+    for folder in get_collection('folders').find(
+        {'_id': {'$in': folder_ids}}, {'owner_id': 1, 'permissions.user_id': 1}
+    ):
+        users |= _audience(folder)
+    return users
+
+
+def bump_for_files(*files):
+    """Invalidate everyone who can see these files: owners, grantees and viewers of their folders.
+
+    The files with an `_id` are also journaled as changed for all of them,
+    partial documents (e.g. a new permission) only add users.
+    """
+    users = set()
+    for file in files:
+        users |= _audience(file)
+    users |= _folder_audience({file.get('folder') for file in files})
+    bump_generation(*users)
+    changes.record(users, changes.FILE, [file['_id'] for file in files if file.get('_id')])
+
+
+def bump_for_folder(folder):
+    """Invalidate the folder's audience and the audience of its parent (which lists it)."""
+    users = _audience(folder) | _folder_audience([folder.get('parent_folder')])
+    bump_generation(*users)
+    if folder.get('_id'):
+        changes.record(users, changes.FOLDER, [folder['_id']])
+
+
+def response_digest(view, request, generation):
+    """Cache key and ETag of a listing.
+
+    Entries also roll over every RESPONSE_CACHE_TIMEOUT seconds, which bounds
+    the staleness of time-based data (e.g. "activity of the last 7 days").
+    """
+    window = int(time.time() // settings.RESPONSE_CACHE_TIMEOUT)
+    # The class name, not the view: the sync and async views of a URL share entries
+    name = type(view).__name__.removeprefix('Async')
+    return hashlib.sha1(
+        f'{name}|{request.get_full_path()}|{request.user.id}|{generation}|{window}'.encode()
+    ).hexdigest()
+
+
+def is_not_modified(request, etag):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH', '')
+    return etag in [tag.strip() for tag in if_none_match.split(',')]
+
+
+def set_cache_headers(response, etag):
+    response['ETag'] = etag
+    # Private data: browsers may keep it but must revalidate every time
+    response['Cache-Control'] = 'private, no-cache'
+    patch_vary_headers(response, ['Authorization'])
+    return response
+
+
+def cached_response(view_method):
+    """Cache a GET handler's data per user and generation, with ETag / 304 revalidation."""
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        digest = response_digest(self, request, get_generation(str(request.user.id)))
+        etag = f'"{digest}"'
+
+        if is_not_modified(request, etag):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            key = f'response:{digest}'
+            data = cache.get(key)
+            if data is None:
+                response = view_method(self, request, *args, **kwargs)
+                if response.status_code != status.HTTP_200_OK:
+                    return response
+                cache.set(key, response.data, settings.RESPONSE_CACHE_TIMEOUT)
+            else:
+                response = Response(data)
+        return set_cache_headers(response, etag)
+    return wrapper
@@ -0,0 +1,203 @@
+"""Per-user change journal behind GET /api/v1/changes/?since=<token>.
+
+Every write that invalidates a listing (cache.bump_for_files / bump_for_folder)
+also appends one entry per affected user and object to `changes`, numbered by
+a per-user sequence (change_sequences). A sync client keeps the token of its
+last poll and only receives the objects touched since, resolved to their
+current state: still visible, trashed, or removed (deleted, unshared, moved
+out of reach).
+
+`manage.py compact_changes` deletes the entries superseded by a newer one for
+the same object, and the entries older than CHANGES_RETENTION_DAYS. A token
+older than what was compacted away gets a 410: the client lists everything
+again.
+"""
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from pymongo import DeleteMany, ReturnDocument, UpdateOne
+
+from ..projectors import FILE_LIST
+from .mongodb import get_collection
+
+CHANGES = 'changes'
+SEQUENCES = 'change_sequences'
+FILE, FOLDER = 'file', 'folder'
+KINDS = {FILE: 'documents', FOLDER: 'folders'}
+
+
+class TokenExpired(Exception):
+    """The entries after this token were compacted away."""
+
+
+def record(users, kind, object_ids):
+    """Journal a change of object_ids for each of users."""
+    object_ids = list(dict.fromkeys(object_ids))
+    users = {str(user_id) for user_id in users if user_id}
+    if not object_ids or not users:
+        return
+    sequences = get_collection(SEQUENCES)
+    now = datetime.now()
+    entries = []
+    for user_id in users:
+        # One round trip reserves the user's numbers for the whole batch
+        last = sequences.find_one_and_update(
+            {'_id': user_id}, {'$inc': {'seq': len(object_ids)}},
+            upsert=True, return_document=ReturnDocument.AFTER
+        )['seq']
+        first = last - len(object_ids) + 1
+        entries.extend(
+            {'user_id': user_id, 'seq': first + i, 'kind': kind, 'object_id': object_id, 'at': now}
+            for i, object_id in enumerate(object_ids)
+        )
+    get_collection(CHANGES).insert_many(entries, ordered=False)
+
+
+def current_token(user_id):
+    sequence = get_collection(SEQUENCES).find_one({'_id': user_id})
+    return sequence['seq'] if sequence else 0
+
+
+def _settled(entries, since):
+    """The entries up to the first gap a writer may still be filling.
+
+    Numbers are reserved before the entries are inserted, so a poll can see
+    seq 12 while 11 is on its way: stopping before the gap keeps 11 from being
+    skipped. Once the entry after a gap is older than CHANGES_SETTLE_DELAY
+    the gap is final (entries compacted away) and is skipped.
+    """
+    settled_before = datetime.now() - timedelta(seconds=settings.CHANGES_SETTLE_DELAY)
+    expected = since + 1
+    for i, entry in enumerate(entries):
+        if entry['seq'] != expected and entry['at'] > settled_before:
+            return entries[:i]
+        expected = entry['seq'] + 1
+    return entries
+
+
+def _audiences(folder_ids):
+    """folder id -> users who see it: owner, grantees, and those of its parent."""
+    folders = {
+        folder['_id']: folder for folder in get_collection('folders').find(
+            {'_id': {'$in': list(folder_ids)}}, {'owner_id': 1, 'permissions.user_id': 1}
+        )
+    }
+    return {
+        folder_id: {folder.get('owner_id')} | {perm.get('user_id') for perm in folder.get('permissions', [])}
+        for folder_id, folder in folders.items()
+    }
+
+
+def _visible(document, user_id, audiences, parent_key):
+    if document.get('owner_id') == user_id:
+        return True
+    if any(perm.get('user_id') == user_id for perm in document.get('permissions', [])):
+        return True
+    return user_id in audiences.get(document.get(parent_key), ())
+
+
+def _folder_item(folder):
+    # Same shape as FolderListView
+    folder['id'] = str(folder.pop('_id'))
+    return folder
+
+
+def changes_since(user_id, since, limit=None):
+    """Objects changed for user_id after token `since`, TokenExpired if it is too old."""
+    limit = limit or settings.CHANGES_PAGE_SIZE
+    sequence = get_collection(SEQUENCES).find_one({'_id': user_id}) or {}
+    if since < sequence.get('compacted', 0):
+        raise TokenExpired()
+
+    entries = list(get_collection(CHANGES).find(
+        {'user_id': user_id, 'seq': {'$gt': since}}, {'_id': 0, 'seq': 1, 'kind': 1, 'object_id': 1, 'at': 1}
+    ).sort('seq', 1).limit(limit + 1))
+    has_more = len(entries) > limit
+    settled = _settled(entries[:limit], since)
+    has_more = has_more or len(settled) < min(len(entries), limit)
+
+    # An object changed several times is resolved once, to its current state
+    touched = {FILE: set(), FOLDER: set()}
+    for entry in settled:
+        touched[entry['kind']].add(entry['object_id'])
+
+    files = list(get_collection('documents').find(
+        {'_id': {'$in': list(touched[FILE])}},
+        {**FILE_LIST.projection, 'owner_id': 1, 'permissions.user_id': 1, 'folder': 1, 'is_trashed': 1,
+         'purge_job': 1}
+    )) if touched[FILE] else []
+    folders = list(get_collection('folders').find(
+        {'_id': {'$in': list(touched[FOLDER])}}
+    )) if touched[FOLDER] else []
+    audiences = _audiences(
+        {file.get('folder') for file in files} | {folder.get('parent_folder') for folder in folders}
+        - {None}
+    )
+
+    result = {
+        'token': str(settled[-1]['seq'] if settled else since),
+        'has_more': has_more,
+        'files': [],
+        'folders': [],
+        'trashed': {'files': [], 'folders': []},
+        'removed': {'files': [], 'folders': []},
+    }
+    seen = {FILE: set(), FOLDER: set()}
+    for file in files:
+        # Claimed by a purge: already gone for the client
+        if file.get('purge_job') or not _visible(file, user_id, audiences, 'folder'):
+            continue
+        seen[FILE].add(file['_id'])
+        if file.get('is_trashed'):
+            result['trashed']['files'].append(str(file['_id']))
+        else:
+            result['files'].append(FILE_LIST(file))
+    for folder in folders:
+        if not _visible(folder, user_id, audiences, 'parent_folder'):
+            continue
+        seen[FOLDER].add(folder['_id'])
+        if folder.get('is_trashed'):
+            result['trashed']['folders'].append(str(folder['_id']))
+        else:
+            result['folders'].append(_folder_item(folder))
+    for kind, plural in ((FILE, 'files'), (FOLDER, 'folders')):
+        result['removed'][plural] = sorted(str(object_id) for object_id in touched[kind] - seen[kind])
+    return result
+
+
+def compact(retention_days=None):
+    """Delete superseded entries, and all entries older than the retention period.
+
+    Returns (superseded, expired) counts.
+    """
+    retention_days = settings.CHANGES_RETENTION_DAYS if retention_days is None else retention_days
+    collection = get_collection(CHANGES)
+
+    # Only the latest entry of an object matters, whatever the token: dropping
+    # the older ones never hides anything, so it does not expire tokens
+    deletes = [
+        DeleteMany({'user_id': group['_id']['user_id'], 'kind': group['_id']['kind'],
+                    'object_id': group['_id']['object_id'], 'seq': {'$lt': group['last']}})
+        for group in collection.aggregate([
+            {'$group': {'_id': {'user_id': '$user_id', 'kind': '$kind', 'object_id': '$object_id'},
+                        'last': {'$max': '$seq'}, 'count': {'$sum': 1}}},
+            {'$match': {'count': {'$gt': 1}}},
+        ], allowDiskUse=True)
+    ]
+    superseded = collection.bulk_write(deletes, ordered=False).deleted_count if deletes else 0
+
+    cutoff = datetime.now() - timedelta(days=retention_days)
+    floors = [
+        # Tokens before the last expired entry can no longer be served
+        UpdateOne({'_id': group['_id']}, {'$max': {'compacted': group['last']}}, upsert=True)
+        for group in collection.aggregate([
+            {'$match': {'at': {'$lt': cutoff}}},
+            {'$group': {'_id': '$user_id', 'last': {'$max': '$seq'}}},
+        ])
+    ]
+    expired = 0
+    if floors:
+        # Floors first: a poll in between gets a 410 rather than missing entries
+        get_collection(SEQUENCES).bulk_write(floors, ordered=False)
+        expired = collection.delete_many({'at': {'$lt': cutoff}}).deleted_count
+    return superseded, expired
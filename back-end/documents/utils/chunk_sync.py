@@ -0,0 +1,190 @@
+"""Block-level upload of new versions (files/<id>/versions/sync/).
+
+The client cuts the new content with the same content-defined chunking as the
+server (utils/chunking.py, parameters at GET .../versions/sync/) and sends the
+list of chunk hashes. The server looks them up in the current version and
+answers with the ones it does not have; only those are uploaded, then the new
+version is assembled from the current version's bytes and the uploaded chunks
+and stored like a regular upload.
+
+Sessions and the chunks uploaded to them are kept in Mongo and expire after
+CHUNK_SYNC_SESSION_TTL.
+"""
+import hashlib
+from datetime import datetime, timedelta
+
+from bson import Binary, ObjectId
+from django.conf import settings
+
+from ..storage import get_storage
+from .chunking import AVG_CHUNK, GEAR, MAX_CHUNK, MIN_CHUNK, chunk_digest
+from .delta import BaseReader, index_chunks
+from .ingest import unique_filename, write_blob
+from .mongodb import get_collection
+
+SESSIONS = 'chunk_sync_sessions'
+CHUNKS = 'chunk_sync_chunks'
+# A commit that has not finished by then (worker died) can be retried
+COMMIT_LEASE = timedelta(minutes=10)
+
+
+class ChunkSyncError(ValueError):
+    """The request does not describe a valid upload."""
+
+
+def chunking_parameters():
+    return {'algorithm': 'gear', 'hash': 'sha256', 'min_size': MIN_CHUNK, 'avg_size': AVG_CHUNK,
+            'max_size': MAX_CHUNK, 'gear': list(GEAR)}
+
+
+def _parse_chunks(chunks):
+    parsed = []
+    for chunk in chunks:
+        try:
+            digest, size = bytes.fromhex(chunk['hash']), int(chunk['size'])
+        except (KeyError, TypeError, ValueError):
+            raise ChunkSyncError('Each chunk needs a hex `hash` and a `size`.')
+        if len(digest) != hashlib.sha256().digest_size or not 0 < size <= MAX_CHUNK:
+            raise ChunkSyncError(f'Chunks are sha256 hashes of at most {MAX_CHUNK} bytes.')
+        parsed.append((digest.hex(), size))
+    return parsed
+
+
+def start_session(file, user_id, chunks, checksum=None):
+    """Open an upload of a new version of file made of `chunks`, returns the session.
+
+    The session lists, per chunk, where to copy it from in the current version
+    (offset) or None when it has to be uploaded (hash in `missing`).
+    """
+    chunks = _parse_chunks(chunks)
+    if checksum and not checksum.startswith('sha256:'):
+        checksum = f'sha256:{checksum.lower()}'  # as recorded on versions
+    # Only the digests this upload needs, read from the current version
+    index = index_chunks(file['file_path'], file.get('encoding')) if chunks else {}
+    offsets, missing = [], {}
+    for digest, size in chunks:
+        match = index.get(bytes.fromhex(digest))
+        if match and match[1] == size:
+            offsets.append(match[0])
+        else:
+            offsets.append(None)
+            missing[digest] = size
+    current = next((v for v in file.get('versions', []) if v.get('file_path') == file['file_path']), {})
+    now = datetime.now()
+    session = {
+        '_id': ObjectId(),
+        'file_id': file['_id'],
+        'user_id': user_id,
+        # The version, not its blob: encode_version may swap it for a delta before the commit
+        'base_version': current.get('id'),
+        'base_path': file['file_path'],
+        'base_encoding': file.get('encoding'),
+        'chunks': [[digest, size, offset] for (digest, size), offset in zip(chunks, offsets)],
+        'missing': list(missing),
+        'size': sum(size for _, size in chunks),
+        'checksum': checksum,
+        'created_at': now,
+        'expires_at': now + timedelta(seconds=settings.CHUNK_SYNC_SESSION_TTL),
+    }
+    get_collection(SESSIONS).insert_one(session)
+    return session
+
+
+def get_session(session_id, file_id, user_id):
+    return get_collection(SESSIONS).find_one({'_id': session_id, 'file_id': file_id, 'user_id': user_id})
+
+
+def receive_chunks(session, uploads):
+    """Store uploaded chunks ({hash: bytes}), returns the hashes still missing."""
+    sizes = {digest: size for digest, size, _ in session['chunks']}
+    received = []
+    for digest, data in uploads.items():
+        digest = digest.lower()
+        if digest not in sizes:
+            raise ChunkSyncError(f'Chunk {digest} is not part of this upload.')
+        if len(data) != sizes[digest] or chunk_digest(data).hex() != digest:
+            raise ChunkSyncError(f'Chunk {digest} does not match its hash.')
+        get_collection(CHUNKS).update_one(
+            {'session_id': session['_id'], 'hash': digest},
+            {'$setOnInsert': {'data': Binary(data), 'created_at': datetime.now()}},
+            upsert=True
+        )
+        received.append(digest)
+    if received:
+        get_collection(SESSIONS).update_one({'_id': session['_id']}, {'$pullAll': {'missing': received}})
+    return [digest for digest in session['missing'] if digest not in received]
+
+
+def _base_version(session):
+    """(file, base version) as stored now, (file, None) if the version was pruned."""
+    file = get_collection('documents').find_one(
+        {'_id': session['file_id']},
+        {'original_filename': 1, 'versions.id': 1, 'versions.file_path': 1, 'versions.encoding': 1}
+    )
+    versions = file.get('versions', []) if file else []
+    if session.get('base_version'):
+        version = next((v for v in versions if v.get('id') == session['base_version']), None)
+    else:  # sessions opened before base_version was recorded
+        version = next((v for v in versions if v.get('file_path') == session['base_path']), None)
+    return file, version
+
+
+def _assemble(session, base_version):
+    # Offsets are in the original bytes, whatever the version is stored as (raw, zstd, delta)
+    base = BaseReader(base_version['file_path'], base_version.get('encoding'))
+    chunks = get_collection(CHUNKS)
+    try:
+        for digest, size, offset in session['chunks']:
+            if offset is not None:
+                yield from base.read(offset, size)
+            else:
+                yield chunks.find_one({'session_id': session['_id'], 'hash': digest}, {'data': 1})['data']
+    finally:
+        base.close()
+
+
+def assemble(session):
+    """Write the new version's blob, returns (stored name, blob fields).
+
+    ChunkSyncError if chunks are still missing or the result does not match
+    the checksum the client announced.
+    """
+    if session['missing']:
+        raise ChunkSyncError(f"{len(session['missing'])} chunks are still missing.")
+    read_from = None
+    while True:
+        file, base_version = _base_version(session)
+        if base_version is None or base_version['file_path'] == read_from:
+            # The version the chunks are copied from was pruned meanwhile
+            raise ChunkSyncError('The base version is gone, start a new upload.')
+        read_from = base_version['file_path']
+        stored_name = unique_filename(file.get('original_filename') or '')
+        try:
+            blob = write_blob(stored_name, _assemble(session, base_version))
+            break
+        except FileNotFoundError:
+            # Re-encoded as a delta while we read it: start over from its new blob
+            get_storage().delete(stored_name)
+    if session.get('checksum') and blob['checksum'] != session['checksum']:
+        get_storage().delete(stored_name)
+        raise ChunkSyncError('Assembled content does not match the checksum.')
+    return stored_name, blob
+
+
+def claim_commit(session):
+    """Reserve the session for one commit, False if another request is committing it."""
+    now = datetime.now()
+    claimed = get_collection(SESSIONS).find_one_and_update(
+        {'_id': session['_id'], '$or': [{'committing_until': None}, {'committing_until': {'$lt': now}}]},
+        {'$set': {'committing_until': now + COMMIT_LEASE}}
+    )
+    return claimed is not None
+
+
+def release_commit(session):
+    get_collection(SESSIONS).update_one({'_id': session['_id']}, {'$unset': {'committing_until': ''}})
+
+
+def close_session(session):
+    get_collection(CHUNKS).delete_many({'session_id': session['_id']})
+    get_collection(SESSIONS).delete_one({'_id': session['_id']})
@@ -0,0 +1,63 @@
+import hashlib
+import random
+
+# Content-defined chunking with a gear rolling hash (as in FastCDC): a boundary is
+# cut where the hash of the last ~32 bytes matches a mask, so an insertion only
+# changes the chunks around it instead of shifting every fixed-size block after it.
+MIN_CHUNK = 16 * 1024
+AVG_CHUNK = 64 * 1024
+MAX_CHUNK = 256 * 1024
+READ_SIZE = 1024 * 1024
+
+_HASH_MASK = 0xFFFFFFFF
+# Fixed seed: boundaries must be identical across processes and releases
+_rng = random.Random(0x5D17E)
+GEAR = tuple(_rng.getrandbits(32) for _ in range(256))
+
+
+def _boundary_mask(avg_size):
+    bits = avg_size.bit_length() - 1
+    # Test the high bits, the low ones only depend on the last few bytes
+    return ((1 << bits) - 1) << (32 - bits)
+
+
+def find_boundary(data, start, end, min_size=MIN_CHUNK, max_size=MAX_CHUNK, mask=None):
+    """Offset right after the chunk starting at `start`, `end` if no cut point is found before it."""
+    mask = _boundary_mask(AVG_CHUNK) if mask is None else mask
+    limit = min(end, start + max_size)
+    if limit - start <= min_size:
+        return limit
+    gear = GEAR
+    h = 0
+    for i in range(start + min_size, limit):
+        h = ((h << 1) + gear[data[i]]) & _HASH_MASK
+        if not h & mask:
+            return i + 1
+    return limit
+
+
+def iter_chunks(reader, min_size=MIN_CHUNK, avg_size=AVG_CHUNK, max_size=MAX_CHUNK):
+    """Split a binary stream into content-defined chunks, yields (offset, bytes)."""
+    mask = _boundary_mask(avg_size)
+    buffer = bytearray()
+    offset = 0
+    eof = False
+    while buffer or not eof:
+        # Keep at least one maximal chunk buffered so cut points do not depend on read sizes
+        while not eof and len(buffer) < max_size:
+            data = reader.read(READ_SIZE)
+            if not data:
+                eof = True
+            buffer += data
+        position = 0
+        while len(buffer) - position >= max_size or (eof and position < len(buffer)):
+            cut = find_boundary(buffer, position, len(buffer), min_size, max_size, mask)
+            chunk = bytes(buffer[position:cut])
+            yield offset, chunk
+            offset += len(chunk)
+            position = cut
+        del buffer[:position]
+
+
+def chunk_digest(chunk):
+    return hashlib.sha256(chunk).digest()
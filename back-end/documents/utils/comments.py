@@ -0,0 +1,128 @@
+"""File comments, one document per comment in `comments`.
+
+Replies point at a top-level comment (parent_id, one level of threading).
+The file keeps comment_count and each top-level comment its reply_count,
+moved with $inc by the writers below. Comments used to be embedded in the
+file document: `manage.py migrate_comments` moves them over.
+"""
+import uuid
+from datetime import datetime
+
+from django.contrib.auth import get_user_model
+from pymongo import UpdateOne
+
+from .mongodb import get_collection
+
+COMMENTS = 'comments'
+
+
+def get_comment(file_id, comment_id):
+    return get_collection(COMMENTS).find_one({'_id': comment_id, 'file_id': file_id})
+
+
+def add_comment(file_id, user_id, text, parent=None):
+    """Insert a comment (a reply to `parent`), returns it."""
+    now = datetime.now()
+    comment = {
+        # String ids, as the embedded comments had: links and activities keep working
+        '_id': str(uuid.uuid4()),
+        'file_id': file_id,
+        'parent_id': parent['_id'] if parent else None,
+        'user_id': user_id,
+        'text': text,
+        'reply_count': 0,
+        'created_at': now,
+        'updated_at': now,
+    }
+    get_collection(COMMENTS).insert_one(comment)
+    if parent:
+        get_collection(COMMENTS).update_one({'_id': parent['_id']}, {'$inc': {'reply_count': 1}})
+    get_collection('documents').update_one(
+        {'_id': file_id},
+        {
+            '$inc': {'comment_count': 1},
+            '$push': {
+                'activities': {
+                    'id': str(uuid.uuid4()),
+                    'user_id': user_id,
+                    'action': 'comment',
+                    'timestamp': now,
+                    'details': {'comment_id': comment['_id']}
+                }
+            }
+        }
+    )
+    return comment
+
+
+def edit_comment(comment, text):
+    get_collection(COMMENTS).update_one(
+        {'_id': comment['_id']}, {'$set': {'text': text, 'updated_at': datetime.now()}}
+    )
+
+
+def delete_comment(comment):
+    """Delete a comment with its replies, returns how many comments went away."""
+    collection = get_collection(COMMENTS)
+    if comment.get('parent_id'):
+        deleted = collection.delete_one({'_id': comment['_id']}).deleted_count
+        if deleted:
+            collection.update_one({'_id': comment['parent_id']}, {'$inc': {'reply_count': -1}})
+    else:
+        deleted = collection.delete_many(
+            {'$or': [{'_id': comment['_id']}, {'parent_id': comment['_id']}]}
+        ).deleted_count
+    if deleted:
+        get_collection('documents').update_one({'_id': comment['file_id']}, {'$inc': {'comment_count': -deleted}})
+    return deleted
+
+
+def add_user_names(comments):
+    """Set user_name on projected comments, one query for all their authors."""
+    user_ids = {comment['user_id'] for comment in comments}
+    names = {
+        str(user.id): f'{user.first_name} {user.last_name}'.strip() or user.username
+        for user in get_user_model().objects.filter(id__in=[uid for uid in user_ids if uid.isdigit()])
+    }
+    for comment in comments:
+        comment['user_name'] = names.get(comment['user_id'], 'Unknown User')
+    return comments
+
+
+def migrate_embedded(batch_size=100):
+    """Move the comments embedded in file documents to the collection, returns (files, comments).
+
+    Idempotent: comments are upserted by id and a file loses its array only
+    once they are all in, an interrupted run is simply started again.
+    """
+    documents = get_collection('documents')
+    collection = get_collection(COMMENTS)
+    files = moved = 0
+    while True:
+        batch = list(documents.find({'comments': {'$exists': True}}, {'comments': 1}).limit(batch_size))
+        if not batch:
+            break
+        for file in batch:
+            upserts = [
+                UpdateOne({'_id': embedded.get('id') or str(uuid.uuid4())}, {'$setOnInsert': {
+                    'file_id': file['_id'],
+                    'parent_id': None,
+                    'user_id': embedded.get('user_id'),
+                    'text': embedded.get('text', ''),
+                    'reply_count': 0,
+                    'created_at': embedded.get('created_at') or datetime.now(),
+                    'updated_at': embedded.get('updated_at') or embedded.get('created_at') or datetime.now(),
+                }}, upsert=True)
+                for embedded in file.get('comments') or []
+            ]
+            if upserts:
+                collection.bulk_write(upserts, ordered=False)
+            # Counted from the collection: comments posted since the deployment are included
+            documents.update_one(
+                {'_id': file['_id']},
+                {'$set': {'comment_count': collection.count_documents({'file_id': file['_id']})},
+                 '$unset': {'comments': ''}}
+            )
+            files += 1
+            moved += len(upserts)
+    return files, moved
@@ -0,0 +1,116 @@
+import zlib
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from ..storage import get_storage
+
+try:
+    import zstandard
+except ImportError:  # optional dependency, blobs are stored raw without it
+    zstandard = None
+
+# Value of the `encoding` field on files and versions, None for raw blobs
+ZSTD = 'zstd'
+DELTA = 'delta'  # see utils.delta
+GZIP = 'gzip'  # never stored, zstd blobs are re-encoded for clients without zstd
+READ_SIZE = 1024 * 1024
+
+
+class DeltaError(ValueError):
+    """A delta blob (or the snapshot it points at) is truncated or corrupt."""
+
+
+# Raised while reading a corrupted compressed or delta blob
+DECODE_ERRORS = (DeltaError, zstandard.ZstdError) if zstandard else (DeltaError,)
+
+
+def compression_enabled():
+    return zstandard is not None and settings.STORAGE_COMPRESSION
+
+
+def choose_encoding(sample):
+    """Compress the sample with a fast level: 'zstd' if it shrinks enough, None to store raw.
+
+    Media formats (JPEG, MP4, PDF streams, ZIP-based office files...) are already
+    compressed and fail the check, so only the CPU of the probe is spent on them.
+    """
+    if not compression_enabled() or len(sample) < settings.STORAGE_COMPRESSION_MIN_SIZE:
+        return None
+    compressed = zstandard.ZstdCompressor(level=1).compress(sample)
+    if len(sample) < len(compressed) * settings.STORAGE_COMPRESSION_MIN_RATIO:
+        return None
+    return ZSTD
+
+
+def encode_chunks(chunks, encoding):
+    if encoding != ZSTD:
+        yield from chunks
+        return
+    compressor = zstandard.ZstdCompressor(level=settings.STORAGE_COMPRESSION_LEVEL).compressobj()
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def gzip_chunks(chunks):
+    """Re-encode original bytes as a gzip stream, at a fast level: it runs on every download."""
+    compressor = zlib.compressobj(settings.STORAGE_COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _decompressor():
+    if zstandard is None:
+        raise ImproperlyConfigured('This blob is zstd-compressed, install zstandard to read it.')
+    return zstandard.ZstdDecompressor()
+
+
+def decode_stream(raw, encoding):
+    """Wrap a readable binary stream of stored bytes into one of original bytes."""
+    if encoding != ZSTD:
+        return raw
+    return _decompressor().stream_reader(raw, read_size=READ_SIZE, closefd=True)
+
+
+def open_content(name, encoding=None):
+    """Readable file object over the original bytes of a blob, decoding on the fly."""
+    if encoding == DELTA:
+        from .delta import open_delta
+        return open_delta(name)
+    return decode_stream(get_storage().open(name), encoding)
+
+
+def iter_content(name, encoding=None, start=0, end=None):
+    """Original bytes start..end (inclusive) of a blob.
+
+    Raw blobs use a ranged read from the backend and deltas only rebuild the
+    requested part; compressed ones are decoded from the start and the bytes
+    before `start` discarded.
+    """
+    if encoding == DELTA:
+        from .delta import iter_delta
+        yield from iter_delta(name, start, end)
+        return
+    if encoding != ZSTD:
+        if end is None:
+            end = get_storage().stat(name).size - 1
+        yield from get_storage().open_range(name, start, end)
+        return
+
+    with open_content(name, encoding) as reader:
+        if start:
+            reader.seek(start)  # forward seek, decompresses and drops
+        remaining = None if end is None else end - start + 1
+        while remaining is None or remaining > 0:
+            chunk = reader.read(READ_SIZE if remaining is None else min(READ_SIZE, remaining))
+            if not chunk:
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield chunk
@@ -0,0 +1,283 @@
+import io
+import json
+import struct
+import uuid
+
+from django.conf import settings
+
+from ..storage import get_storage
+from .chunking import chunk_digest, iter_chunks
+from .compression import DELTA, DeltaError, choose_encoding, decode_stream, encode_chunks, open_content
+from .mongodb import get_collection
+from .quotas import adjust_usage
+
+# Versions with encoding DELTA are stored against a full snapshot of the same
+# file. Deltas always point at a full version (never at another delta), so any
+# version is rebuilt from at most two blobs.
+
+# Blob layout: MAGIC, 4-byte header length, JSON header, literal bytes.
+# Header ops are [COPY, base offset, length] or [LITERAL, length], in output order;
+# the literal bytes follow in the same order, zstd-compressed when worth it.
+MAGIC = b'SDLT1\n'
+COPY = 0
+LITERAL = 1
+READ_SIZE = 1024 * 1024
+
+
+def _read_exactly(reader, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = reader.read(size - len(data))
+        if not chunk:
+            raise DeltaError('Truncated delta blob.')
+        data += chunk
+    return bytes(data)
+
+
+def index_chunks(name, encoding=None):
+    """Map chunk digest -> (offset, length) for every content-defined chunk of a blob."""
+    index = {}
+    with open_content(name, encoding) as reader:
+        for offset, chunk in iter_chunks(reader):
+            index.setdefault(chunk_digest(chunk), (offset, len(chunk)))
+    return index
+
+
+def compute_ops(name, encoding, base_index):
+    """Ops rebuilding blob `name` from the base chunks, literal ops carry their offset in `name`."""
+    ops = []
+    with open_content(name, encoding) as reader:
+        for offset, chunk in iter_chunks(reader):
+            match = base_index.get(chunk_digest(chunk))
+            previous = ops[-1] if ops else None
+            if match:
+                base_offset, length = match
+                # Runs of unchanged chunks collapse into one copy
+                if previous and previous[0] == COPY and previous[1] + previous[2] == base_offset:
+                    previous[2] += length
+                else:
+                    ops.append([COPY, base_offset, length])
+            elif previous and previous[0] == LITERAL and previous[1] + previous[2] == offset:
+                previous[2] += len(chunk)
+            else:
+                ops.append([LITERAL, offset, len(chunk)])
+    return ops
+
+
+def _iter_literals(name, encoding, ops):
+    # Literal ranges are increasing, one sequential read of the source is enough
+    with open_content(name, encoding) as reader:
+        position = 0
+        for op in ops:
+            if op[0] != LITERAL:
+                continue
+            _, offset, length = op
+            _read_exactly(reader, offset - position)  # skip the copied bytes
+            remaining = length
+            while remaining:
+                chunk = reader.read(min(READ_SIZE, remaining))
+                if not chunk:
+                    raise ValueError('Source blob changed while encoding the delta.')
+                remaining -= len(chunk)
+                yield chunk
+            position = offset + length
+
+
+def write_delta(delta_name, name, encoding, base):
+    """Store blob `name` as a delta against the `base` version, returns (stored size, literal bytes)."""
+    ops = compute_ops(name, encoding, index_chunks(base['file_path'], base.get('encoding')))
+    literal_size = sum(op[2] for op in ops if op[0] == LITERAL)
+
+    # Sample the literals to decide whether to compress them
+    sample = b''.join(_iter_literals(name, encoding, ops[:16]))[:settings.STORAGE_COMPRESSION_SAMPLE_SIZE]
+    literal_encoding = choose_encoding(sample)
+    header = json.dumps({
+        'base': base['file_path'],
+        'base_encoding': base.get('encoding'),
+        'literal_encoding': literal_encoding,
+        'ops': [[COPY, op[1], op[2]] if op[0] == COPY else [LITERAL, op[2]] for op in ops],
+    }).encode()
+
+    def blob():
+        yield MAGIC + struct.pack('>I', len(header)) + header
+        yield from encode_chunks(_iter_literals(name, encoding, ops), literal_encoding)
+
+    return get_storage().save(delta_name, blob()), literal_size
+
+
+class BaseReader:
+    """Random reads in the base snapshot over a forward-only stream, reopened to go back."""
+
+    def __init__(self, name, encoding):
+        self.name = name
+        self.encoding = encoding
+        self.reader = None
+        self.position = 0
+
+    def read(self, offset, length):
+        if self.reader is None or offset < self.position:
+            self.close()
+            self.reader = open_content(self.name, self.encoding)
+            self.position = 0
+        if offset > self.position:
+            if self.reader.seekable():
+                self.reader.seek(offset)
+            else:
+                _read_exactly(self.reader, offset - self.position)
+            self.position = offset
+        remaining = length
+        while remaining:
+            chunk = self.reader.read(min(READ_SIZE, remaining))
+            if not chunk:
+                raise DeltaError('Delta base is shorter than expected.')
+            self.position += len(chunk)
+            remaining -= len(chunk)
+            yield chunk
+
+    def close(self):
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
+
+
+class _IteratorReader(io.RawIOBase):
+    def __init__(self, iterator):
+        self.iterator = iterator
+        self.pending = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.pending:
+            self.pending = next(self.iterator, b'')
+            if not self.pending:
+                return 0
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+    def close(self):
+        self.iterator.close()
+        super().close()
+
+
+def open_delta(name):
+    """Readable file object over the reconstructed bytes of a delta version."""
+    return io.BufferedReader(_IteratorReader(iter_delta(name)), buffer_size=READ_SIZE)
+
+
+def read_header(reader):
+    if _read_exactly(reader, len(MAGIC)) != MAGIC:
+        raise DeltaError('Not a delta blob.')
+    (length,) = struct.unpack('>I', _read_exactly(reader, 4))
+    try:
+        header = json.loads(_read_exactly(reader, length))
+    except ValueError as e:  # JSON or UTF-8
+        raise DeltaError(f'Corrupt delta header: {e}') from e
+    if not isinstance(header, dict) or not {'base', 'base_encoding', 'ops', 'literal_encoding'} <= header.keys():
+        raise DeltaError('Corrupt delta header.')
+    if not all(isinstance(op, list) and len(op) == (3 if op[:1] == [COPY] else 2) for op in header['ops']):
+        raise DeltaError('Corrupt delta ops.')
+    return header
+
+
+def iter_delta(name, start=0, end=None):
+    """Original bytes start..end (inclusive) of a delta version, streamed op by op."""
+    with get_storage().open(name) as raw:
+        header = read_header(raw)
+        # The rest of the blob is one (possibly compressed) stream
+        literals = decode_stream(raw, header['literal_encoding'])
+        base = BaseReader(header['base'], header['base_encoding'])
+        try:
+            position = 0
+            for op in header['ops']:
+                length = op[-1]
+                op_start, op_end = position, position + length  # output range of this op
+                position = op_end
+                if end is not None and op_start > end:
+                    break
+                # Part of the op to emit
+                skip = max(start - op_start, 0)
+                take = min(op_end, end + 1 if end is not None else op_end) - op_start - skip
+                if op[0] == COPY:
+                    if take > 0:
+                        yield from base.read(op[1] + skip, take)
+                    continue
+                if skip:
+                    _read_exactly(literals, min(skip, length))
+                if take > 0:
+                    remaining = take
+                    while remaining:
+                        chunk = literals.read(min(READ_SIZE, remaining))
+                        if not chunk:
+                            raise DeltaError('Truncated delta blob.')
+                        remaining -= len(chunk)
+                        yield chunk
+        finally:
+            base.close()
+
+
+def choose_base(versions, version):
+    """Full version to encode `version` against, None to keep it as a new snapshot."""
+    if (version.get('size') or 0) < settings.VERSION_DELTA_MIN_SIZE:
+        return None
+    earlier = [v for v in versions
+               if v.get('version_number', 0) < version.get('version_number', 0) and v.get('encoding') != DELTA]
+    if not earlier:
+        return None
+    base = max(earlier, key=lambda v: v.get('version_number', 0))
+    # Bound the work kept on one snapshot: every N versions a full copy is kept
+    dependents = sum(1 for v in versions if v.get('delta_base') == base['file_path'])
+    if dependents >= settings.VERSION_SNAPSHOT_INTERVAL - 1:
+        return None
+    return base
+
+
+def encode_version(job_id, file_id, version_id):
+    """Background job: replace a freshly uploaded full version by a delta when it pays off."""
+    collection = get_collection('documents')
+    storage = get_storage()
+    file = collection.find_one({'_id': file_id}, {'owner_id': 1, 'versions': 1})
+    versions = file.get('versions', []) if file else []
+    version = next((v for v in versions if v.get('id') == version_id), None)
+    if not version or version.get('encoding') == DELTA:
+        return {'status': 'skipped'}
+    base = choose_base(versions, version)
+    if base is None:
+        return {'status': 'snapshot'}
+
+    delta_name = f'{uuid.uuid4()}.delta'
+    stored_size, literal_size = write_delta(delta_name, version['file_path'], version.get('encoding'), base)
+    full_size = version.get('stored_size') or version.get('size') or 0
+    if stored_size > full_size * settings.VERSION_DELTA_MAX_RATIO:
+        # Too much changed, the full copy becomes a snapshot
+        storage.delete(delta_name)
+        return {'status': 'snapshot', 'delta_size': stored_size}
+
+    fields = {'file_path': delta_name, 'encoding': DELTA, 'stored_size': stored_size,
+              'delta_base': base['file_path']}
+    result = collection.update_one(
+        {
+            '_id': file_id,
+            'versions': {'$elemMatch': {'id': version_id, 'file_path': version['file_path']}},
+            # The base may have been pruned by a retention policy meanwhile
+            'versions.file_path': base['file_path'],
+        },
+        {'$set': {f'versions.$.{key}': value for key, value in fields.items()}}
+    )
+    if not result.modified_count:
+        storage.delete(delta_name)  # version deleted or changed meanwhile
+        return {'status': 'skipped'}
+    # The file points at the version when it is the current one
+    collection.update_one({'_id': file_id, 'file_path': version['file_path']}, {'$set': fields})
+    storage.delete(version['file_path'])
+    adjust_usage(file.get('owner_id'), stored_size - full_size)
+    return {
+        'status': 'delta',
+        'base_version': base.get('version_number'),
+        'stored_size': stored_size,
+        'literal_bytes': literal_size,
+        'bytes_saved': full_size - stored_size,
+    }
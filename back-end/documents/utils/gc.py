@@ -0,0 +1,178 @@
+import heapq
+import os
+import tempfile
+import time
+
+from django.conf import settings
+
+from ..storage import StoredObject, get_storage
+from .mongodb import get_collection
+from .throttle import RateLimiter
+
+GC_DELETE_BATCH = 1000  # orphans per delete_many
+
+
+def iter_referenced_names():
+    """Stream every blob name referenced by a document, current file and all versions."""
+    cursor = get_collection('documents').find(
+        {}, {'file_path': 1, 'versions.file_path': 1}
+    ).batch_size(2000)
+    for document in cursor:
+        if document.get('file_path'):
+            yield os.path.basename(document['file_path'])
+        for version in document.get('versions', []):
+            if version.get('file_path'):
+                yield os.path.basename(version['file_path'])
+
+
+class SortedSpill:
+    """Sorted string set that switches to on-disk sorted runs past `threshold` items.
+
+    Keeps the mark phase bounded in memory on huge stores: runs are sorted
+    individually, then read back through a k-way merge.
+    """
+
+    def __init__(self, threshold, directory=None):
+        self.threshold = threshold
+        self.directory = directory
+        self.buffer = []
+        self.runs = []
+
+    def add(self, line):
+        self.buffer.append(line)
+        if len(self.buffer) >= self.threshold:
+            self._spill()
+
+    def _spill(self):
+        self.buffer.sort()
+        run = tempfile.TemporaryFile('w+', dir=self.directory)
+        run.writelines(f'{line}\n' for line in self.buffer)
+        run.seek(0)
+        self.runs.append(run)
+        self.buffer = []
+
+    @property
+    def spilled(self):
+        return bool(self.runs)
+
+    def __iter__(self):
+        self.buffer.sort()
+        streams = [(line.rstrip('\n') for line in run) for run in self.runs]
+        previous = None
+        for line in heapq.merge(self.buffer, *streams):
+            if line != previous:
+                yield line
+                previous = line
+
+    def close(self):
+        for run in self.runs:
+            run.close()
+        self.runs = []
+        self.buffer = []
+
+
+def _iter_orphans_in_memory(references, candidates):
+    referenced = set(references)
+    for candidate in candidates:
+        if candidate[0] not in referenced:
+            yield candidate
+
+
+def _iter_orphans_spilled(references, candidates, threshold, directory):
+    """Merge-join the sorted reference names against the sorted candidate blobs."""
+    blobs = SortedSpill(threshold, directory)
+    try:
+        for name, size, mtime in candidates:
+            blobs.add(f'{name}\t{size}\t{mtime}')
+
+        reference_iter = iter(references)
+        current = next(reference_iter, None)
+        for line in blobs:
+            name, size, mtime = line.split('\t')
+            while current is not None and current < name:
+                current = next(reference_iter, None)
+            if current != name:
+                yield StoredObject(name, int(size), float(mtime))
+    finally:
+        blobs.close()
+
+
+def collect_garbage(grace_period=None, quarantine=False, dry_run=False,
+                    spill_threshold=None, unlinks_per_second=None):
+    """Mark-and-sweep the document store and remove blobs no document references.
+
+    Only blobs older than the grace period are considered, so uploads that are
+    still being written (file on disk, metadata not inserted yet) are left alone.
+    Returns a report with the number of orphans and bytes reclaimed.
+    """
+    storage = get_storage()
+    grace_period = settings.GC_GRACE_PERIOD if grace_period is None else grace_period
+    spill_threshold = spill_threshold or settings.GC_SPILL_THRESHOLD
+    limiter = RateLimiter(settings.GC_UNLINKS_PER_SECOND if unlinks_per_second is None else unlinks_per_second)
+    spill_directory = settings.GC_SPILL_PATH
+    os.makedirs(spill_directory, exist_ok=True)
+    cutoff = time.time() - grace_period
+
+    # Mark: collect the referenced names, spilling to sorted runs if there are too many
+    references = SortedSpill(spill_threshold, spill_directory)
+    referenced_count = 0
+    for name in iter_referenced_names():
+        references.add(name)
+        referenced_count += 1
+
+    report = {
+        'referenced': referenced_count,
+        'scanned': 0,
+        'orphans': 0,
+        'bytes_reclaimed': 0,
+        'action': 'none' if dry_run else ('quarantine' if quarantine else 'delete'),
+        'spilled': references.spilled,
+        'errors': 0,
+    }
+
+    def candidates():
+        for blob in storage.iter_objects():
+            report['scanned'] += 1
+            if blob.modified < cutoff:
+                yield blob
+
+    # Sweep
+    try:
+        if references.spilled:
+            orphans = _iter_orphans_spilled(references, candidates(), spill_threshold, spill_directory)
+        else:
+            orphans = _iter_orphans_in_memory(references, candidates())
+
+        # Deleted in batches with the sizes from the listing (one DeleteObjects per batch on S3)
+        pending = {}
+
+        def flush():
+            try:
+                report['bytes_reclaimed'] += storage.delete_many(list(pending), pending)
+            except OSError:
+                report['errors'] += len(pending)
+            pending.clear()
+
+        for name, size, mtime in orphans:
+            report['orphans'] += 1
+            if dry_run:
+                report['bytes_reclaimed'] += size
+                continue
+
+            limiter.acquire()
+            if not quarantine:
+                pending[name] = size
+                if len(pending) >= GC_DELETE_BATCH:
+                    flush()
+                continue
+            try:
+                storage.quarantine(name)
+                report['bytes_reclaimed'] += size
+            except OSError:
+                report['errors'] += 1
+        if pending:
+            flush()
+    finally:
+        references.close()
+
+    return report
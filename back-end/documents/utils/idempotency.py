@@ -0,0 +1,148 @@
+"""Idempotency-Key support for POST handlers that create things (uploads, shares, comments).
+
+A client that retries a request with the same Idempotency-Key header gets the
+response of the first attempt replayed (`Idempotent-Replayed: true`) instead
+of a second file, share or comment. Keys are scoped to the user and kept in
+`idempotency_keys` for IDEMPOTENCY_KEY_TTL:
+
+- the first request inserts the key as a lock (unique _id), runs, and stores
+  its fingerprint and response;
+- a duplicate while the first one runs gets a 409, retry later;
+- a duplicate afterwards gets the stored response, or a 422 if the key was
+  reused for a different request.
+
+Only successful responses are kept: after an error the key is released and a
+retry runs again. A lock left by a dead worker is taken over once
+IDEMPOTENCY_LOCK_TIMEOUT has passed.
+"""
+import functools
+import hashlib
+import json
+import uuid
+from datetime import datetime, timedelta
+
+from bson.errors import InvalidDocument
+from django.conf import settings
+from pymongo.errors import DuplicateKeyError
+from rest_framework import status
+from rest_framework.response import Response
+
+from .mongodb import get_collection
+
+KEYS = 'idempotency_keys'
+MAX_KEY_LENGTH = 255
+REPLAYED_HEADERS = ('Location', 'ETag')
+
+
+def fingerprint(request):
+    """Hash of what the request asks for: method, path and body.
+
+    Uploaded files count by name and size, their content is not read again.
+    """
+    data = request.data
+    fields = {}
+    for name in sorted(data.keys()):
+        values = data.getlist(name) if hasattr(data, 'getlist') else [data[name]]
+        fields[name] = [
+            ['file', value.name, value.size] if hasattr(value, 'size') and hasattr(value, 'name') else value
+            for value in values
+        ]
+    payload = json.dumps([request.method, request.path, fields], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _acquire(key_id, user_id, key):
+    """Lock the key for this request, returns (lock token, None) or (None, existing record)."""
+    collection = get_collection(KEYS)
+    now = datetime.now()
+    token = str(uuid.uuid4())
+    lock = {'lock': token, 'locked_until': now + timedelta(seconds=settings.IDEMPOTENCY_LOCK_TIMEOUT)}
+    try:
+        collection.insert_one({
+            '_id': key_id,
+            'user_id': user_id,
+            'key': key,
+            'status': 'processing',
+            **lock,
+            'created_at': now,
+            'expires_at': now + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL),
+        })
+        return token, None
+    except DuplicateKeyError:
+        pass
+    # The worker holding an expired lock is gone: the first retry to get here takes over
+    taken = collection.find_one_and_update(
+        {'_id': key_id, 'status': 'processing', 'locked_until': {'$lt': now}}, {'$set': lock}
+    )
+    if taken:
+        return token, None
+    return None, collection.find_one({'_id': key_id})
+
+
+def _complete(key_id, token, request, response):
+    collection = get_collection(KEYS)
+    if response.status_code >= 300:
+        # Nothing was created, a retry may run again
+        collection.delete_one({'_id': key_id, 'lock': token})
+        return
+    try:
+        collection.update_one({'_id': key_id, 'lock': token}, {
+            '$set': {
+                'status': 'completed',
+                'fingerprint': fingerprint(request),
+                'response': {
+                    'status': response.status_code,
+                    'data': response.data,
+                    'headers': {name: response[name] for name in REPLAYED_HEADERS if response.has_header(name)},
+                },
+            },
+            '$unset': {'lock': '', 'locked_until': ''},
+        })
+    except InvalidDocument:
+        collection.delete_one({'_id': key_id, 'lock': token})
+
+
+def _replay(record, request):
+    if record is None:
+        # Expired or released between the insert and the read
+        return Response({'detail': 'Please retry the request.'}, status=status.HTTP_409_CONFLICT,
+                        headers={'Retry-After': '1'})
+    if record['status'] != 'completed':
+        return Response({'detail': 'A request with this Idempotency-Key is in progress.'},
+                        status=status.HTTP_409_CONFLICT, headers={'Retry-After': '1'})
+    if record['fingerprint'] != fingerprint(request):
+        return Response({'detail': 'This Idempotency-Key was used for a different request.'},
+                        status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+    stored = record['response']
+    response = Response(stored['data'], status=stored['status'], headers=stored.get('headers'))
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(view_method):
+    """Replay the first response to requests repeating its Idempotency-Key header."""
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.META.get('HTTP_IDEMPOTENCY_KEY')
+        if key is None:
+            return view_method(self, request, *args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return Response({'detail': f'Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        user_id = str(request.user.id)
+        key_id = f'{user_id}:{key}'
+        # Locked before the body is read: uploads keep checking their quota first
+        token, record = _acquire(key_id, user_id, key)
+        if token is None:
+            return _replay(record, request)
+        response = None
+        try:
+            response = view_method(self, request, *args, **kwargs)
+        finally:
+            if response is None:
+                get_collection(KEYS).delete_one({'_id': key_id, 'lock': token})
+            else:
+                _complete(key_id, token, request, response)
+        return response
+    return wrapper
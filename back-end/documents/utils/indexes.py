@@ -0,0 +1,81 @@
+from django.conf import settings
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+from .mongodb import get_collection
+
+# Indexes the raw pymongo views rely on, keep in sync with the `meta` of documents/models.py
+INDEXES = {
+    'documents': [
+        IndexModel([('is_trashed', ASCENDING), ('trashed_at', ASCENDING)], name='trash_retention'),
+        IndexModel([('purge_job', ASCENDING)], name='purge_job', sparse=True),
+    ],
+    'comments': [
+        # Comments of a file (parent_id None) or replies to a comment, newest first, keyset pages
+        IndexModel(
+            [('file_id', ASCENDING), ('parent_id', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)],
+            name='file_parent_created'
+        ),
+    ],
+    'retention_policies': [
+        IndexModel([('owner_id', ASCENDING), ('folder_id', ASCENDING)], name='owner_folder', unique=True),
+    ],
+    'notifications': [
+        # Feed and unread filter, newest first; _id breaks created_at ties for keyset pages
+        IndexModel(
+            [('user_id', ASCENDING), ('is_read', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)],
+            name='user_unread_created'
+        ),
+        # Hub polls: notifications created or merged into since the last one
+        IndexModel([('user_id', ASCENDING), ('updated_at', ASCENDING)], name='user_updated'),
+        IndexModel(
+            [('read_at', ASCENDING)], name='read_ttl',
+            expireAfterSeconds=settings.NOTIFICATION_READ_RETENTION_DAYS * 24 * 60 * 60,
+            partialFilterExpression={'is_read': True}
+        ),
+        # Open coalescing group, see utils/notifications.py
+        IndexModel(
+            [('coalesce_key', ASCENDING)], name='coalesce_key', unique=True,
+            partialFilterExpression={'coalesce_key': {'$exists': True}}
+        ),
+    ],
+    'notification_preferences': [
+        IndexModel([('digest', ASCENDING)], name='digest', sparse=True),
+    ],
+    'notification_digest_queue': [
+        IndexModel([('user_id', ASCENDING), ('created_at', ASCENDING)], name='user_created'),
+    ],
+    'email_outbox': [
+        IndexModel([('status', ASCENDING), ('batch_key', ASCENDING), ('next_attempt_at', ASCENDING)],
+                   name='status_batch_due'),
+        IndexModel([('claim', ASCENDING)], name='claim', sparse=True),
+    ],
+    'changes': [
+        IndexModel([('user_id', ASCENDING), ('seq', ASCENDING)], name='user_seq', unique=True),
+        IndexModel([('user_id', ASCENDING), ('kind', ASCENDING), ('object_id', ASCENDING), ('seq', ASCENDING)],
+                   name='user_object'),
+        IndexModel([('at', ASCENDING)], name='at'),
+    ],
+    'chunk_sync_sessions': [
+        IndexModel([('expires_at', ASCENDING)], name='expires_ttl', expireAfterSeconds=0),
+    ],
+    'chunk_sync_chunks': [
+        IndexModel([('session_id', ASCENDING), ('hash', ASCENDING)], name='session_hash', unique=True),
+        IndexModel([('created_at', ASCENDING)], name='created_ttl',
+                   expireAfterSeconds=settings.CHUNK_SYNC_SESSION_TTL),
+    ],
+    'idempotency_keys': [
+        IndexModel([('expires_at', ASCENDING)], name='expires_ttl', expireAfterSeconds=0),
+    ],
+    'integrity_reports': [
+        IndexModel([('file_id', ASCENDING), ('version_id', ASCENDING)], name='file_version', unique=True),
+        IndexModel([('status', ASCENDING), ('last_seen_at', DESCENDING)], name='status_last_seen'),
+    ],
+}
+
+
+def ensure_indexes():
+    """Create missing indexes, returns the index names per collection."""
+    created = {}
+    for collection_name, indexes in INDEXES.items():
+        created[collection_name] = get_collection(collection_name).create_indexes(indexes)
+    return created
@@ -0,0 +1,315 @@
+import hashlib
+import itertools
+import os
+import threading
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import magic
+from bson import ObjectId
+from django.conf import settings
+
+from .cache import bump_for_files, bump_for_folder
+from .jobs import record_job_progress, set_job_total
+from .mongodb import get_collection
+from .quotas import Reservation
+from ..storage import get_storage
+from .compression import choose_encoding, encode_chunks, open_content
+
+# libmagic only looks at the head of a file, no need to read it whole
+MAGIC_SAMPLE_SIZE = 8192
+
+_local = threading.local()
+
+
+def _mime_detector():
+    # magic.Magic handles are not thread safe, keep one per worker thread
+    detector = getattr(_local, 'mime', None)
+    if detector is None:
+        detector = _local.mime = magic.Magic(mime=True)
+    return detector
+
+
+def categorize_mime(mime_type):
+    if mime_type.startswith('image/'):
+        return 'image'
+    if mime_type.startswith('video/'):
+        return 'video'
+    if mime_type == 'application/pdf':
+        return 'pdf'
+    return 'other'
+
+
+def detect_category(sample):
+    return categorize_mime(_mime_detector().from_buffer(sample))
+
+
+def detect_file_category(stored_name, encoding=None):
+    with open_content(stored_name, encoding) as f:
+        return detect_category(f.read(MAGIC_SAMPLE_SIZE))
+
+
+def unique_filename(original_name):
+    return f"{uuid.uuid4()}{os.path.splitext(original_name)[1]}"
+
+
+def new_checksum():
+    return hashlib.sha256()
+
+
+def format_checksum(digest):
+    return f'sha256:{digest.hexdigest()}'
+
+
+# Storage fields recorded on a file and on each of its versions
+BLOB_FIELDS = ('checksum', 'encoding', 'stored_size', 'delta_base')
+
+
+def blob_fields(source):
+    return {field: source.get(field) for field in BLOB_FIELDS}
+
+
+def write_blob(stored_name, chunks):
+    """Write chunks to the document store, returns the blob fields to record on the version.
+
+    The head of the stream is probed to decide whether the blob is stored
+    zstd-compressed; the checksum is always computed on the original bytes.
+    """
+    chunks = iter(chunks)
+    head, sampled = [], 0
+    for chunk in chunks:
+        head.append(chunk)
+        sampled += len(chunk)
+        if sampled >= settings.STORAGE_COMPRESSION_SAMPLE_SIZE:
+            break
+    encoding = choose_encoding(b''.join(head)[:settings.STORAGE_COMPRESSION_SAMPLE_SIZE])
+    digest = new_checksum()
+
+    def hashed(chunks):
+        for chunk in chunks:
+            digest.update(chunk)
+            yield chunk
+
+    stored_size = get_storage().save(stored_name, encode_chunks(hashed(itertools.chain(head, chunks)), encoding))
+    return {'checksum': format_checksum(digest), 'encoding': encoding, 'stored_size': stored_size}
+
+
+def store_upload(uploaded_file):
+    """Stream an UploadedFile into the document store, returns (stored name, blob fields)."""
+    stored_name = unique_filename(uploaded_file.name)
+    return stored_name, write_blob(stored_name, uploaded_file.chunks())
+
+
+def build_file_document(user, original_filename, stored_name, size, category, blob=None,
+                        title=None, description='', tags=None, folder=None, now=None):
+    now = now or datetime.now()
+    blob = blob_fields(blob or {})
+    return {
+        "_id": ObjectId(),
+        "title": title or os.path.splitext(os.path.basename(original_filename))[0],
+        "type": category,
+        "description": description,
+        "author": f"{user.first_name} {user.last_name}".strip() or user.username,
+        "tags": tags or [],
+        "file_path": stored_name,
+        "original_filename": original_filename,
+        "size": size,
+        **blob,
+        "owner_id": str(user.id),
+        "folder": folder,
+        "uploaded_at": now,
+        "updated_at": now,
+        "last_opened": now,
+        "is_favorite": False,
+        "is_trashed": False,
+        "permissions": [],
+        "revision": 1,
+        "version_seq": 1,
+        "versions": [{
+            "id": str(uuid.uuid4()),
+            "file_path": stored_name,
+            "version_number": 1,
+            "size": size,
+            **blob,
+            "created_at": now,
+            "created_by": str(user.id)
+        }],
+        "comment_count": 0,
+        "activities": [{
+            "id": str(uuid.uuid4()),
+            "user_id": str(user.id),
+            "action": "upload",
+            "timestamp": now,
+            "details": {"original_filename": original_filename}
+        }]
+    }
+
+
+def stage_archive(uploaded_file):
+    """Copy an uploaded archive out of Django's temp storage before the request ends."""
+    staging_path = settings.UPLOAD_STAGING_PATH
+    os.makedirs(staging_path, exist_ok=True)
+    path = os.path.join(staging_path, f"{uuid.uuid4()}.zip")
+    with open(path, 'wb+') as destination:
+        for chunk in uploaded_file.chunks():
+            destination.write(chunk)
+    return path
+
+
+def _safe_member_parts(name):
+    """Split a zip member name into path parts, rejecting absolute or escaping paths."""
+    parts = [p for p in name.replace('\\', '/').split('/') if p not in ('', '.')]
+    if not parts or name.startswith('/') or '..' in parts or parts[0] == '__MACOSX':
+        return None
+    if parts[-1].startswith('._') or parts[-1] == '.DS_Store':
+        return None
+    return parts
+
+
+class FolderTree:
+    """Creates (or reuses) the folders implied by archive member paths."""
+
+    def __init__(self, owner_id, root_folder=None):
+        self.owner_id = owner_id
+        self.root = ObjectId(root_folder) if root_folder else None
+        self.collection = get_collection('folders')
+        self._cache = {(): self.root}
+
+    def folder_for(self, dir_parts):
+        key = tuple(dir_parts)
+        if key in self._cache:
+            return self._cache[key]
+
+        parent = self.folder_for(dir_parts[:-1])
+        name = dir_parts[-1]
+        existing = self.collection.find_one({
+            'name': name,
+            'owner_id': self.owner_id,
+            'parent_folder': parent,
+            'is_trashed': False
+        }, {'_id': 1})
+        if existing:
+            folder_id = existing['_id']
+        else:
+            now = datetime.now()
+            folder = {
+                'name': name,
+                'owner_id': self.owner_id,
+                'parent_folder': parent,
+                'created_at': now,
+                'updated_at': now,
+                'is_trashed': False,
+                'permissions': []
+            }
+            folder_id = self.collection.insert_one(folder).inserted_id
+            bump_for_folder(folder)
+        self._cache[key] = folder_id
+        return folder_id
+
+
+def extract_archive(archive_path, owner_id, root_folder=None):
+    """Extract a staged zip into the document store, one folder per directory."""
+    entries = []
+    max_members = settings.UPLOAD_ARCHIVE_MAX_MEMBERS
+    max_size = settings.UPLOAD_ARCHIVE_MAX_SIZE
+    tree = FolderTree(owner_id, root_folder)
+
+    with zipfile.ZipFile(archive_path) as archive:
+        members = [m for m in archive.infolist() if not m.is_dir()]
+        if len(members) > max_members:
+            raise ValueError(f'Archive has more than {max_members} files.')
+        if sum(m.file_size for m in members) > max_size:
+            raise ValueError('Archive is too large once extracted.')
+
+        # Hold the extracted size on the owner's quota before writing anything
+        with Reservation(owner_id, sum(m.file_size for m in members)) as reservation:
+            for member in members:
+                parts = _safe_member_parts(member.filename)
+                if parts is None:
+                    entries.append({'name': member.filename, 'error': 'Skipped unsafe or hidden entry.'})
+                    continue
+
+                folder_id = tree.folder_for(parts[:-1])
+                stored_name = unique_filename(parts[-1])
+                with archive.open(member) as src:
+                    blob = write_blob(stored_name, iter(lambda: src.read(1024 * 1024), b''))
+
+                entries.append({
+                    'name': '/'.join(parts),
+                    'original_filename': parts[-1],
+                    'file_path': stored_name,
+                    'size': member.file_size,
+                    **blob,
+                    'folder': str(folder_id) if folder_id else None,
+                })
+            reservation.settle(sum(entry.get('stored_size') or 0 for entry in entries))
+    return entries
+
+
+def _classify(entry):
+    if entry.get('error'):
+        return entry
+    try:
+        entry['type'] = detect_file_category(entry['file_path'], entry.get('encoding'))
+    except Exception as e:
+        entry['error'] = f'Could not read stored file: {e}'
+    return entry
+
+
+def _flush_batch(job_id, collection, batch, manifest, failed):
+    if batch:
+        collection.insert_many(batch, ordered=False)
+        bump_for_files(*batch)
+    if manifest:
+        record_job_progress(job_id, manifest, done=len(manifest) - failed, failed=failed)
+    return len(batch)
+
+
+def ingest_entries(job_id, user, entries, tags=None, description=''):
+    """Classify stored files in a worker pool and insert their metadata in batches."""
+    set_job_total(job_id, len(entries))
+    collection = get_collection('documents')
+    batch_size = settings.UPLOAD_INSERT_BATCH_SIZE
+    created = failed = 0
+    now = datetime.now()
+
+    with ThreadPoolExecutor(max_workers=settings.UPLOAD_CLASSIFY_WORKERS) as pool:
+        batch, manifest, batch_failed = [], [], 0
+        for entry in pool.map(_classify, entries):
+            if entry.get('error'):
+                batch_failed += 1
+                manifest.append({'name': entry['name'], 'status': 'failed', 'error': entry['error']})
+            else:
+                document = build_file_document(
+                    user, entry['original_filename'], entry['file_path'], entry['size'],
+                    entry['type'], blob=entry, tags=tags, description=description,
+                    folder=entry.get('folder'), now=now
+                )
+                batch.append(document)
+                manifest.append({
+                    'name': entry['name'],
+                    'status': 'created',
+                    'id': str(document['_id']),
+                    'type': entry['type'],
+                    'size': entry['size'],
+                })
+
+            if len(manifest) >= batch_size:
+                created += _flush_batch(job_id, collection, batch, manifest, batch_failed)
+                failed += batch_failed
+                batch, manifest, batch_failed = [], [], 0
+
+        created += _flush_batch(job_id, collection, batch, manifest, batch_failed)
+        failed += batch_failed
+
+    return {'created': created, 'failed': failed}
+
+
+def ingest_archive(job_id, user, archive_path, folder=None, tags=None, description=''):
+    try:
+        entries = extract_archive(archive_path, str(user.id), folder)
+    finally:
+        os.remove(archive_path)
+    return ingest_entries(job_id, user, entries, tags=tags, description=description)
@@ -0,0 +1,149 @@
+import logging
+import os
+import threading
+import traceback
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from django.conf import settings
+
+from .mongodb import get_collection
+
+logger = logging.getLogger(__name__)
+
+# Jobs resumed by their own sweep instead of being failed (trash.resume_stalled_purges)
+RESUMABLE_KINDS = ('empty_trash', 'trash_retention')
+
+
+def create_job(kind, owner_id, params=None, staged_files=None):
+    """Register a background job so its progress can be polled via /jobs/<id>/.
+
+    staged_files are the temporary files the job consumes, deleted by
+    fail_stale_jobs if the job never finishes.
+    """
+    now = datetime.now()
+    job = {
+        '_id': ObjectId(),
+        'kind': kind,
+        'owner_id': owner_id,
+        'status': 'queued',
+        'params': params or {},
+        'progress': {'total': 0, 'done': 0, 'failed': 0},
+        'manifest': [],
+        'staged_files': staged_files or [],
+        'result': None,
+        'error': None,
+        'created_at': now,
+        'updated_at': now,
+        'started_at': None,
+        'finished_at': None,
+    }
+    get_collection('jobs').insert_one(job)
+    return job
+
+
+def set_job_total(job_id, total):
+    get_collection('jobs').update_one(
+        {'_id': job_id},
+        {'$set': {'progress.total': total, 'updated_at': datetime.now()}}
+    )
+
+
+def record_job_progress(job_id, entries=None, done=0, failed=0):
+    """Advance the counters and append per-item results to the job manifest."""
+    update = {
+        '$inc': {'progress.done': done, 'progress.failed': failed},
+        '$set': {'updated_at': datetime.now()},
+    }
+    if entries:
+        update['$push'] = {'manifest': {'$each': entries}}
+    get_collection('jobs').update_one({'_id': job_id}, update)
+
+
+def finish_job(job_id, result=None, error=None, error_traceback=None):
+    now = datetime.now()
+    get_collection('jobs').update_one(
+        {'_id': job_id},
+        {'$set': {
+            'status': 'failed' if error else 'completed',
+            'result': result,
+            'error': error,
+            'traceback': error_traceback,
+            'updated_at': now,
+            'finished_at': now,
+        }}
+    )
+
+
+def _heartbeat(job_id, stop):
+    # updated_at moves while the worker is alive, even through long steps without progress
+    while not stop.wait(settings.JOB_HEARTBEAT_INTERVAL):
+        get_collection('jobs').update_one(
+            {'_id': job_id, 'status': 'running'}, {'$set': {'updated_at': datetime.now()}}
+        )
+
+
+def run_job(job_id, target, *args, **kwargs):
+    """Run target(job_id, ...) and record its outcome on the job document."""
+    get_collection('jobs').update_one(
+        {'_id': job_id},
+        {'$set': {'status': 'running', 'started_at': datetime.now(), 'updated_at': datetime.now()}}
+    )
+    stop = threading.Event()
+    threading.Thread(target=_heartbeat, args=(job_id, stop), name=f'job-{job_id}-heartbeat', daemon=True).start()
+    try:
+        result = target(job_id, *args, **kwargs)
+    except Exception as e:
+        logger.exception('Job %s failed', job_id)
+        finish_job(job_id, error=str(e), error_traceback=traceback.format_exc())
+        return None
+    finally:
+        stop.set()
+    finish_job(job_id, result=result)
+    return result
+
+
+def start_job(job_id, target, *args, **kwargs):
+    """Run a job on a daemon thread so the request can return immediately."""
+    thread = threading.Thread(
+        target=run_job,
+        args=(job_id, target) + args,
+        kwargs=kwargs,
+        name=f'job-{job_id}',
+        daemon=True,
+    )
+    thread.start()
+    return thread
+
+
+def fail_stale_jobs(stale_after=None):
+    """Fail the jobs whose worker died (no heartbeat for JOB_STALE_AFTER) and delete their staged files.
+
+    Returns the number of jobs failed.
+    """
+    stale_after = stale_after or timedelta(seconds=settings.JOB_STALE_AFTER)
+    collection = get_collection('jobs')
+    stale = {
+        'kind': {'$nin': list(RESUMABLE_KINDS)},
+        'status': {'$in': ['queued', 'running']},
+        'updated_at': {'$lte': datetime.now() - stale_after}
+    }
+    failed = 0
+    for job in collection.find(stale, {'staged_files': 1}):
+        now = datetime.now()
+        # Conditional: a worker that is alive after all keeps its job
+        result = collection.update_one({**stale, '_id': job['_id']}, {'$set': {
+            'status': 'failed',
+            'error': 'Interrupted, the worker running the job stopped.',
+            'updated_at': now,
+            'finished_at': now,
+        }})
+        if not result.modified_count:
+            continue
+        failed += 1
+        for path in job.get('staged_files') or []:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+    return failed
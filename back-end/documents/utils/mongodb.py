@@ -0,0 +1,49 @@
+import asyncio
+import weakref
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from pymongo import MongoClient
+
+try:
+    from motor.motor_asyncio import AsyncIOMotorClient
+except ImportError:  # optional dependency, only needed by the async views (masterdrive/asgi.py)
+    AsyncIOMotorClient = None
+
+_client = None
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_client():
+    """Return the process-wide MongoClient (pymongo pools connections itself)."""
+    global _client
+    if _client is None:
+        _client = MongoClient(settings.MONGO_CLIENT['URI'])
+    return _client
+
+
+def get_db():
+    return get_client()[settings.MONGO_CLIENT['DB_NAME']]
+
+
+def get_collection(name, codec_options=None):
+    return get_db().get_collection(name, codec_options=codec_options)
+
+
+def get_async_client():
+    """Return the motor client of the running event loop (a motor client is bound to one loop)."""
+    if AsyncIOMotorClient is None:
+        raise ImproperlyConfigured('The async views need motor: pip install motor')
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = AsyncIOMotorClient(settings.MONGO_CLIENT['URI'], io_loop=loop)
+    return client
+
+
+def get_async_db():
+    return get_async_client()[settings.MONGO_CLIENT['DB_NAME']]
+
+
+def get_async_collection(name, codec_options=None):
+    return get_async_db().get_collection(name, codec_options=codec_options)
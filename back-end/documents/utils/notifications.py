@@ -0,0 +1,330 @@
+"""Notification writes, unread counters and push (GET /api/v1/notifications/stream/, ASGI only).
+
+The unread badge reads a per-user counter (notification_counters) instead of
+counting: create_notification and mark_read move it by what they inserted or
+modified, reconcile_unread recomputes it from the notifications.
+
+Noisy events (comments, edits, new versions) are coalesced: the events of one
+type on one file for one recipient within NOTIFICATION_COALESCE_WINDOW are
+merged into a single unread notification with a `count`. Users who chose a
+digest get them summarised periodically instead (send_notification_digests).
+
+Each process runs one NotificationHub per event loop. It polls Mongo for the
+new and merged notifications (updated_at) of all its connected users at once, one query per
+NOTIFICATION_STREAM_POLL_INTERVAL whatever the number of connections, and
+fans them out to the streams. create_notification() wakes the hubs of its own
+process right away, the other processes pick the notification up at their
+next poll.
+"""
+import asyncio
+import traceback
+import weakref
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from .. import queries
+from .mongodb import get_async_collection, get_collection
+from .outbox import enqueue_digest_email, enqueue_notification_email
+
+COUNTERS = 'notification_counters'
+PREFERENCES = 'notification_preferences'
+DIGEST_QUEUE = 'notification_digest_queue'
+
+# Notifications written by another process may get an updated_at a little
+# older than the last poll (clock, write latency): polls overlap by this much
+# and streams drop the notifications they already sent.
+POLL_OVERLAP = timedelta(seconds=5)
+
+_hubs = weakref.WeakKeyDictionary()
+
+
+def create_notification(notification, coalesce=False, grouped_message=None):
+    """Insert a notification and push it to the user's open streams.
+
+    With coalesce=True the notification is merged into the recipient's unread
+    one of the same type and file from the current window, if any, or queued
+    for their digest. grouped_message is the message of a merged notification,
+    '{count}' is replaced by the number of events.
+    """
+    if coalesce and get_digest_frequency(notification['user_id']):
+        # Emailed with the digest too, not event by event
+        get_collection(DIGEST_QUEUE).insert_one(notification)
+        return notification
+    # Other events are emailed each, the outbox batches them per recipient
+    enqueue_notification_email(notification)
+    # Streams poll on updated_at: merged events move it, a new _id does not
+    notification['updated_at'] = datetime.now()
+    if coalesce:
+        notification = _coalesce(notification, grouped_message)
+        if notification['count'] > 1:
+            # The group is already unread and counted, its new count still goes to the streams
+            _wake(notification['user_id'])
+            return notification
+    else:
+        get_collection('notifications').insert_one(notification)
+    if not notification.get('is_read'):
+        _increment_unread(notification['user_id'], 1)
+    _wake(notification['user_id'])
+    return notification
+
+
+def _wake(user_id):
+    for loop, hub in list(_hubs.items()):
+        if user_id in hub.subscriptions and not loop.is_closed():
+            loop.call_soon_threadsafe(hub.wake)
+
+
+def _coalesce(notification, grouped_message):
+    """Upsert the notification into its group, returns the group's document."""
+    window = settings.NOTIFICATION_COALESCE_WINDOW
+    # Fixed windows keep the key deterministic, the unique index makes the upsert atomic
+    key = ':'.join((
+        notification['user_id'], notification['type'], str(notification.get('file')),
+        str(int(notification['created_at'].timestamp() // window))
+    ))
+    fields = {k: v for k, v in notification.items() if k not in ('message', 'created_at', 'updated_at', 'details')}
+    update = {
+        '$set': {
+            'message': notification['message'],
+            'created_at': notification['created_at'],  # latest event, moves the group up the feed
+            'updated_at': notification['updated_at'],
+            'details': notification.get('details', {}),
+        },
+        '$inc': {'count': 1},
+        '$setOnInsert': {**fields, 'is_read': False, 'first_created_at': notification['created_at']},
+    }
+    collection = get_collection('notifications')
+    try:
+        group = collection.find_one_and_update(
+            {'coalesce_key': key}, update, upsert=True, return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        # Two first events raced on the insert, the loser merges into the winner
+        group = collection.find_one_and_update(
+            {'coalesce_key': key}, update, upsert=True, return_document=ReturnDocument.AFTER
+        )
+    if group['count'] > 1 and grouped_message:
+        message = grouped_message.replace('{count}', str(group['count']))
+        # Conditional: a later event may already have set a larger count
+        collection.update_one({'_id': group['_id'], 'count': group['count']},
+                              {'$set': {'message': message, 'updated_at': datetime.now()}})
+        group['message'] = message
+    return group
+
+
+def _increment_unread(user_id, amount):
+    get_collection(COUNTERS).update_one({'_id': user_id}, {'$inc': {'unread': amount}}, upsert=True)
+
+
+def mark_read(user_id, notification_ids=None):
+    """Mark the given notifications (all of them with None) read, returns how many were unread."""
+    query = {'user_id': user_id, 'is_read': False}
+    if notification_ids is not None:
+        query['_id'] = {'$in': notification_ids}
+    result = get_collection('notifications').update_many(
+        query,
+        # A read group is closed, the next event starts a new one
+        {'$set': {'is_read': True, 'read_at': datetime.now()}, '$unset': {'coalesce_key': ''}}
+    )
+    # Each notification is switched by one request only, so the counter stays exact
+    if result.modified_count:
+        _increment_unread(user_id, -result.modified_count)
+    return result.modified_count
+
+
+def _unread(counter):
+    # Transiently negative when a notification is read before its creator counted it
+    return max(counter['unread'], 0) if counter else 0
+
+
+def get_unread_count(user_id):
+    return _unread(get_collection(COUNTERS).find_one({'_id': user_id}))
+
+
+async def aget_unread_count(user_id):
+    return _unread(await get_async_collection(COUNTERS).find_one({'_id': user_id}))
+
+
+def reconcile_unread(user_id=None):
+    """Recompute the counters from the notifications, returns the (user_id, before, after) fixed."""
+    match = {'is_read': False}
+    if user_id:
+        match['user_id'] = user_id
+    actual = {
+        row['_id']: row['unread']
+        for row in get_collection('notifications').aggregate([
+            {'$match': match},
+            {'$group': {'_id': '$user_id', 'unread': {'$sum': 1}}},
+        ])
+    }
+    counters = get_collection(COUNTERS)
+    stored = {c['_id']: c['unread'] for c in counters.find({'_id': user_id} if user_id else {})}
+    fixes = []
+    for uid in sorted(set(actual) | set(stored)):
+        before, after = stored.get(uid, 0), actual.get(uid, 0)
+        if before != after:
+            # $inc by the difference, notifications written meanwhile are not lost
+            counters.update_one({'_id': uid}, {'$inc': {'unread': after - before}}, upsert=True)
+            fixes.append((uid, before, after))
+    return fixes
+
+
+def get_digest_frequency(user_id):
+    """'hourly' / 'daily' when the user gets noisy notifications as a digest, None otherwise."""
+    preferences = get_collection(PREFERENCES).find_one({'_id': user_id}, {'digest': 1})
+    return preferences.get('digest') if preferences else None
+
+
+def set_digest_frequency(user_id, frequency):
+    get_collection(PREFERENCES).update_one(
+        {'_id': user_id},
+        {'$set': {'digest': frequency}, '$setOnInsert': {'last_digest_at': datetime.now()}},
+        upsert=True
+    )
+    if frequency is None:
+        send_digests(user_id, force=True)  # nothing stays queued
+
+
+def _digest_message(events):
+    counts = {}
+    for event in events:
+        counts[event['type']] = counts.get(event['type'], 0) + 1
+    files = {str(event['file']) for event in events if event.get('file')}
+    parts = [f"{count} {kind}{'s' if count > 1 else ''}" for kind, count in sorted(counts.items())]
+    message = ', '.join(parts)
+    if files:
+        message += f" on {len(files)} file{'s' if len(files) > 1 else ''}"
+    return message, {'counts': counts, 'files': sorted(files)}
+
+
+def send_digests(user_id=None, force=False):
+    """Turn the queued events of every user whose digest is due into one notification each.
+
+    Returns the number of digests created.
+    """
+    now = datetime.now()
+    query = {'_id': user_id} if user_id else {'digest': {'$in': list(settings.NOTIFICATION_DIGEST_INTERVALS)}}
+    queue = get_collection(DIGEST_QUEUE)
+    sent = 0
+    for preferences in get_collection(PREFERENCES).find(query):
+        interval = settings.NOTIFICATION_DIGEST_INTERVALS.get(preferences.get('digest'))
+        last = preferences.get('last_digest_at')
+        if not force and (interval is None or (last and now - last < timedelta(seconds=interval))):
+            continue
+        events = list(queue.find({'user_id': preferences['_id']}).sort('created_at', 1))
+        get_collection(PREFERENCES).update_one({'_id': preferences['_id']}, {'$set': {'last_digest_at': now}})
+        if not events:
+            continue
+        message, details = _digest_message(events)
+        if any(event['type'] in settings.NOTIFICATION_EMAIL_TYPES for event in events):
+            enqueue_digest_email(preferences['_id'], f'Digest: {message}')
+        create_notification({
+            'user_id': preferences['_id'],
+            'type': 'system',
+            'message': f'Digest: {message}',
+            'file': None,
+            'created_at': now,
+            'is_read': False,
+            'details': details
+        })
+        # Only what was summarised, events queued meanwhile go to the next digest
+        queue.delete_many({'_id': {'$in': [event['_id'] for event in events]}})
+        sent += 1
+    return sent
+
+
+class Subscription:
+    """One open stream. Its queue is bounded: a client too slow to keep up is disconnected
+    rather than buffered, it reconnects with Last-Event-ID and resumes from Mongo."""
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.queue = asyncio.Queue(maxsize=settings.NOTIFICATION_STREAM_BUFFER)
+        self.sent = {}  # (id, count) already queued, oldest first
+        self.overflowed = False
+
+    def deliver(self, notification):
+        # A merged notification comes back with a higher count, that is news
+        key = (notification['id'], notification.get('count', 1))
+        if self.overflowed or key in self.sent:
+            return
+        try:
+            self.queue.put_nowait(notification)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            return
+        self.sent[key] = None
+        if len(self.sent) > 2 * settings.NOTIFICATION_STREAM_BUFFER:
+            del self.sent[next(iter(self.sent))]
+
+    async def next(self, timeout):
+        """Next notification, None after `timeout` seconds without one."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    @property
+    def closed(self):
+        return self.overflowed and self.queue.empty()
+
+
+class NotificationHub:
+
+    def __init__(self):
+        self.subscriptions = {}  # user_id -> set of Subscription
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def wake(self):
+        self._wakeup.set()
+
+    async def subscribe(self, user_id, last_event_id=None):
+        """Register a stream, queued with what it missed since last_event_id."""
+        subscription = Subscription(user_id)
+        # Registered before reading the backlog, so nothing falls in between
+        self.subscriptions.setdefault(user_id, set()).add(subscription)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        if last_event_id is not None:
+            backlog = queries.notifications_after(user_id, last_event_id, settings.NOTIFICATION_STREAM_BACKLOG)
+            for notification in await queries.afetch(backlog):
+                subscription.deliver(notification)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        subscriptions = self.subscriptions.get(subscription.user_id)
+        if subscriptions is not None:
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self.subscriptions[subscription.user_id]
+
+    async def _run(self):
+        since = datetime.now() - POLL_OVERLAP
+        while self.subscriptions:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), settings.NOTIFICATION_STREAM_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            started = datetime.now()
+            try:
+                for notification in await queries.afetch(queries.new_notifications(self.subscriptions, since)):
+                    for subscription in list(self.subscriptions.get(notification['user_id'], ())):
+                        subscription.deliver(notification)
+            except Exception:
+                traceback.print_exc()
+                continue
+            since = started - POLL_OVERLAP
+
+
+def get_hub():
+    """The hub of the running event loop."""
+    loop = asyncio.get_running_loop()
+    hub = _hubs.get(loop)
+    if hub is None:
+        hub = _hubs[loop] = NotificationHub()
+    return hub
@@ -0,0 +1,174 @@
+"""Email outbox: requests enqueue, `manage.py send_outbox` delivers.
+
+Requests only insert a document into email_outbox, so their latency no longer
+depends on the mail server. The sender claims due messages in batches, sends
+them over one connection of the configured EMAIL_BACKEND, at most
+EMAIL_OUTBOX_RATE per second, and retries failures with an exponential
+backoff until EMAIL_OUTBOX_MAX_ATTEMPTS.
+
+Messages enqueued with a batch_key (notification emails, one key per
+recipient) wait EMAIL_DIGEST_DELAY and everything queued under the key by
+then goes out as a single email.
+"""
+import uuid
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.mail import EmailMessage, get_connection
+
+from .mongodb import get_collection
+from .throttle import RateLimiter
+
+OUTBOX = 'email_outbox'
+PENDING, SENDING, SENT, FAILED = 'pending', 'sending', 'sent', 'failed'
+
+
+def enqueue_email(subject, body, to, from_email=None, batch_key=None):
+    """Queue an email, returns its outbox document."""
+    now = datetime.now()
+    message = {
+        'subject': subject,
+        'body': body,
+        'to': list(to),
+        'from_email': from_email or settings.DEFAULT_FROM_EMAIL,
+        'batch_key': batch_key,
+        'status': PENDING,
+        'attempts': 0,
+        'last_error': None,
+        'created_at': now,
+        'next_attempt_at': now + timedelta(seconds=settings.EMAIL_DIGEST_DELAY) if batch_key else now,
+        'claim': None,
+        'sent_at': None,
+    }
+    get_collection(OUTBOX).insert_one(message)
+    return message
+
+
+def enqueue_notification_email(notification):
+    """Email a share / comment notification, batched with the recipient's other ones."""
+    if notification['type'] not in settings.NOTIFICATION_EMAIL_TYPES:
+        return None
+    return _enqueue_for_user(notification['user_id'], 'Nouvelle notification', notification['message'])
+
+
+def enqueue_digest_email(user_id, message):
+    """Email a notification digest (send_digests), instead of one email per event."""
+    return _enqueue_for_user(user_id, 'Résumé de vos notifications', message)
+
+
+def _enqueue_for_user(user_id, subject, body):
+    user = get_user_model().objects.filter(id=user_id).only('email').first()
+    if user is None or not user.email:
+        return None
+    return enqueue_email(subject, body, [user.email], batch_key=f'notifications:{user_id}')
+
+
+def _claim(query, limit=None):
+    """Switch pending messages matching query to `sending` under a new claim id."""
+    collection = get_collection(OUTBOX)
+    cursor = collection.find({**query, 'status': PENDING}, {'_id': 1}).sort('next_attempt_at', 1)
+    if limit:
+        cursor = cursor.limit(limit)
+    ids = [message['_id'] for message in cursor]
+    if not ids:
+        return []
+    claim = uuid.uuid4().hex
+    # status in the filter: another sender claiming the same ids gets none of them twice
+    collection.update_many(
+        {'_id': {'$in': ids}, 'status': PENDING},
+        {'$set': {'status': SENDING, 'claim': claim, 'claimed_at': datetime.now()}}
+    )
+    return list(collection.find({'claim': claim}).sort('created_at', 1))
+
+
+def _digest(messages):
+    if len(messages) == 1:
+        return messages[0]['subject'], messages[0]['body']
+    body = '\n\n'.join(f"- {message['body']}" for message in messages)
+    return f'{len(messages)} nouvelles notifications', body
+
+
+def _mark_sent(ids):
+    get_collection(OUTBOX).update_many(
+        {'_id': {'$in': ids}}, {'$set': {'status': SENT, 'sent_at': datetime.now(), 'claim': None}}
+    )
+
+
+def _mark_failed(messages, error):
+    collection = get_collection(OUTBOX)
+    now = datetime.now()
+    for message in messages:
+        attempts = message['attempts'] + 1
+        if attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+            update = {'status': FAILED}
+        else:
+            delay = settings.EMAIL_OUTBOX_RETRY_DELAY * 2 ** (attempts - 1)
+            update = {'status': PENDING, 'next_attempt_at': now + timedelta(seconds=delay)}
+        collection.update_one(
+            {'_id': message['_id']},
+            {'$set': {**update, 'attempts': attempts, 'last_error': str(error), 'claim': None}}
+        )
+
+
+def requeue_stalled():
+    """Messages left in `sending` by a sender that died, returns how many."""
+    cutoff = datetime.now() - timedelta(seconds=settings.EMAIL_OUTBOX_CLAIM_TIMEOUT)
+    result = get_collection(OUTBOX).update_many(
+        {'status': SENDING, 'claimed_at': {'$lt': cutoff}},
+        {'$set': {'status': PENDING, 'claim': None}}
+    )
+    return result.modified_count
+
+
+def send_pending(batch_size=None, rate=None, connection=None):
+    """Send the due messages, returns {'sent': emails sent, 'failed': messages to retry or given up}.
+
+    Batched messages are grouped per batch_key, a group is due when its
+    oldest message is.
+    """
+    batch_size = batch_size or settings.EMAIL_OUTBOX_BATCH_SIZE
+    limiter = RateLimiter(settings.EMAIL_OUTBOX_RATE if rate is None else rate)
+    now = datetime.now()
+
+    groups = [[message] for message in _claim({'batch_key': None, 'next_attempt_at': {'$lte': now}}, batch_size)]
+    due_keys = get_collection(OUTBOX).distinct(
+        'batch_key', {'status': PENDING, 'batch_key': {'$ne': None}, 'next_attempt_at': {'$lte': now}}
+    )
+    for batch_key in due_keys[:batch_size]:
+        # Including the ones queued after the oldest, that is the point of the delay,
+        # but not failed ones still backing off
+        group = _claim({'batch_key': batch_key, '$or': [{'attempts': 0}, {'next_attempt_at': {'$lte': now}}]})
+        if group:
+            groups.append(group)
+
+    stats = {'sent': 0, 'failed': 0}
+    if not groups:
+        return stats
+    # One connection (one SMTP login) for the whole run
+    connection = connection or get_connection()
+    try:
+        connection.open()
+        for group in groups:
+            limiter.acquire()
+            subject, body = _digest(group)
+            email = EmailMessage(subject, body, group[0]['from_email'], group[0]['to'], connection=connection)
+            try:
+                email.send()
+            except Exception as e:
+                _mark_failed(group, e)
+                stats['failed'] += len(group)
+                # The server may have dropped us: reconnect for the next ones
+                connection.close()
+                connection.open()
+                continue
+            _mark_sent([message['_id'] for message in group])
+            stats['sent'] += 1
+    except Exception as e:
+        # Could not connect at all: everything still claimed goes back with a retry delay
+        leftover = list(get_collection(OUTBOX).find({'claim': {'$in': [g[0]['claim'] for g in groups]}}))
+        _mark_failed(leftover, e)
+        stats['failed'] += len(leftover)
+    finally:
+        connection.close()
+    return stats
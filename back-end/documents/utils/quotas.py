@@ -0,0 +1,205 @@
+import uuid
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from ..storage import get_storage
+from .mongodb import get_collection
+
+# One document per user in `quotas`, all amounts in stored bytes:
+#   limit      None for unlimited
+#   used       bytes of committed blobs (every version of every file, trash included)
+#   reserved   bytes held by uploads in progress, listed in `reservations`
+#   available  limit - used - reserved, kept up to date by every $inc so a
+#              reservation is a single conditional findOneAndUpdate
+
+
+class QuotaExceeded(Exception):
+    pass
+
+
+class InsufficientStorage(Exception):
+    pass
+
+
+def _collection():
+    return get_collection('quotas')
+
+
+def get_quota(user_id):
+    """The user's quota document, created with the default limit on first use."""
+    collection = _collection()
+    quota = collection.find_one({'_id': user_id})
+    if quota:
+        return quota
+    limit = settings.STORAGE_QUOTA_DEFAULT
+    try:
+        collection.insert_one({
+            '_id': user_id,
+            'limit': limit,
+            'used': 0,
+            'reserved': 0,
+            'available': limit if limit is not None else 0,
+            'reservations': [],
+            'updated_at': datetime.now(),
+        })
+    except DuplicateKeyError:
+        pass  # created by a concurrent request
+    return collection.find_one({'_id': user_id})
+
+
+def check_disk(amount):
+    """Reject a write that would push the storage volume past its high watermark."""
+    usage = get_storage().disk_usage()
+    if usage is None:
+        return  # object stores have no fixed capacity
+    total, used, free = usage
+    if used + amount > total * settings.STORAGE_DISK_HIGH_WATERMARK or free - amount < settings.STORAGE_DISK_MIN_FREE:
+        raise InsufficientStorage('The storage volume is almost full, try again later.')
+
+
+def reserve(user_id, amount):
+    """Hold `amount` bytes of the user's quota, returns the reservation id."""
+    get_quota(user_id)
+    reservation_id = str(uuid.uuid4())
+    quota = _collection().find_one_and_update(
+        {'_id': user_id, '$or': [{'limit': None}, {'available': {'$gte': amount}}]},
+        {
+            '$inc': {'reserved': amount, 'available': -amount},
+            '$push': {'reservations': {'id': reservation_id, 'amount': amount, 'created_at': datetime.now()}},
+            '$set': {'updated_at': datetime.now()},
+        },
+        projection={'_id': 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if not quota:
+        raise QuotaExceeded('Storage quota exceeded.')
+    return reservation_id
+
+
+def settle(user_id, reservation_id, amount, used=0):
+    """Turn a reservation into `used` bytes of usage (0 releases it)."""
+    result = _collection().update_one(
+        {'_id': user_id, 'reservations.id': reservation_id},
+        {
+            '$inc': {'reserved': -amount, 'used': used, 'available': amount - used},
+            '$pull': {'reservations': {'id': reservation_id}},
+            '$set': {'updated_at': datetime.now()},
+        }
+    )
+    if not result.matched_count and used:
+        # Reservation expired and reclaimed by reconcile_quotas meanwhile
+        adjust_usage(user_id, used)
+
+
+def adjust_usage(user_id, delta):
+    """Record bytes added (or freed, negative) outside of a reservation."""
+    if not user_id or not delta:
+        return
+    get_quota(user_id)
+    _collection().update_one(
+        {'_id': user_id},
+        {'$inc': {'used': delta, 'available': -delta}, '$set': {'updated_at': datetime.now()}}
+    )
+
+
+class Reservation:
+    """Quota held for one upload: settle() with the stored size, released otherwise."""
+
+    def __init__(self, user_id, amount):
+        self.user_id = user_id
+        self.amount = max(int(amount or 0), 0)
+        self.reservation_id = None
+
+    def acquire(self):
+        check_disk(self.amount)
+        self.reservation_id = reserve(self.user_id, self.amount)
+        return self
+
+    def settle(self, used):
+        if self.reservation_id:
+            settle(self.user_id, self.reservation_id, self.amount, used)
+            self.reservation_id = None
+
+    def release(self):
+        self.settle(0)
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+def stored_bytes(document):
+    """Bytes a file document accounts for: each version's blob once."""
+    versions = document.get('versions') or []
+    if not versions:
+        return document.get('stored_size') or document.get('size') or 0
+    return sum(v.get('stored_size') or v.get('size') or 0 for v in versions)
+
+
+def set_limit(user_id, limit):
+    get_quota(user_id)
+    collection = _collection()
+    while True:
+        quota = collection.find_one({'_id': user_id})
+        if limit is None:
+            update = {'$set': {'limit': None, 'updated_at': datetime.now()}}
+        else:
+            update = {'$set': {'limit': limit, 'available': limit - quota['used'] - quota['reserved'],
+                               'updated_at': datetime.now()}}
+        # Retry if an upload moved the counters in between
+        result = collection.update_one(
+            {'_id': user_id, 'used': quota['used'], 'reserved': quota['reserved']}, update
+        )
+        if result.matched_count:
+            return collection.find_one({'_id': user_id})
+
+
+def reconcile(user_id=None, reservation_ttl=None):
+    """Recompute `used` from the documents and drop reservations older than the TTL.
+
+    Returns one row per user whose counters were off. Uploads settling while
+    the documents are scanned can leave a small error until the next run.
+    """
+    reservation_ttl = reservation_ttl or timedelta(seconds=settings.STORAGE_QUOTA_RESERVATION_TTL)
+    expired_before = datetime.now() - reservation_ttl
+    query = {'owner_id': user_id} if user_id else {}
+    usage = {}
+    cursor = get_collection('documents').find(
+        query, {'owner_id': 1, 'size': 1, 'stored_size': 1, 'versions.size': 1, 'versions.stored_size': 1}
+    ).batch_size(2000)
+    for document in cursor:
+        usage[document['owner_id']] = usage.get(document['owner_id'], 0) + stored_bytes(document)
+
+    collection = _collection()
+    user_ids = set(usage)
+    user_ids.update(q['_id'] for q in collection.find({'_id': user_id} if user_id else {}, {'_id': 1}))
+    fixes = []
+    for uid in sorted(user_ids):
+        quota = get_quota(uid)
+        collection.update_one(
+            {'_id': uid},
+            {'$pull': {'reservations': {'created_at': {'$lt': expired_before}}}}
+        )
+        quota = collection.find_one({'_id': uid})
+        reserved = sum(r['amount'] for r in quota.get('reservations', []))
+        used = usage.get(uid, 0)
+        limit = quota.get('limit')
+        consistent = limit is None or quota['available'] == limit - quota['used'] - quota['reserved']
+        if used == quota['used'] and reserved == quota['reserved'] and consistent:
+            continue
+        # Apply the difference with $inc so uploads settling meanwhile are not lost,
+        # then recompute `available` from the corrected counters
+        collection.update_one(
+            {'_id': uid},
+            {'$inc': {'used': used - quota['used'], 'reserved': reserved - quota['reserved']},
+             '$set': {'reconciled_at': datetime.now()}}
+        )
+        set_limit(uid, limit)
+        fixes.append({'user_id': uid, 'used_before': quota['used'], 'used': used,
+                      'reserved_before': quota['reserved'], 'reserved': reserved})
+    return fixes
@@ -0,0 +1,159 @@
+from datetime import datetime, timedelta
+
+from pymongo import ReturnDocument
+
+from ..storage import get_storage
+from .compression import DELTA
+from .jobs import record_job_progress, set_job_total
+from .mongodb import get_collection
+from .quotas import adjust_usage, stored_bytes
+
+# Rules of a retention policy, each one keeps the newest version of every period.
+# keep_daily / keep_weekly / keep_monthly count periods back from now, -1 keeps them forever.
+RULES = ('keep_last', 'keep_daily', 'keep_weekly', 'keep_monthly')
+
+
+def _period_key(rule, moment):
+    if rule == 'keep_daily':
+        return moment.date()
+    if rule == 'keep_weekly':
+        return moment.isocalendar()[:2]
+    return moment.year, moment.month
+
+
+def _period_start(rule, count, now):
+    if count < 0:
+        return datetime.min
+    if rule == 'keep_daily':
+        return datetime.combine(now.date() - timedelta(days=count - 1), datetime.min.time())
+    if rule == 'keep_weekly':
+        monday = now.date() - timedelta(days=now.weekday() + 7 * (count - 1))
+        return datetime.combine(monday, datetime.min.time())
+    month = now.year * 12 + now.month - 1 - (count - 1)
+    return datetime(month // 12, month % 12 + 1, 1)
+
+
+def select_kept(policy, versions, current_path, now=None):
+    """Ids of the versions the policy keeps.
+
+    The current version and the newest one are always kept, and so is the
+    snapshot any kept delta version is rebuilt from.
+    """
+    now = now or datetime.now()
+    ordered = sorted(versions, key=lambda v: (v.get('created_at') or datetime.min, v.get('version_number', 0)),
+                     reverse=True)
+    kept = {v['id'] for v in ordered[:1]}
+    kept.update(v['id'] for v in versions if v.get('file_path') == current_path)
+
+    if policy.get('keep_last'):
+        kept.update(v['id'] for v in ordered[:policy['keep_last']])
+    for rule in RULES[1:]:
+        count = policy.get(rule)
+        if not count:
+            continue
+        start = _period_start(rule, count, now)
+        seen = set()
+        for version in ordered:
+            created_at = version.get('created_at')
+            if not created_at or created_at < start:
+                continue
+            key = _period_key(rule, created_at)
+            if key not in seen:
+                seen.add(key)
+                kept.add(version['id'])
+
+    by_path = {v.get('file_path'): v for v in versions}
+    for version in versions:
+        if version['id'] in kept and version.get('encoding') == DELTA and version.get('delta_base') in by_path:
+            kept.add(by_path[version['delta_base']]['id'])
+    return kept
+
+
+def prune_file(file, policy, dry_run=False):
+    """Pull the versions the policy drops, returns (versions removed, bytes reclaimed)."""
+    versions = file.get('versions', [])
+    kept = select_kept(policy, versions, file.get('file_path'))
+    dropped = [v for v in versions if v['id'] not in kept]
+    if not dropped:
+        return 0, 0
+    if dry_run:
+        return len(dropped), sum(v.get('stored_size') or v.get('size') or 0 for v in dropped)
+
+    ids = [v['id'] for v in dropped]
+    paths = [v['file_path'] for v in dropped if v.get('file_path')]
+    # Skip the file this round if the current version changed or a remaining
+    # version started depending on a dropped snapshot since it was read
+    before = get_collection('documents').find_one_and_update(
+        {
+            '_id': file['_id'],
+            'file_path': file.get('file_path'),
+            'purge_job': {'$exists': False},
+            'versions': {'$not': {'$elemMatch': {'id': {'$nin': ids}, 'delta_base': {'$in': paths}}}},
+        },
+        {'$pull': {'versions': {'id': {'$in': ids}}}},
+        projection={'owner_id': 1, 'versions.id': 1, 'versions.file_path': 1,
+                    'versions.size': 1, 'versions.stored_size': 1},
+        return_document=ReturnDocument.BEFORE
+    )
+    if not before:
+        return 0, 0
+    removed = [v for v in before.get('versions', []) if v['id'] in ids]
+    sizes = {v['file_path']: v.get('stored_size') or v.get('size') or 0 for v in removed if v.get('file_path')}
+    reclaimed = get_storage().delete_many(list(sizes), sizes)
+    adjust_usage(before.get('owner_id'), -stored_bytes({'versions': removed}))
+    return len(removed), reclaimed
+
+
+def _policy_query(policy, folder_policies):
+    query = {'owner_id': policy['owner_id'], 'versions.1': {'$exists': True}, 'purge_job': {'$exists': False}}
+    if policy.get('folder_id'):
+        query['folder'] = policy['folder_id']
+    elif folder_policies:
+        # Folder rules take precedence over the user-wide one
+        query['folder'] = {'$nin': folder_policies}
+    return query
+
+
+def prune_versions(job_id=None, dry_run=False, owner_id=None):
+    """Apply every retention policy, returns one report per policy."""
+    policies = get_collection('retention_policies')
+    documents = get_collection('documents')
+    query = {'owner_id': owner_id} if owner_id else {}
+    all_policies = list(policies.find(query))
+    if job_id:
+        set_job_total(job_id, len(all_policies))
+    folder_policies = {}
+    for policy in all_policies:
+        if policy.get('folder_id'):
+            folder_policies.setdefault(policy['owner_id'], []).append(policy['folder_id'])
+
+    reports = []
+    for policy in all_policies:
+        report = {'policy_id': str(policy['_id']), 'owner_id': policy['owner_id'],
+                  'folder_id': policy.get('folder_id'), 'files_scanned': 0, 'files_pruned': 0,
+                  'versions_pruned': 0, 'bytes_reclaimed': 0, 'dry_run': dry_run}
+        cursor = documents.find(
+            _policy_query(policy, folder_policies.get(policy['owner_id'])),
+            {'file_path': 1, 'versions': 1}
+        ).batch_size(200)
+        for file in cursor:
+            removed, reclaimed = prune_file(file, policy, dry_run)
+            report['files_scanned'] += 1
+            if removed:
+                report['files_pruned'] += 1
+                report['versions_pruned'] += removed
+                report['bytes_reclaimed'] += reclaimed
+        if job_id:
+            record_job_progress(job_id, done=1)
+
+        if not dry_run:
+            policies.update_one(
+                {'_id': policy['_id']},
+                {
+                    '$set': {'last_run': {**report, 'finished_at': datetime.now()}},
+                    '$inc': {'versions_pruned_total': report['versions_pruned'],
+                             'bytes_reclaimed_total': report['bytes_reclaimed']}
+                }
+            )
+        reports.append(report)
+    return reports
@@ -0,0 +1,148 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from django.conf import settings
+
+from .compression import DECODE_ERRORS, open_content
+from .ingest import format_checksum, new_checksum
+from .jobs import record_job_progress
+from .mongodb import get_collection
+from .throttle import RateLimiter
+
+CHECKPOINT_ID = 'storage_scrub'
+READ_SIZE = 1024 * 1024
+
+
+def hash_blob(name, limiter, encoding=None):
+    """Checksum and size of the original bytes (compressed blobs are decoded)."""
+    digest = new_checksum()
+    size = 0
+    with open_content(name, encoding) as f:
+        for chunk in iter(lambda: f.read(READ_SIZE), b''):
+            limiter.acquire(len(chunk))
+            digest.update(chunk)
+            size += len(chunk)
+    return format_checksum(digest), size
+
+
+def check_version(file, version, limiter):
+    """Re-hash one version blob, returns the finding (status 'ok' when it is healthy)."""
+    finding = {
+        'file_id': file['_id'],
+        'version_id': version.get('id'),
+        'owner_id': file.get('owner_id'),
+        'file_path': version.get('file_path'),
+        'expected_checksum': version.get('checksum'),
+        'expected_size': version.get('size'),
+    }
+    try:
+        checksum, size = hash_blob(version.get('file_path') or '', limiter, version.get('encoding'))
+    except FileNotFoundError:
+        return {**finding, 'status': 'missing'}
+    except OSError as e:
+        return {**finding, 'status': 'unreadable', 'error': str(e)}
+    except DECODE_ERRORS as e:
+        return {**finding, 'status': 'mismatch', 'error': str(e)}
+
+    finding.update({'actual_checksum': checksum, 'actual_size': size})
+    if not finding['expected_checksum']:
+        # Versions stored before checksums existed: record what is on disk now
+        return {**finding, 'status': 'backfilled'}
+    if checksum != finding['expected_checksum']:
+        return {**finding, 'status': 'mismatch'}
+    return {**finding, 'status': 'ok'}
+
+
+def _record_findings(findings, run_id):
+    documents = get_collection('documents')
+    reports = get_collection('integrity_reports')
+    now = datetime.now()
+
+    for finding in findings:
+        key = {'file_id': finding['file_id'], 'version_id': finding['version_id']}
+        if finding['status'] == 'backfilled':
+            documents.update_one(
+                {
+                    '_id': finding['file_id'],
+                    'versions': {'$elemMatch': {'id': finding['version_id'], 'checksum': None}}
+                },
+                {'$set': {'versions.$.checksum': finding['actual_checksum']}}
+            )
+        if finding['status'] in ('ok', 'backfilled'):
+            # Problem fixed since the last run (blob restored from backup...)
+            reports.delete_one(key)
+            continue
+
+        reports.update_one(
+            key,
+            {
+                '$set': {**finding, 'last_seen_at': now, 'run_id': run_id},
+                '$setOnInsert': {'first_seen_at': now},
+            },
+            upsert=True
+        )
+
+
+def scrub_storage(job_id, workers=None, bytes_per_second=None, batch_size=None, resume=False):
+    """Re-hash every version blob and report missing or corrupted ones.
+
+    Documents are walked in _id order; a checkpoint is saved after each batch
+    so an interrupted run can pick up where it stopped with resume=True.
+    """
+    workers = workers or settings.SCRUB_WORKERS
+    batch_size = batch_size or settings.SCRUB_BATCH_SIZE
+    rate = settings.SCRUB_BYTES_PER_SECOND if bytes_per_second is None else bytes_per_second
+    # Allow one full read per worker so the bucket never starves a chunk
+    limiter = RateLimiter(rate, burst=max(rate or 0, READ_SIZE * workers))
+    documents = get_collection('documents')
+    checkpoints = get_collection('scrub_checkpoints')
+
+    query = {}
+    checkpoint = checkpoints.find_one({'_id': CHECKPOINT_ID}) if resume else None
+    if checkpoint and checkpoint.get('last_file_id'):
+        query['_id'] = {'$gt': checkpoint['last_file_id']}
+    run_id = checkpoint['run_id'] if checkpoint else job_id
+    checkpoints.update_one(
+        {'_id': CHECKPOINT_ID},
+        {'$set': {'run_id': run_id, 'job_id': job_id, 'updated_at': datetime.now()}},
+        upsert=True
+    )
+
+    totals = {'files': 0, 'versions': 0, 'ok': 0, 'backfilled': 0, 'missing': 0, 'mismatch': 0, 'unreadable': 0}
+    cursor = documents.find(
+        query, {'owner_id': 1, 'versions.id': 1, 'versions.file_path': 1,
+                'versions.checksum': 1, 'versions.size': 1, 'versions.encoding': 1}
+    ).sort('_id', 1).batch_size(batch_size)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        batch = []
+
+        def process(batch):
+            futures = [pool.submit(check_version, file, version, limiter)
+                       for file in batch for version in file.get('versions', [])]
+            findings = [future.result() for future in futures]
+            _record_findings(findings, run_id)
+            for finding in findings:
+                totals[finding['status']] += 1
+            totals['files'] += len(batch)
+            totals['versions'] += len(findings)
+            checkpoints.update_one(
+                {'_id': CHECKPOINT_ID},
+                {'$set': {'last_file_id': batch[-1]['_id'], 'updated_at': datetime.now()}}
+            )
+            record_job_progress(job_id, done=len(batch))
+
+        for file in cursor:
+            batch.append(file)
+            if len(batch) >= batch_size:
+                process(batch)
+                batch = []
+        if batch:
+            process(batch)
+
+    # Full pass done, the next run starts from the beginning
+    checkpoints.update_one(
+        {'_id': CHECKPOINT_ID},
+        {'$unset': {'last_file_id': ''}, '$set': {'completed_at': datetime.now()}}
+    )
+    return totals
@@ -0,0 +1,120 @@
+import hashlib
+import os
+
+from django.conf import settings
+
+# Blob names are stored bare in Mongo (`file_path`), where they live on disk is decided here.
+# 'sharded' fans files out as ab/cd/<name> so no directory holds more than a few
+# thousand entries; 'flat' is the historical layout, <name> straight in the root.
+SHARDED = 'sharded'
+FLAT = 'flat'
+
+
+def storage_root():
+    return settings.DOCUMENT_STORAGE_PATH
+
+
+def shard_dir(name):
+    # Hash rather than slice the name: uniform spread whatever the naming scheme
+    digest = hashlib.md5(name.encode()).hexdigest()
+    return os.path.join(digest[:2], digest[2:4])
+
+
+def sharded_path(name):
+    return os.path.join(storage_root(), shard_dir(name), name)
+
+
+def flat_path(name):
+    return os.path.join(storage_root(), name)
+
+
+def candidate_paths(name):
+    """Absolute paths where a blob may live, the configured layout first."""
+    name = os.path.basename(name)
+    if settings.DOCUMENT_STORAGE_LAYOUT == FLAT:
+        return flat_path(name), sharded_path(name)
+    return sharded_path(name), flat_path(name)
+
+
+def path_for_write(name):
+    path = candidate_paths(name)[0]
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+def resolve_path(name):
+    """Path of an existing blob in either layout, the preferred path if it is nowhere."""
+    paths = candidate_paths(name)
+    for path in paths:
+        if os.path.exists(path):
+            return path
+    return paths[0]
+
+
+def blob_exists(name):
+    return any(os.path.exists(path) for path in candidate_paths(name))
+
+
+def open_blob(name, mode='rb'):
+    # Try each layout in turn instead of checking first: the migration may move
+    # the file between an exists() and the open()
+    paths = candidate_paths(name)
+    for path in paths[:-1]:
+        try:
+            return open(path, mode)
+        except FileNotFoundError:
+            continue
+    return open(paths[-1], mode)
+
+
+def remove_blob(name):
+    """Delete a blob wherever it lives, returns the number of bytes freed."""
+    freed = 0
+    for path in candidate_paths(name):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+            freed += size
+        except FileNotFoundError:
+            continue
+    return freed
+
+
+def migrate_to_sharded(batch_size=1000, limiter=None, on_batch=None):
+    """Move the blobs sitting in the flat root into their shard directories.
+
+    Safe to run while serving traffic: readers look in both layouts, and each
+    move is a same-filesystem os.replace, so a blob is always at one of the two.
+    """
+    root = storage_root()
+    moved = batch = 0
+    failed = set()
+    while True:
+        with os.scandir(root) as entries:
+            names = []
+            for entry in entries:
+                if entry.name in failed or entry.name.startswith('.'):
+                    continue
+                if entry.is_file(follow_symlinks=False):
+                    names.append(entry.name)
+                    if len(names) >= batch_size:
+                        break
+        if not names:
+            return {'moved': moved, 'failed': len(failed)}
+
+        for name in names:
+            if limiter:
+                limiter.acquire()
+            destination = sharded_path(name)
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            try:
+                os.replace(flat_path(name), destination)
+            except FileNotFoundError:
+                continue  # deleted meanwhile
+            except OSError:
+                failed.add(name)
+                continue
+            moved += 1
+        batch += 1
+        if on_batch:
+            on_batch(batch, moved)
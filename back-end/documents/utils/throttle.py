@@ -0,0 +1,32 @@
+import threading
+import time
+
+
+class RateLimiter:
+    """Token bucket shared by worker threads, e.g. to cap disk unlinks or read bandwidth.
+
+    `rate` is the number of tokens refilled per second, `None` or 0 disables limiting.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or rate or 0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        if not self.rate:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                # Requests bigger than the bucket go through once it is full
+                needed = min(tokens, self.capacity)
+                if self.tokens >= needed:
+                    self.tokens -= needed
+                    return
+                wait = (needed - self.tokens) / self.rate
+            time.sleep(wait)
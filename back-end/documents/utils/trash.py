@@ -0,0 +1,148 @@
+from datetime import datetime, timedelta
+
+from django.conf import settings
+
+from ..storage import get_storage
+from .cache import bump_for_files
+from .jobs import record_job_progress, run_job, set_job_total
+from .mongodb import get_collection
+from .quotas import adjust_usage, stored_bytes
+from .throttle import RateLimiter
+
+
+def claim_trash(job_id, query):
+    """Hand the matching trashed files to a purge job.
+
+    Claimed files disappear from the trash listing and can no longer be restored,
+    so the purge can proceed in the background without racing a restore.
+    """
+    result = get_collection('documents').update_many(
+        {**query, 'is_trashed': True, 'purge_job': {'$exists': False}},
+        {'$set': {'purge_job': job_id}}
+    )
+    return result.modified_count
+
+
+def _unlink(sizes, limiter):
+    # One token per blob: acquire(len) would be capped to the bucket size
+    for _ in sizes:
+        limiter.acquire()
+    try:
+        return get_storage().delete_many(sorted(sizes), sizes)
+    except OSError:
+        return 0  # Continue even if a batch fails to delete, the GC will catch the leftovers
+
+
+def purge_claimed(job_id, batch_size=None, limiter=None):
+    """Delete the documents claimed by job_id batch by batch, then unlink their blobs."""
+    collection = get_collection('documents')
+    batch_size = batch_size or settings.TRASH_PURGE_BATCH_SIZE
+    limiter = limiter or RateLimiter(settings.TRASH_PURGE_UNLINKS_PER_SECOND)
+    deleted = reclaimed = 0
+
+    while True:
+        batch = list(collection.find(
+            {'purge_job': job_id},
+            {'file_path': 1, 'size': 1, 'stored_size': 1, 'owner_id': 1, 'permissions.user_id': 1, 'folder': 1,
+             'versions.file_path': 1, 'versions.size': 1, 'versions.stored_size': 1}
+        ).limit(batch_size))
+        if not batch:
+            break
+
+        result = collection.delete_many({'_id': {'$in': [file['_id'] for file in batch]}})
+        deleted += result.deleted_count
+        get_collection('comments').delete_many({'file_id': {'$in': [file['_id'] for file in batch]}})
+        # Sync clients drop them on their next /changes/ poll
+        bump_for_files(*batch)
+
+        # Older versions have their own blobs, release them too
+        sizes = {}
+        for file in batch:
+            for blob in [file, *file.get('versions', [])]:
+                if blob.get('file_path'):
+                    sizes[blob['file_path']] = blob.get('stored_size') or blob.get('size') or 0
+        reclaimed += _unlink(sizes, limiter)
+
+        freed = {}
+        for file in batch:
+            freed[file.get('owner_id')] = freed.get(file.get('owner_id'), 0) + stored_bytes(file)
+        for owner_id, amount in freed.items():
+            adjust_usage(owner_id, -amount)
+        record_job_progress(job_id, done=len(batch))
+
+    return {'deleted': deleted, 'bytes_reclaimed': reclaimed}
+
+
+def purge_user_trash(job_id):
+    """Empty-trash job: the files were already claimed by the request."""
+    set_job_total(job_id, get_collection('documents').count_documents({'purge_job': job_id}))
+    return purge_claimed(job_id)
+
+
+def purge_expired_trash(job_id, retention_days=None, batch_size=None):
+    """Purge files that have been in the trash for longer than the retention period.
+
+    Candidates are taken oldest first in bounded batches from the
+    (is_trashed, trashed_at) index, claimed, then purged. Files already claimed
+    by another job are left to it; if this one dies, resume_stalled_purges
+    finishes the batch it had claimed.
+    """
+    collection = get_collection('documents')
+    retention_days = settings.TRASH_RETENTION_DAYS if retention_days is None else retention_days
+    batch_size = batch_size or settings.TRASH_PURGE_BATCH_SIZE
+    cutoff = datetime.now() - timedelta(days=retention_days)
+    limiter = RateLimiter(settings.TRASH_PURGE_UNLINKS_PER_SECOND)
+    totals = {'deleted': 0, 'bytes_reclaimed': 0, 'cutoff': cutoff}
+
+    while True:
+        ids = [file['_id'] for file in collection.find(
+            {'is_trashed': True, 'trashed_at': {'$lte': cutoff}, 'purge_job': {'$exists': False}},
+            {'_id': 1}
+        ).sort('trashed_at', 1).limit(batch_size)]
+        if not ids:
+            break
+
+        collection.update_many(
+            {'_id': {'$in': ids}, 'is_trashed': True, 'purge_job': {'$exists': False}},
+            {'$set': {'purge_job': job_id}}
+        )
+        result = purge_claimed(job_id, batch_size=batch_size, limiter=limiter)
+        totals['deleted'] += result['deleted']
+        totals['bytes_reclaimed'] += result['bytes_reclaimed']
+
+    return totals
+
+
+# Job kind -> what finishes it from its claimed files (jobs.RESUMABLE_KINDS)
+RESUME_TARGETS = {
+    'empty_trash': purge_user_trash,
+    'trash_retention': purge_claimed,
+}
+
+
+def resume_stalled_purges(stalled_after=None):
+    """Re-run the purge jobs whose worker died (process restart, crash...), returns how many.
+
+    An empty-trash job purges what its request claimed, a retention job the
+    batch it had claimed when it stopped (the next run takes the rest).
+    """
+    stalled_after = stalled_after or timedelta(seconds=settings.TRASH_PURGE_STALLED_AFTER)
+    collection = get_collection('jobs')
+    stalled = {
+        'kind': {'$in': list(RESUME_TARGETS)},
+        'status': {'$in': ['queued', 'running']},
+        'updated_at': {'$lte': datetime.now() - stalled_after}
+    }
+    resumed = 0
+    for job in list(collection.find(stalled, {'_id': 1})):
+        # Claimed first: another purger (or an overlapping cron run) gets none of them twice
+        job = collection.find_one_and_update(
+            {**stalled, '_id': job['_id']},
+            {'$set': {'status': 'running', 'updated_at': datetime.now()}},
+            projection={'kind': 1}
+        )
+        if job is None:
+            continue
+        run_job(job['_id'], RESUME_TARGETS[job['kind']])
+        resumed += 1
+    return resumed
@@ -1,13 +1,21 @@
 from .auth import RegisterView, LoginView, UserProfileView
 from .files import (
-    FileListView, FileDetailView, FileDownloadView, FilePreviewView,
+    FileListView, FileBatchUploadView, FileDetailView, FileDownloadView, FilePreviewView,
     FileTrashView, FileRestoreView, TrashListView, EmptyTrashView,
     FileFavoriteView, FavoriteListView, FileShareView, FilePermissionsView,
     SharedFilesView, FileCommentsView, FileCommentDetailView, FileVersionsView,
     FileVersionDetailView, FileActivityView, UserActivityView, RecentFilesView
 )
+from .chunk_sync import FileVersionSyncView, FileVersionSyncSessionView
+from .jobs import JobDetailView
+from .integrity import IntegrityReportView
+from .retention import RetentionPolicyListView, RetentionPolicyDetailView
+from .quotas import QuotaView, AdminQuotaView
 from .folders import FolderListView, FolderDetailView, FolderFilesView
-from .notifications import NotificationsView, MarkNotificationsReadView
+from .notifications import (
+    NotificationsView, UnreadNotificationCountView, NotificationPreferencesView, MarkNotificationsReadView
+)
 from .search import SearchView
+from .changes import ChangesView
 from .statistics import StatisticsView
 from .tags import TagsView
\ No newline at end of file
@@ -0,0 +1,274 @@
+"""Async versions of the high traffic endpoints, served by masterdrive/asgi.py.
+
+DRF views are sync only, these are plain Django async views: JWT
+authentication is done the same way as DRF (JWTAuthentication), Mongo is read
+with motor through the same builders as the sync views (documents/queries.py)
+and responses are rendered with the same renderer. Methods without an async
+handler (PUT / DELETE on a file...) go to the sync DRF view.
+"""
+import logging
+import mimetypes
+
+from asgiref.sync import sync_to_async
+from bson import ObjectId
+from bson.errors import InvalidId
+from django.conf import settings
+from django.core.cache import cache
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotAuthenticated
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from jsonrender import MongoJSONRenderer
+
+from .. import queries
+from ..storage import get_storage
+from ..utils.cache import aget_generation, is_not_modified, response_digest, set_cache_headers
+from ..utils.compression import READ_SIZE
+from ..utils.notifications import aget_unread_count, get_hub
+from .blobs import blob_response
+from .files import FileDetailView, FileDownloadView, FileListView, detail_data, set_revision_etag
+from .notifications import NotificationsView, UnreadNotificationCountView, feed_params, set_next_link
+from .search import SearchView
+
+logger = logging.getLogger(__name__)
+
+_renderer = MongoJSONRenderer()
+_authentication = JWTAuthentication()
+
+
+def json_response(data, status=status.HTTP_200_OK):
+    response = HttpResponse(_renderer.render(data), status=status, content_type='application/json')
+    response.data = data
+    return response
+
+
+def error_response(request, exc):
+    # Same body as DRF's exception handler
+    data = exc.detail if isinstance(exc.detail, (dict, list)) else {'detail': exc.detail}
+    response = json_response(data, status=exc.status_code)
+    response['WWW-Authenticate'] = _authentication.authenticate_header(request)
+    return response
+
+
+def cached_response(view_method):
+    """Async counterpart of utils.cache.cached_response, sharing its entries."""
+    async def wrapper(self, request, *args, **kwargs):
+        digest = response_digest(self, request, await aget_generation(str(request.user.id)))
+        etag = f'"{digest}"'
+
+        if is_not_modified(request, etag):
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            key = f'response:{digest}'
+            data = await cache.aget(key)
+            if data is None:
+                response = await view_method(self, request, *args, **kwargs)
+                if response.status_code != status.HTTP_200_OK:
+                    return response
+                await cache.aset(key, response.data, settings.RESPONSE_CACHE_TIMEOUT)
+            else:
+                response = json_response(data)
+        return set_cache_headers(response, etag)
+    return wrapper
+
+
+async def aiter_blocking(iterator):
+    """Iterate a blocking iterator (file reads, zstd decoding) from a worker thread."""
+    done = object()
+    step = sync_to_async(next, thread_sensitive=False)
+    try:
+        while (chunk := await step(iterator, done)) is not done:
+            yield chunk
+    finally:
+        close = getattr(iterator, 'close', None)
+        if close:
+            close()
+
+
+class AsyncAPIView(View):
+    """Authenticated async view; sync_view serves the methods it has no coroutine for."""
+    sync_view = None
+    _sync_handler = None
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        if cls.sync_view is not None:
+            cls._sync_handler = staticmethod(sync_to_async(cls.sync_view.as_view()))
+        # Token authentication, like APIView
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        handler = getattr(self, request.method.lower(), None)
+        if request.method.lower() not in self.http_method_names or handler is None:
+            if self._sync_handler is not None:
+                return await self._sync_handler(request, *args, **kwargs)
+            return await super().dispatch(request, *args, **kwargs)
+
+        try:
+            user_auth = await self.authenticate(request)
+        except APIException as e:
+            return error_response(request, e)
+        if user_auth is None:
+            return error_response(request, NotAuthenticated())
+        request.user, request.auth = user_auth
+
+        try:
+            return await handler(request, *args, **kwargs)
+        except InvalidId:
+            # Malformed id in the URL (ObjectId(file_id)): no such file
+            return json_response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+        except Exception:
+            # Details go to the logs, not to the client
+            logger.exception('%s %s failed', request.method, request.path)
+            return json_response({'detail': 'Internal server error.'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    async def authenticate(self, request):
+        """(user, token) from the Authorization header, None without one."""
+        return await sync_to_async(_authentication.authenticate)(request)
+
+
+class AsyncFileListView(AsyncAPIView):
+    sync_view = FileListView
+
+    @cached_response
+    async def get(self, request):
+        return json_response(await queries.afetch(queries.file_list(str(request.user.id))))
+
+
+class AsyncFileDetailView(AsyncAPIView):
+    sync_view = FileDetailView
+
+    async def get(self, request, file_id):
+        file_id = ObjectId(file_id)
+        file = await queries.afind_and_update(queries.file_detail(file_id, str(request.user.id)))
+        if not file:
+            if await queries.afetch_one(queries.file_by_id(file_id)._replace(fields={'_id': 1})):
+                return json_response({'detail': 'You do not have permission to view this file.'},
+                                     status=status.HTTP_403_FORBIDDEN)
+            return json_response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+
+        return set_revision_etag(json_response(detail_data(request, file)), file.get('revision'))
+
+
+class AsyncFileDownloadView(AsyncAPIView):
+    sync_view = FileDownloadView
+
+    async def get(self, request, file_id):
+        file_id = ObjectId(file_id)
+        file = await queries.afetch_one(queries.file_by_id(file_id))
+        if not file:
+            return json_response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+
+        if not queries.can_read(file, str(request.user.id)):
+            return json_response({'detail': 'You do not have permission to download this file.'},
+                                 status=status.HTTP_403_FORBIDDEN)
+
+        stored = await sync_to_async(get_storage().stat, thread_sensitive=False)(file.get('file_path'))
+        if stored is None:
+            return json_response({'detail': 'File not found on server.'}, status=status.HTTP_404_NOT_FOUND)
+
+        await queries.aexecute(queries.record_download(file_id, str(request.user.id)))
+
+        content_type, _ = mimetypes.guess_type(file.get('original_filename'))
+        if not content_type:
+            content_type = 'application/octet-stream'
+
+        # Opening the blob (and a zstd reader) is blocking as well
+        response = await sync_to_async(blob_response, thread_sensitive=False)(
+            request, stored, content_type,
+            as_attachment=True,
+            filename=file.get('original_filename'),
+            encoding=file.get('encoding'),
+            size=file.get('size')
+        )
+        if response.streaming:
+            if isinstance(response, FileResponse):
+                response.block_size = READ_SIZE  # one thread hop per MB, not per 4 KB
+            # Django would read a sync iterator whole into memory under ASGI
+            response.streaming_content = aiter_blocking(iter(response.streaming_content))
+        return response
+
+
+class AsyncSearchView(AsyncAPIView):
+    sync_view = SearchView
+
+    async def get(self, request):
+        query = request.GET.get('q', '')
+        file_type = request.GET.get('type', None)
+        field = request.GET.get('field', 'all')
+
+        if not query:
+            return json_response({'detail': 'Search query parameter "q" is required.'},
+                                 status=status.HTTP_400_BAD_REQUEST)
+
+        results = await queries.afetch(queries.search(str(request.user.id), query, file_type, field))
+        return json_response({
+            'count': len(results),
+            'results': results
+        })
+
+
+class AsyncNotificationsView(AsyncAPIView):
+    sync_view = NotificationsView
+
+    async def get(self, request):
+        try:
+            unread_only, limit, before = feed_params(request)
+        except ValueError as e:
+            return json_response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        notifications = await queries.afetch(queries.notifications(str(request.user.id), unread_only, limit, before))
+        return set_next_link(json_response(notifications), request, notifications, limit)
+
+
+class AsyncUnreadNotificationCountView(AsyncAPIView):
+    sync_view = UnreadNotificationCountView
+
+    async def get(self, request):
+        return json_response({'unread': await aget_unread_count(str(request.user.id))})
+
+
+class AsyncNotificationStreamView(AsyncAPIView):
+    """New notifications as server-sent events, replaces polling NotificationsView.
+
+    Reconnecting clients send Last-Event-ID (EventSource does it by itself) and
+    get what they missed. EventSource cannot set headers, the access token may
+    be passed as ?token= instead.
+    """
+
+    async def authenticate(self, request):
+        token = request.GET.get('token')
+        if token and 'Authorization' not in request.headers:
+            validated_token = _authentication.get_validated_token(token)
+            return await sync_to_async(_authentication.get_user)(validated_token), validated_token
+        return await super().authenticate(request)
+
+    async def get(self, request):
+        last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+        try:
+            last_event_id = ObjectId(last_event_id) if last_event_id else None
+        except InvalidId:
+            return json_response({'detail': 'Invalid Last-Event-ID.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        hub = get_hub()
+        subscription = await hub.subscribe(str(request.user.id), last_event_id)
+        response = StreamingHttpResponse(self.events(hub, subscription), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # nginx would hold the events back otherwise
+        return response
+
+    async def events(self, hub, subscription):
+        try:
+            yield f'retry: {settings.NOTIFICATION_STREAM_RETRY}\n\n'
+            while not subscription.closed:
+                notification = await subscription.next(settings.NOTIFICATION_STREAM_HEARTBEAT)
+                if notification is None:
+                    yield ': ping\n\n'  # keeps proxies from closing an idle connection
+                    continue
+                data = _renderer.render(notification).decode()
+                yield f'id: {notification["id"]}\nevent: notification\ndata: {data}\n\n'
+        finally:
+            hub.unsubscribe(subscription)
@@ -0,0 +1,103 @@
+import re
+
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.http import content_disposition_header
+
+from ..storage import get_storage
+from ..utils.compression import GZIP, ZSTD, gzip_chunks, iter_content, open_content
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def parse_range(header, size):
+    """(start, end) for a single `Range: bytes=` header, None to serve the whole blob.
+
+    Raises ValueError when the range cannot be satisfied.
+    """
+    match = RANGE_RE.match((header or '').strip())
+    if not match or size == 0:
+        return None  # multi-range or malformed: ignore it, as allowed by RFC 9110
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError('Range not satisfiable')
+    return start, end
+
+
+def accepts_encoding(request, encoding):
+    for item in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        name, _, params = item.strip().partition(';')
+        if name.strip().lower() == encoding:
+            return params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000')
+    return False
+
+
+def _set_disposition(response, as_attachment, filename):
+    disposition = content_disposition_header(as_attachment, filename)
+    if disposition:
+        response['Content-Disposition'] = disposition
+
+
+def blob_response(request, stored, content_type, as_attachment=False, filename='',
+                  encoding=None, size=None):
+    """Stream a blob from the storage backend, honouring single HTTP Range requests.
+
+    `size` is the original size of the document; zstd blobs are sent as is
+    with Content-Encoding when the client accepts it, re-encoded as gzip when
+    it only accepts that, compressed blobs and delta versions are decoded on
+    the fly otherwise.
+    """
+    size = stored.size if size is None else size
+    try:
+        byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+    except ValueError:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    passthrough = encoding == ZSTD and accepts_encoding(request, encoding)
+    gzipped = encoding == ZSTD and not passthrough and accepts_encoding(request, GZIP)
+    if byte_range is None and gzipped:
+        # Length unknown until compressed: streamed (chunked) without Content-Length
+        response = StreamingHttpResponse(gzip_chunks(iter_content(stored.name, encoding)), content_type=content_type)
+        response['Content-Encoding'] = GZIP
+        _set_disposition(response, as_attachment, filename)
+    elif byte_range is None:
+        if encoding and not passthrough:
+            body = open_content(stored.name, encoding)
+        else:
+            body = get_storage().open(stored.name)
+        response = FileResponse(
+            body,
+            content_type=content_type,
+            as_attachment=as_attachment,
+            filename=filename
+        )
+        if passthrough:
+            response['Content-Encoding'] = encoding
+            response['Content-Length'] = stored.size
+        else:
+            response['Content-Length'] = size
+    else:
+        # Ranges always address the original bytes
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            iter_content(stored.name, encoding, start, end),
+            status=206,
+            content_type=content_type
+        )
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = end - start + 1
+        _set_disposition(response, as_attachment, filename)
+    response['Accept-Ranges'] = 'bytes'
+    if encoding:
+        patch_vary_headers(response, ['Accept-Encoding'])
+    return response
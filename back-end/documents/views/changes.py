@@ -0,0 +1,32 @@
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework import status, permissions
+
+from ..utils.changes import TokenExpired, changes_since, current_token
+
+
+class ChangesView(APIView):
+    """Delta sync: what changed since the token of the previous poll.
+
+    Without `since` only the current token is returned: list everything, then
+    poll with it. A 410 means the token is too old, list everything again.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        try:
+            user_id = str(request.user.id)
+            since = request.query_params.get('since')
+            if since is None:
+                return Response({'token': str(current_token(user_id))})
+            try:
+                since = int(since)
+            except ValueError:
+                return Response({'detail': 'Invalid token.'}, status=status.HTTP_400_BAD_REQUEST)
+
+            try:
+                return Response(changes_since(user_id, since))
+            except TokenExpired:
+                return Response({'detail': 'Token expired, a full sync is required.'}, status=status.HTTP_410_GONE)
+        except Exception as e:
+            return Response({'detail': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -0,0 +1,143 @@
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework import status, permissions
+from rest_framework.parsers import JSONParser, MultiPartParser
+from bson import ObjectId
+from bson.errors import InvalidId
+
+from .. import queries
+from ..utils.chunk_sync import (
+    ChunkSyncError, assemble, chunking_parameters, claim_commit, close_session, get_session, receive_chunks,
+    release_commit, start_session
+)
+from ..utils.mongodb import get_collection
+from ..storage import get_storage
+from .files import RevisionConflict, add_version, expected_revision, precondition_failed, set_revision_etag
+from .quotas import reserve_upload
+
+
+def _writable_file(request, file_id):
+    """(file, None) or (None, error response)."""
+    try:
+        file_id = ObjectId(file_id)
+    except InvalidId:
+        return None, Response({'detail': 'Invalid file id.'}, status=status.HTTP_400_BAD_REQUEST)
+    file = get_collection('documents').find_one({'_id': file_id})
+    if not file:
+        return None, Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+    if not queries.can_write(file, str(request.user.id)):
+        return None, Response({'detail': 'You do not have permission to add versions to this file.'},
+                              status=status.HTTP_403_FORBIDDEN)
+    return file, None
+
+
+def _session(request, file, session_id):
+    try:
+        return get_session(ObjectId(session_id), file['_id'], str(request.user.id))
+    except InvalidId:
+        return None
+
+
+class FileVersionSyncView(APIView):
+    """Start a block-level upload: the chunk list of the new version in, the missing chunks out."""
+    permission_classes = [permissions.IsAuthenticated]
+    parser_classes = [JSONParser]
+
+    def get(self, request, file_id):
+        # Chunking the client must use for its hashes to match the server's
+        return Response(chunking_parameters())
+
+    def post(self, request, file_id):
+        try:
+            file, error = _writable_file(request, file_id)
+            if error:
+                return error
+            chunks = request.data.get('chunks')
+            if not isinstance(chunks, list):
+                return Response({'detail': 'chunks is required.'}, status=status.HTTP_400_BAD_REQUEST)
+            try:
+                session = start_session(file, str(request.user.id), chunks, request.data.get('checksum'))
+            except ChunkSyncError as e:
+                return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            return Response({
+                'session_id': str(session['_id']),
+                'missing': session['missing'],
+                'size': session['size'],
+                'expires_at': session['expires_at'],
+            }, status=status.HTTP_201_CREATED)
+        except Exception as e:
+            return Response({'detail': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class FileVersionSyncSessionView(APIView):
+    """PUT the missing chunks (multipart, one part per chunk named by its hash), then POST to commit."""
+    permission_classes = [permissions.IsAuthenticated]
+    parser_classes = [MultiPartParser]
+
+    def put(self, request, file_id, session_id):
+        try:
+            file, error = _writable_file(request, file_id)
+            if error:
+                return error
+            session = _session(request, file, session_id)
+            if not session:
+                return Response({'detail': 'Upload session not found.'}, status=status.HTTP_404_NOT_FOUND)
+            uploads = {name: part.read() for name, part in request.FILES.items()}
+            try:
+                missing = receive_chunks(session, uploads)
+            except ChunkSyncError as e:
+                return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            return Response({'received': len(uploads), 'missing': missing})
+        except Exception as e:
+            return Response({'detail': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    def post(self, request, file_id, session_id):
+        reservation = None
+        claimed = committed = False
+        try:
+            file, error = _writable_file(request, file_id)
+            if error:
+                return error
+            session = _session(request, file, session_id)
+            if not session:
+                return Response({'detail': 'Upload session not found.'}, status=status.HTTP_404_NOT_FOUND)
+
+            try:
+                revision = expected_revision(request)
+            except ValueError:
+                return Response({'detail': 'Invalid revision.'}, status=status.HTTP_400_BAD_REQUEST)
+            if revision is not None and revision != file.get('revision', 0):
+                return precondition_failed(file['_id'])
+
+            # One commit per session: a retry racing the first one would add the version twice
+            claimed = claim_commit(session)
+            if not claimed:
+                return Response({'detail': 'This upload is already being committed.'},
+                                status=status.HTTP_409_CONFLICT, headers={'Retry-After': '1'})
+
+            # The assembled version counts like a regular upload of its size
+            reservation, error = reserve_upload(request, file.get('owner_id'), session['size'])
+            if error:
+                return error
+            try:
+                stored_name, blob = assemble(session)
+            except ChunkSyncError as e:
+                return Response({'detail': str(e), 'missing': session['missing']}, status=status.HTTP_409_CONFLICT)
+
+            try:
+                new_version, revision = add_version(
+                    request, file, stored_name, session['size'], blob, reservation, revision
+                )
+            except RevisionConflict:
+                get_storage().delete(stored_name)
+                return precondition_failed(file['_id'])
+            close_session(session)
+            committed = True
+            return set_revision_etag(Response(new_version), revision)
+        except Exception as e:
+            return Response({'detail': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        finally:
+            if reservation:
+                reservation.release()
+            if claimed and not committed:
+                release_commit(session)
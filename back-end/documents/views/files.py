@@ -2,23 +2,40 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, permissions
 from rest_framework.parsers import MultiPartParser, FormParser
-from django.http import FileResponse
 from django.conf import settings
+from django.urls import reverse
 from datetime import datetime
 import os
 import uuid
 import mimetypes
-import magic
 import json
+import zipfile
 from ..serializers import (
-    FileListSerializer, CommentSerializer, 
     FileVersionSerializer, FileActivitySerializer,
     FileUploadSerializer
 )
+from .. import queries
+from ..projectors import COMMENT, FILE_LIST
 from ..utils.mongodb import get_collection
+from ..utils.ingest import (
+    MAGIC_SAMPLE_SIZE, detect_category, store_upload, build_file_document, blob_fields,
+    stage_archive, ingest_entries, ingest_archive
+)
+from ..utils.jobs import create_job, start_job
+from ..utils.cache import cached_response, bump_for_files
+from ..utils.idempotency import idempotent
+from ..utils.notifications import create_notification
+from ..utils.comments import add_comment, add_user_names, delete_comment, edit_comment, get_comment
+from ..utils.delta import encode_version
+from ..utils.trash import claim_trash, purge_user_trash
+from ..storage import get_storage
+from .blobs import blob_response
+from .quotas import reserve_upload
+from .notifications import set_next_link
 from django.contrib.auth import get_user_model 
 from pymongo import MongoClient
 from bson import ObjectId
+from bson.errors import InvalidId
 
 
 
@@ -42,29 +59,24 @@ class FileListView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     parser_classes = [MultiPartParser, FormParser]
     
+    @cached_response
     def get(self, request):
-            db = get_db()
-            collection = db['documents']
-
-            query = {
-                'owner_id': str(request.user.id),
-                'is_trashed': False
-            }
-
-            files = list(collection.find(query).sort('uploaded_at', -1))
-
-            serialized_files = []
-            for file in files:
-                file_id = str(file.pop('_id'))
-                reordered_file = {'id': file_id, **file}
-                serializer = FileListSerializer(instance=reordered_file)  
-                serialized_files.append(serializer.data)
-
-            return Response(serialized_files)
+            return Response(queries.fetch(queries.file_list(str(request.user.id))))
 
 
     
+    @idempotent
     def post(self, request):
+        # Réserver le quota avant de lire le corps de la requête : rien n'est écrit si c'est refusé
+        reservation, error = reserve_upload(request, str(request.user.id))
+        if error:
+            return error
+        try:
+            return self._create(request, reservation)
+        finally:
+            reservation.release()  # sans effet si l'upload a abouti
+    
+    def _create(self, request, reservation):
         print("Données reçues:", request.data)
         print("Fichiers reçus:", request.FILES)
         
@@ -80,83 +92,31 @@ class FileListView(APIView):
             
             uploaded_file = request.FILES['file']
             
-            # Obtenir le type de fichier
-            mime = magic.Magic(mime=True)
-            file_content = uploaded_file.read()  # Lire le contenu du fichier
+            # Obtenir le type de fichier (libmagic n'a besoin que de l'en-tête)
+            file_category = detect_category(uploaded_file.read(MAGIC_SAMPLE_SIZE))
             uploaded_file.seek(0)  # Réinitialiser le pointeur de fichier
-            file_type = mime.from_buffer(file_content)
-            
-            # Déterminer la catégorie de fichier
-            if file_type.startswith('image/'):
-                file_category = 'image'
-            elif file_type.startswith('video/'):
-                file_category = 'video'
-            elif file_type == 'application/pdf':
-                file_category = 'pdf'
-            else:
-                file_category = 'other'
             
-            # Générer un nom de fichier unique
-            file_extension = os.path.splitext(uploaded_file.name)[1]
-            unique_filename = f"{uuid.uuid4()}{file_extension}"
-            
-            # Définir le chemin de stockage
-            storage_path = getattr(settings, 'DOCUMENT_STORAGE_PATH', os.path.join(settings.BASE_DIR, 'uploads'))
-            os.makedirs(storage_path, exist_ok=True)
-            file_path = os.path.join(storage_path, unique_filename)
-            
-            # Enregistrer le fichier
-            with open(file_path, 'wb+') as destination:
-                for chunk in uploaded_file.chunks():
-                    destination.write(chunk)
+            # Enregistrer le fichier sous un nom unique
+            unique_filename, blob = store_upload(uploaded_file)
             
             # Obtenir ou définir les métadonnées
-            now = datetime.now()
             title = request.data.get('title', os.path.splitext(uploaded_file.name)[0])
             description = request.data.get('description', '')
             folder = request.data.get('folder', None)
             
-            # Créer le document pour MongoDB (similaire à votre méthode d'échantillon)
-            file_data = {
-                "_id": ObjectId(),  
-                "title": title,
-                "type": file_category,
-                "description": description,
-                "author": f"{request.user.first_name} {request.user.last_name}".strip() or request.user.username,
-                "tags": json.loads(request.data.get('tags', '[]')),
-                "file_path": unique_filename,
-                "original_filename": uploaded_file.name,
-                "size": uploaded_file.size,
-                "owner_id": str(request.user.id),
-                "folder": folder,
-                "uploaded_at": now,
-                "updated_at": now,
-                "last_opened": now,
-                "is_favorite": False,
-                "is_trashed": False,
-                "permissions": [],
-                "versions": [{
-                    "id": str(uuid.uuid4()),
-                    "file_path": unique_filename,
-                    "version_number": 1,
-                    "size": uploaded_file.size,
-                    "created_at": now,
-                    "created_by": str(request.user.id)
-                }],
-                "comments": [],
-                "activities": [{
-                    "id": str(uuid.uuid4()),
-                    "user_id": str(request.user.id),
-                    "action": "upload",
-                    "timestamp": now,
-                    "details": {"original_filename": uploaded_file.name}
-                }]
-            }
+            # Créer le document pour MongoDB
+            file_data = build_file_document(
+                request.user, uploaded_file.name, unique_filename, uploaded_file.size, file_category,
+                blob=blob, title=title, description=description,
+                tags=json.loads(request.data.get('tags', '[]')), folder=folder
+            )
             
             # Insérer dans MongoDB
             db = get_db()
             collection = db['documents']
             result = collection.insert_one(file_data)
+            reservation.settle(blob['stored_size'])
+            bump_for_files(file_data)
             
             # Préparer la réponse
             response_data = file_data.copy()
@@ -172,6 +132,156 @@ class FileListView(APIView):
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+class FileBatchUploadView(APIView):
+    """
+    Upload de plusieurs fichiers en une seule requête
+    Form fields:
+    - files: un ou plusieurs fichiers (multipart)
+    - archive: une archive ZIP extraite côté serveur en arborescence de dossiers
+    - folder, tags, description: appliqués à tous les fichiers (optionnels)
+    Le traitement se fait en tâche de fond, suivre la progression via /jobs/<job_id>/
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    parser_classes = [MultiPartParser, FormParser]
+
+    def post(self, request):
+        reservation, error = reserve_upload(request, str(request.user.id))
+        if error:
+            return error
+        try:
+            return self._create(request, reservation)
+        finally:
+            reservation.release()
+
+    def _create(self, request, reservation):
+        uploaded_files = request.FILES.getlist('files')
+        archive = request.FILES.get('archive')
+
+        if not uploaded_files and not archive:
+            return Response({'detail': 'Provide "files" or an "archive".'}, status=status.HTTP_400_BAD_REQUEST)
+        if uploaded_files and archive:
+            return Response({'detail': 'Send either "files" or an "archive", not both.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            folder = request.data.get('folder') or None
+            if folder:
+                # Files and extracted folders land in it: same rule as adding a file to a folder
+                try:
+                    target = get_collection('folders').find_one(
+                        {'_id': ObjectId(folder), 'is_trashed': False}, {'owner_id': 1, 'permissions': 1}
+                    )
+                except InvalidId:
+                    target = None
+                if not target:
+                    return Response({'detail': 'Folder not found.'}, status=status.HTTP_404_NOT_FOUND)
+                if not queries.can_write(target, str(request.user.id)):
+                    return Response({'detail': 'You do not have permission to upload to this folder.'},
+                                    status=status.HTTP_403_FORBIDDEN)
+            tags = json.loads(request.data.get('tags', '[]'))
+            description = request.data.get('description', '')
+
+            if archive:
+                if not zipfile.is_zipfile(archive):
+                    return Response({'detail': 'Only ZIP archives are supported.'},
+                                    status=status.HTTP_400_BAD_REQUEST)
+                archive.seek(0)
+
+                archive_path = stage_archive(archive)
+                job = create_job('archive_upload', str(request.user.id), {
+                    'archive': archive.name, 'folder': folder
+                }, staged_files=[archive_path])
+                start_job(job['_id'], ingest_archive, request.user, archive_path,
+                          folder=folder, tags=tags, description=description)
+            else:
+                job = create_job('batch_upload', str(request.user.id), {
+                    'count': len(uploaded_files), 'folder': folder
+                })
+                # Les fichiers temporaires de Django disparaissent avec la requête,
+                # on les écrit donc dans le stockage avant de rendre la main
+                entries = []
+                for uploaded_file in uploaded_files:
+                    stored_name, blob = store_upload(uploaded_file)
+                    entries.append({
+                        'name': uploaded_file.name,
+                        'original_filename': uploaded_file.name,
+                        'file_path': stored_name,
+                        'size': uploaded_file.size,
+                        **blob,
+                        'folder': folder,
+                    })
+                reservation.settle(sum(entry['stored_size'] for entry in entries))
+                start_job(job['_id'], ingest_entries, request.user, entries,
+                          tags=tags, description=description)
+
+            return Response({
+                'job_id': str(job['_id']),
+                'status': job['status'],
+                'detail': f'Upload job queued, poll /jobs/{job["_id"]}/ for progress.'
+            }, status=status.HTTP_202_ACCEPTED)
+        except Exception as e:
+            return Response({'detail': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class RevisionConflict(Exception):
+    """The file changed since the revision the client sent (If-Match)."""
+
+
+def expected_revision(request):
+    """Revision the client based its change on: If-Match ("<revision>"), or `revision` in the body.
+
+    None when neither is given (or If-Match: *), ValueError when malformed.
+    """
+    if_match = request.META.get('HTTP_IF_MATCH', '').strip()
+    if if_match and if_match != '*':
+        return int(if_match.removeprefix('W/').strip('"'))
+    revision = request.data.get('revision') if hasattr(request, 'data') else None
+    return int(revision) if revision not in (None, '') else None
+
+
+def set_revision_etag(response, revision):
+    response['ETag'] = f'"{revision or 0}"'
+    return response
+
+
+def precondition_failed(file_id):
+    current = get_collection('documents').find_one({'_id': file_id}, {'revision': 1})
+    if not current:
+        return Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+    return set_revision_etag(Response(
+        {'detail': 'The file was modified meanwhile.', 'revision': current.get('revision', 0)},
+        status=status.HTTP_412_PRECONDITION_FAILED
+    ), current.get('revision'))
+
+
+def detail_data(request, file):
+    """Detail response: the file with its sliced arrays, and links to their full listings."""
+    file_id = str(file.pop('_id'))
+    file['id'] = file_id
+    file['links'] = {
+        name: request.build_absolute_uri(reverse(route, args=[file_id]))
+        for name, route in (('versions', 'file-versions'), ('activity', 'file-activity'),
+                            ('comments', 'file-comments'), ('permissions', 'file-permissions'))
+    }
+    return file
+
+
+def set_offset_link(response, request, offset, limit, total):
+    """Link header to the next page of an offset-paginated listing."""
+    if limit and offset + limit < total:
+        params = request.GET.copy()
+        params['offset'] = offset + limit
+        response['Link'] = f'<{request.build_absolute_uri(request.path)}?{params.urlencode()}>; rel="next"'
+    return response
+
+
+def page_params(request):
+    """(offset, limit) of a listing, limit None for everything; ValueError when malformed."""
+    offset = int(request.GET.get('offset', 0))
+    limit = int(request.GET['limit']) if request.GET.get('limit') else None
+    if offset < 0 or (limit is not None and limit <= 0):
+        raise ValueError('offset and limit must be positive.')
+    return offset, limit
 
 
 class FileDetailView(APIView):
@@ -180,45 +290,26 @@ class FileDetailView(APIView):
     def get(self, request, file_id):
         file_id = ObjectId(file_id)
         try:
-            collection = get_collection('documents')
-            file = collection.find_one({'_id': file_id})            
+            # Update last_opened timestamp and read the file in one round trip
+            file = queries.find_and_update(queries.file_detail(file_id, str(request.user.id)))
             if not file:
-                # Check if user has permission to view this file
-                file = collection.find_one({
-                    '_id': file_id,
-                    'permissions.user_id': str(request.user.id),
-                    'permissions.access_level': {'$in': ['view', 'edit', 'admin']}
-                })
-                
-                if not file:
-                    return Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
-            
-            # Update last_opened timestamp
-            collection.update_one(
-                {'_id': file_id},
-                {
-                    '$set': {'last_opened': datetime.now()},
-                    '$push': {
-                        'activities': {
-                            'id': str(uuid.uuid4()),
-                            'user_id': str(request.user.id),
-                            'action': 'view',
-                            'timestamp': datetime.now()
-                        }
-                    }
-                }
-            )
-            
-            # Convert MongoDB _id to string id for serialization
-            file['id'] = str(file.get('_id'))
-            del file['_id']
+                if queries.fetch_one(queries.file_by_id(file_id)._replace(fields={'_id': 1})):
+                    return Response({'detail': 'You do not have permission to view this file.'},
+                                   status=status.HTTP_403_FORBIDDEN)
+                return Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
             
-            return Response(file)
+            return set_revision_etag(Response(detail_data(request, file)), file.get('revision'))
         except Exception as e:
             return Response({'detail': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
     def put(self, request, file_id):
+        file_id = ObjectId(file_id)
         try:
+            try:
+                revision = expected_revision(request)
+            except ValueError:
+                return Response({'detail': 'Invalid revision.'}, status=status.HTTP_400_BAD_REQUEST)
+            
             collection = get_collection('documents')
             file = collection.find_one({'_id': file_id})
             
@@ -257,13 +348,15 @@ class FileDetailView(APIView):
                     'details': {'fields_updated': list(updates.keys())}
                 }
                 
-                collection.update_one(
-                    {'_id': file_id},
-                    {
-                        '$set': updates,
-                        '$push': {'activities': activity}
-                    }
-                )
+                # Conditional on the revision the client read, the updated file comes back in the same round trip
+                updated_file = queries.find_and_update(queries.update_file(file_id, revision, {
+                    '$set': updates,
+                    '$push': {'activities': activity}
+                }))
+                if updated_file is None:
+                    return precondition_failed(file_id)
+                # Ancien et nouveau dossier si le fichier est déplacé
+                bump_for_files(file, {**file, **updates})
                 
                 # If this is a shared file, create a notification for the owner
                 if file.get('owner_id') != str(request.user.id):
@@ -277,15 +370,17 @@ class FileDetailView(APIView):
                         'details': {'fields_updated': list(updates.keys())}
                     }
                     
-                    notifications_collection = get_collection('notifications')
-                    notifications_collection.insert_one(notification)
-            
-            # Get updated file
-            updated_file = collection.find_one({'_id': file_id})
-            updated_file['id'] = str(updated_file.get('_id'))
-            del updated_file['_id']
+                    create_notification(
+                        notification, coalesce=True,
+                        grouped_message=f"Your file '{file.get('title')}' was edited {{count}} times"
+                    )
+            else:
+                # Nothing to change: the precondition still applies
+                if revision is not None and revision != file.get('revision', 0):
+                    return precondition_failed(file_id)
+                updated_file = queries.fetch_one(queries.file_by_id(file_id)._replace(fields=queries.detail_fields()))
             
-            return Response(updated_file)
+            return set_revision_etag(Response(detail_data(request, updated_file)), updated_file.get('revision'))
         except Exception as e:
             return Response({'detail': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
@@ -327,6 +422,7 @@ class FileDetailView(APIView):
                     }
                 }
             )
+            bump_for_files(file)
             
             return Response(status=status.HTTP_204_NO_CONTENT)
         except Exception as e:
@@ -338,59 +434,39 @@ class FileDownloadView(APIView):
     def get(self, request, file_id):
         file_id = ObjectId(file_id)
         try:
-            collection = get_collection('documents')
-            file = collection.find_one({'_id': file_id})
+            file = queries.fetch_one(queries.file_by_id(file_id))
             
             if not file:
                 return Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
             
             # Check if user has permission to download
-            if file.get('owner_id') != str(request.user.id):
-                has_permission = False
-                for perm in file.get('permissions', []):
-                    if perm.get('user_id') == str(request.user.id) and perm.get('access_level') in ['view', 'edit', 'admin']:
-                        has_permission = True
-                        break
-                
-                if not has_permission:
-                    return Response({'detail': 'You do not have permission to download this file.'}, 
-                                   status=status.HTTP_403_FORBIDDEN)
+            if not queries.can_read(file, str(request.user.id)):
+                return Response({'detail': 'You do not have permission to download this file.'}, 
+                               status=status.HTTP_403_FORBIDDEN)
             
             # Get the file path
-            file_path = os.path.join(settings.DOCUMENT_STORAGE_PATH, file.get('file_path'))
+            file_path = file.get('file_path')
             
-            if not os.path.exists(file_path):
+            stored = get_storage().stat(file_path)
+            if stored is None:
                 return Response({'detail': 'File not found on server.'}, status=status.HTTP_404_NOT_FOUND)
             
             # Record download activity
-            collection.update_one(
-                {'_id': file_id},
-                {
-                    '$push': {
-                        'activities': {
-                            'id': str(uuid.uuid4()),
-                            'user_id': str(request.user.id),
-                            'action': 'download',
-                            'timestamp': datetime.now()
-                        }
-                    }
-                }
-            )
+            queries.execute(queries.record_download(file_id, str(request.user.id)))
             
             # Determine content type
             content_type, _ = mimetypes.guess_type(file.get('original_filename'))
             if not content_type:
                 content_type = 'application/octet-stream'
             
-            # Create file response
-            response = FileResponse(
-                open(file_path, 'rb'),
-                content_type=content_type,
+            # Stream from the storage backend (Range requests supported)
+            return blob_response(
+                request, stored, content_type,
                 as_attachment=True,
-                filename=file.get('original_filename')
+                filename=file.get('original_filename'),
+                encoding=file.get('encoding'),
+                size=file.get('size')
             )
-            
-            return response
         except Exception as e:
             return Response({'detail': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -419,9 +495,10 @@ class FilePreviewView(APIView):
                                    status=status.HTTP_403_FORBIDDEN)
             
             # Get the file path
-            file_path = os.path.join(settings.DOCUMENT_STORAGE_PATH, file.get('file_path'))
+            file_path = file.get('file_path')
             
-            if not os.path.exists(file_path):
+            stored = get_storage().stat(file_path)
+            if stored is None:
                 return Response({'detail': 'File not found on server.'}, status=status.HTTP_404_NOT_FOUND)
             
             # Only certain file types can be previewed
@@ -449,13 +526,12 @@ class FilePreviewView(APIView):
             if not content_type:
                 content_type = 'application/octet-stream'
             
-            # Create file response (not as attachment for preview)
-            response = FileResponse(
-                open(file_path, 'rb'),
-                content_type=content_type
+            # Not as attachment for preview; Range lets video and PDF viewers seek
+            return blob_response(
+                request, stored, content_type,
+                encoding=file.get('encoding'),
+                size=file.get('size')
             )
-            
-            return response
         except Exception as e:
             return Response({'detail': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -488,6 +564,7 @@ class FileTrashView(APIView):
                     }
                 }
             )
+            bump_for_files(file)
             
             return Response({'detail': 'File moved to trash.'})
         except Exception as e:
@@ -502,14 +579,15 @@ class FileRestoreView(APIView):
             file = collection.find_one({
                 '_id': file_id, 
                 'owner_id': str(request.user.id),
-                'is_trashed': True
+                'is_trashed': True,
+                'purge_job': {'$exists': False}
             })
             
             if not file:
                 return Response({'detail': 'Not found or not in trash.'}, status=status.HTTP_404_NOT_FOUND)
             
-            collection.update_one(
-                {'_id': file_id},
+            result = collection.update_one(
+                {'_id': file_id, 'purge_job': {'$exists': False}},
                 {
                     '$set': {
                         'is_trashed': False,
@@ -526,6 +604,10 @@ class FileRestoreView(APIView):
                 }
             )
             
+            if not result.matched_count:
+                return Response({'detail': 'Not found or not in trash.'}, status=status.HTTP_404_NOT_FOUND)
+            bump_for_files(file)
+            
             return Response({'detail': 'File restored from trash.'})
         except Exception as e:
             return Response({'detail': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -536,18 +618,13 @@ class TrashListView(APIView):
     def get(self, request):
         try:
             collection = get_collection('documents')
-            trashed_files = list(collection.find({
+            trashed_files = collection.find({
                 'owner_id': str(request.user.id),
-                'is_trashed': True
-            }).sort('trashed_at', -1))
+                'is_trashed': True,
+                'purge_job': {'$exists': False}  # already being deleted
+            }, FILE_LIST.projection).sort('trashed_at', -1)
             
-            # Convert MongoDB _id to string id for serialization
-            for file in trashed_files:
-                file['id'] = str(file.get('_id'))
-                del file['_id']
-            
-            serializer = FileListSerializer(trashed_files, many=True)
-            return Response(serializer.data)
+            return Response(FILE_LIST.many(trashed_files))
         except Exception as e:
             return Response({'detail': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -556,34 +633,17 @@ class EmptyTrashView(APIView):
     
     def delete(self, request):
         try:
-            collection = get_collection('documents')
-            trashed_files = list(collection.find({
-                'owner_id': str(request.user.id),
-                'is_trashed': True
-            }))
-            
-            # Get file paths to delete from disk
-            file_paths = [file.get('file_path') for file in trashed_files]
-            
-            # Delete files from database
-            result = collection.delete_many({
-                'owner_id': str(request.user.id),
-                'is_trashed': True
-            })
-            
-            # Delete files from disk
-            for file_path in file_paths:
-                try:
-                    full_path = os.path.join(settings.DOCUMENT_STORAGE_PATH, file_path)
-                    if os.path.exists(full_path):
-                        os.remove(full_path)
-                except:
-                    pass  # Continue even if one file fails to delete
+            # Claim the trashed files in one update, then delete them in the background:
+            # large trashes used to time out doing it inside the request
+            job = create_job('empty_trash', str(request.user.id))
+            count = claim_trash(job['_id'], {'owner_id': str(request.user.id)})
+            start_job(job['_id'], purge_user_trash)
             
             return Response({
-                'detail': f'Deleted {result.deleted_count} files permanently.',
-                'count': result.deleted_count
-            })
+                'detail': f'Deleting {count} files permanently.',
+                'count': count,
+                'job_id': str(job['_id'])
+            }, status=status.HTTP_202_ACCEPTED)
         except Exception as e:
             return Response({'detail': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -628,6 +688,7 @@ class FileFavoriteView(APIView):
                     }
                 }
             )
+            bump_for_files(file)
             
             return Response({'is_favorite': is_favorite})
         except Exception as e:
@@ -666,24 +727,19 @@ class FavoriteListView(APIView):
                     # Dernière action : si c'est 'favorite', on garde
                     last_action = sorted(user_fav_actions, key=lambda a: a['timestamp'], reverse=True)[0]
                     if last_action['action'] == 'favorite':
-                        doc['id'] = str(doc['_id'])
-                        del doc['_id']
                         doc['_favorite_timestamp'] = last_action['timestamp']  # Temporaire pour tri
                         favorites.append(doc)
 
             favorites = sorted(favorites, key=lambda d: d['_favorite_timestamp'], reverse=True)
 
-            for doc in favorites:
-                del doc['_favorite_timestamp']
-
-            serializer = FileListSerializer(favorites, many=True)
-            return Response(serializer.data)
+            return Response(FILE_LIST.many(favorites))
         except Exception as e:
             return Response({'detail': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 class FileShareView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     
+    @idempotent
     def post(self, request, file_id):
         file_id = ObjectId(file_id)
         try:
@@ -731,6 +787,7 @@ class FileShareView(APIView):
                         {'_id': file_id},
                         {'$set': {'permissions': permissions}}
                     )
+                    bump_for_files(file)
                     
                     return Response({'detail': 'Permission updated successfully.'})
             
@@ -770,8 +827,9 @@ class FileShareView(APIView):
                 'details': {'access_level': access_level}
             }
             
-            notifications_collection = get_collection('notifications')
-            notifications_collection.insert_one(notification)
+            create_notification(notification)
+            # Le nouveau destinataire voit le fichier dans ses partages
+            bump_for_files(file, {'permissions': [new_permission]})
             
             return Response({'detail': 'File shared successfully.'})
         except Exception as e:
@@ -878,6 +936,7 @@ class FilePermissionsView(APIView):
                     }
                 }
             )
+            bump_for_files(file)
             
             return Response({'detail': 'Permission revoked successfully.'})
         except Exception as e:
@@ -947,6 +1006,7 @@ class FileRevokePermissionView(APIView):
                     }
                 }
             )
+            bump_for_files(file)
             
             if result.modified_count > 0:
                 return Response({'detail': 'Permission revoked successfully.'})
@@ -961,27 +1021,16 @@ class FileRevokePermissionView(APIView):
 class SharedFilesView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     
+    @cached_response
     def get(self, request):
         try:
             collection = get_collection('documents')
-            shared_files = list(collection.find({
+            shared_files = collection.find({
                 'permissions.user_id': str(request.user.id),
                 'is_trashed': False
-            }).sort('updated_at', -1))
-            
-            # Convert MongoDB _id to string id for serialization
-            for file in shared_files:
-                file['id'] = str(file.get('_id'))
-                del file['_id']
-                
-                # Add access level information
-                for perm in file.get('permissions', []):
-                    if perm.get('user_id') == str(request.user.id):
-                        file['access_level'] = perm.get('access_level')
-                        break
+            }, FILE_LIST.projection).sort('updated_at', -1)
             
-            serializer = FileListSerializer(shared_files, many=True)
-            return Response(serializer.data)
+            return Response(FILE_LIST.many(shared_files))
         except Exception as e:
             return Response({'detail': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -992,43 +1041,32 @@ class FileCommentsView(APIView):
         file_id = ObjectId(file_id)
         try:
             collection = get_collection('documents')
-            file = collection.find_one({'_id': file_id})
+            file = collection.find_one({'_id': file_id}, {'owner_id': 1, 'permissions': 1})
             
             if not file:
                 return Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
             
             # Check if user has permission to view comments
-            if file.get('owner_id') != str(request.user.id):
-                has_permission = False
-                for perm in file.get('permissions', []):
-                    if perm.get('user_id') == str(request.user.id) and perm.get('access_level') in ['view', 'edit', 'admin']:
-                        has_permission = True
-                        break
-                
-                if not has_permission:
-                    return Response({'detail': 'You do not have permission to view comments.'}, 
-                                   status=status.HTTP_403_FORBIDDEN)
-            
-            comments = file.get('comments', [])
-            
-            # Add user details to comments
-            for comment in comments:
-                try:
-                    user = User.objects.get(id=comment.get('user_id'))
-                    comment['username'] = user.username
-                    comment['user_name'] = f"{user.first_name} {user.last_name}".strip() or user.username
-                except User.DoesNotExist:
-                    comment['username'] = 'Unknown User'
-                    comment['user_name'] = 'Unknown User'
-            
-            # Sort comments by created_at
-            comments.sort(key=lambda x: x.get('created_at', ''), reverse=True)
+            if not queries.can_read(file, str(request.user.id)):
+                return Response({'detail': 'You do not have permission to view comments.'}, 
+                               status=status.HTTP_403_FORBIDDEN)
             
-            serializer = CommentSerializer(comments, many=True)
-            return Response(serializer.data)
+            # Top-level comments, or the replies to ?parent=, newest first, one page at a time
+            try:
+                limit = int(request.GET.get('limit', 50))
+                before = request.GET.get('before')
+                before = queries.parse_page_cursor(before, str) if before else None
+            except ValueError:
+                return Response({'detail': 'Invalid cursor.'}, status=status.HTTP_400_BAD_REQUEST)
+            
+            comments = add_user_names(queries.fetch(
+                queries.comments(file_id, request.GET.get('parent'), limit, before)
+            ))
+            return set_next_link(Response(comments), request, comments, limit)
         except Exception as e:
             return Response({'detail': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
+    @idempotent
     def post(self, request, file_id):
         file_id = ObjectId(file_id)
         try:
@@ -1036,60 +1074,42 @@ class FileCommentsView(APIView):
                 return Response({'detail': 'Comment text is required.'}, status=status.HTTP_400_BAD_REQUEST)
             
             collection = get_collection('documents')
-            file = collection.find_one({'_id': file_id})
+            file = collection.find_one({'_id': file_id}, {'owner_id': 1, 'permissions': 1, 'title': 1})
             
             if not file:
                 return Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
             
             # Check if user has permission to comment
-            if file.get('owner_id') != str(request.user.id):
-                has_permission = False
-                for perm in file.get('permissions', []):
-                    if perm.get('user_id') == str(request.user.id) and perm.get('access_level') in ['edit', 'admin']:
-                        has_permission = True
-                        break
-                
-                if not has_permission:
-                    return Response({'detail': 'You do not have permission to comment on this file.'}, 
-                                   status=status.HTTP_403_FORBIDDEN)
+            if not queries.can_write(file, str(request.user.id)):
+                return Response({'detail': 'You do not have permission to comment on this file.'}, 
+                               status=status.HTTP_403_FORBIDDEN)
             
-            # Create new comment
-            now = datetime.now()
-            comment = {
-                'id': str(uuid.uuid4()),
-                'user_id': str(request.user.id),
-                'text': request.data['text'],
-                'created_at': now,
-                'updated_at': now
-            }
+            # Replies go to a top-level comment of the same file
+            parent = None
+            if request.data.get('parent_id'):
+                parent = get_comment(file_id, request.data['parent_id'])
+                if not parent or parent.get('parent_id'):
+                    return Response({'detail': 'parent_id must be a top-level comment of this file.'},
+                                   status=status.HTTP_400_BAD_REQUEST)
             
-            collection.update_one(
-                {'_id': file_id},
-                {
-                    '$push': {
-                        'comments': comment,
-                        'activities': {
-                            'id': str(uuid.uuid4()),
-                            'user_id': str(request.user.id),
-                            'action': 'comment',
-                            'timestamp': now,
-                            'details': {'comment_id': comment['id']}
-                        }
-                    }
-                }
-            )
+            comment = add_comment(file_id, str(request.user.id), request.data['text'], parent)
             
             # Add user details to the response
+            comment = COMMENT(comment)
             comment['user_name'] = f"{request.user.first_name} {request.user.last_name}".strip()
             
-            # Create notification for the file owner if comment was made by someone else
-            if file.get('owner_id') != str(request.user.id):
+            # Notify the file owner, and the author of the comment replied to
+            recipients = {file.get('owner_id'): ('commented on your file', 'new comments on your file')}
+            if parent:
+                recipients.setdefault(parent.get('user_id'), ('replied to your comment on', 'new replies on'))
+            recipients.pop(str(request.user.id), None)
+            for user_id, (action, grouped) in recipients.items():
                 notification = {
-                    'user_id': file.get('owner_id'),
+                    'user_id': user_id,
                     'type': 'comment',
-                    'message': f"{request.user.username} commented on your file '{file.get('title')}'",
+                    'message': f"{request.user.username} {action} '{file.get('title')}'",
                     'file': file_id,
-                    'created_at': now,
+                    'created_at': datetime.now(),
                     'is_read': False,
                     'details': {
                         'comment_id': comment['id'],
@@ -1097,8 +1117,10 @@ class FileCommentsView(APIView):
                     }
                 }
                 
-                notifications_collection = get_collection('notifications')
-                notifications_collection.insert_one(notification)
+                create_notification(
+                    notification, coalesce=True,
+                    grouped_message=f"{{count}} {grouped} '{file.get('title')}'"
+                )
             
             return Response(comment)
         except Exception as e:
@@ -1113,36 +1135,17 @@ class FileCommentDetailView(APIView):
             if 'text' not in request.data:
                 return Response({'detail': 'Comment text is required.'}, status=status.HTTP_400_BAD_REQUEST)
             
-            collection = get_collection('documents')
-            file = collection.find_one({'_id': file_id})
-            
-            if not file:
-                return Response({'detail': 'File not found.'}, status=status.HTTP_404_NOT_FOUND)
-            
-            # Find the comment
-            comment_found = False
-            comments = file.get('comments', [])
-            for i, comment in enumerate(comments):
-                if comment.get('id') == comment_id:
-                    # Check if user is the comment author
-                    if comment.get('user_id') != str(request.user.id):
-                        return Response({'detail': 'You can only edit your own comments.'}, 
-                                       status=status.HTTP_403_FORBIDDEN)
-                    
-                    # Update the comment
-                    comments[i]['text'] = request.data['text']
-                    comments[i]['updated_at'] = datetime.now()
-                    comment_found = True
-                    break
-            
-            if not comment_found:
+            comment = get_comment(file_id, comment_id)
+            if not comment:
                 return Response({'detail': 'Comment not found.'}, status=status.HTTP_404_NOT_FOUND)
             
-            # Update the file with modified comments
-            collection.update_one(
-                {'_id': file_id},
-                {'$set': {'comments': comments}}
-            )
+            # Check if user is the comment author
+            if comment.get('user_id') != str(request.user.id):
+                return Response({'detail': 'You can only edit your own comments.'}, 
+                               status=status.HTTP_403_FORBIDDEN)
+            
+            # One comment document, the file is left alone
+            edit_comment(comment, request.data['text'])
             
             return Response({'detail': 'Comment updated.'})
         except Exception as e:
@@ -1151,48 +1154,123 @@ class FileCommentDetailView(APIView):
     def delete(self, request, file_id, comment_id):
         file_id = ObjectId(file_id)
         try:
-            collection = get_collection('documents')
-            file = collection.find_one({'_id': file_id})
-            
-            if not file:
-                return Response({'detail': 'File not found.'}, status=status.HTTP_404_NOT_FOUND)
-            
-            # Find the comment
-            comment_found = False
-            comment_user_id = None
-            comments = file.get('comments', [])
-            for comment in comments:
-                if comment.get('id') == comment_id:
-                    comment_user_id = comment.get('user_id')
-                    comment_found = True
-                    break
-            
-            if not comment_found:
+            comment = get_comment(file_id, comment_id)
+            if not comment:
                 return Response({'detail': 'Comment not found.'}, status=status.HTTP_404_NOT_FOUND)
             
             # Check permissions: either comment author or file owner can delete
-            if comment_user_id != str(request.user.id) and file.get('owner_id') != str(request.user.id):
-                return Response({'detail': 'You can only delete your own comments or comments on your files.'}, 
-                               status=status.HTTP_403_FORBIDDEN)
+            if comment.get('user_id') != str(request.user.id):
+                file = get_collection('documents').find_one({'_id': file_id}, {'owner_id': 1})
+                if not file or file.get('owner_id') != str(request.user.id):
+                    return Response({'detail': 'You can only delete your own comments or comments on your files.'}, 
+                                   status=status.HTTP_403_FORBIDDEN)
             
-            # Remove the comment
-            collection.update_one(
-                {'_id': file_id},
-                {'$pull': {'comments': {'id': comment_id}}}
-            )
+            # Remove the comment, with its replies
+            delete_comment(comment)
             
             return Response({'detail': 'Comment deleted.'}, status=status.HTTP_204_NO_CONTENT)
         except Exception as e:
             return Response({'detail': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+def add_version(request, file, file_path, size, blob, reservation, revision=None):
+    """Record a stored blob as the new current version of file, returns (version, file revision).
+
+    RevisionConflict when the file is no longer at `revision`.
+    """
+    collection = get_collection('documents')
+
+    # Next version number, allocated atomically: concurrent uploads on other nodes get their own
+    if 'version_seq' not in file:
+        queries.execute(queries.init_version_seq(file))
+    allocated = queries.find_and_update(queries.allocate_version(file['_id'], revision))
+    if allocated is None:
+        raise RevisionConflict()
+    next_version = allocated['version_seq']
+
+    # Create new version
+    now = datetime.now()
+    new_version = {
+        'id': str(uuid.uuid4()),
+        'file_path': file_path,
+        'version_number': next_version,
+        'size': size,
+        **blob,
+        'created_at': now,
+        'created_by': str(request.user.id)
+    }
+
+    # Update file with new version
+    push = {
+        'versions': new_version,
+        'activities': {
+            'id': str(uuid.uuid4()),
+            'user_id': str(request.user.id),
+            'action': 'version',
+            'timestamp': now,
+            'details': {'version_number': next_version}
+        }
+    }
+    result = collection.update_one(
+        # Unless a newer number was allocated meanwhile, that upload becomes the current one
+        {'_id': file['_id'], 'version_seq': next_version},
+        {
+            '$push': push,
+            '$set': {
+                'file_path': file_path,  # Update main file to point to newest version
+                'size': size,
+                **blob,
+                'updated_at': now
+            }
+        }
+    )
+    if not result.matched_count:
+        collection.update_one({'_id': file['_id']}, {'$push': push})
+    reservation.settle(blob['stored_size'])
+    bump_for_files(file)
+
+    # Re-encode the new version as a delta against the last snapshot, off the request
+    if settings.VERSION_DELTA_ENABLED:
+        job = create_job('encode_version', str(request.user.id), {
+            'file_id': str(file['_id']), 'version_id': new_version['id']
+        })
+        start_job(job['_id'], encode_version, file['_id'], new_version['id'])
+
+    # Add user details to the response
+    new_version['created_by_username'] = request.user.username
+    new_version['created_by_name'] = f"{request.user.first_name} {request.user.last_name}".strip() or request.user.username
+
+    # Create notification for the file owner if version was added by someone else
+    if file.get('owner_id') != str(request.user.id):
+        notification = {
+            'user_id': file.get('owner_id'),
+            'type': 'edit',
+            'message': f"{request.user.username} added a new version to your file '{file.get('title')}'",
+            'file': file['_id'],
+            'created_at': now,
+            'is_read': False,
+            'details': {'version_number': next_version}
+        }
+
+        create_notification(
+            notification, coalesce=True,
+            grouped_message=f"{{count}} new versions of your file '{file.get('title')}'"
+        )
+
+    return new_version, allocated['revision']
+
+
 class FileVersionsView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     
     def get(self, request, file_id):
         file_id = ObjectId(file_id)
         try:
-            collection = get_collection('documents')
-            file = collection.find_one({'_id': file_id})
+            try:
+                offset, limit = page_params(request)
+            except ValueError:
+                return Response({'detail': 'Invalid offset or limit.'}, status=status.HTTP_400_BAD_REQUEST)
+            # Only the requested page of the versions array leaves the server
+            file = queries.fetch_one(queries.embedded_page(file_id, 'versions', offset, limit))
             
             if not file:
                 return Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
@@ -1209,7 +1287,7 @@ class FileVersionsView(APIView):
                     return Response({'detail': 'You do not have permission to view file versions.'}, 
                                    status=status.HTTP_403_FORBIDDEN)
             
-            versions = file.get('versions', [])
+            versions = queries.newest_first(file, 'versions', offset, limit)
             
             # Add user details to versions
             for version in versions:
@@ -1225,16 +1303,14 @@ class FileVersionsView(APIView):
             versions.sort(key=lambda x: x.get('version_number', 0), reverse=True)
             
             serializer = FileVersionSerializer(versions, many=True)
-            return Response(serializer.data)
+            return set_offset_link(Response(serializer.data), request, offset, limit, file.get('count', 0))
         except Exception as e:
             return Response({'detail': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
     def post(self, request, file_id):
         file_id = ObjectId(file_id)
+        reservation = None
         try:
-            if 'file' not in request.FILES:
-                return Response({'detail': 'File is required.'}, status=status.HTTP_400_BAD_REQUEST)
-            
             collection = get_collection('documents')
             file = collection.find_one({'_id': file_id})
             
@@ -1253,79 +1329,41 @@ class FileVersionsView(APIView):
                     return Response({'detail': 'You do not have permission to add versions to this file.'}, 
                                    status=status.HTTP_403_FORBIDDEN)
             
-            uploaded_file = request.FILES['file']
+            # Versions count against the owner's quota, reserved before the body is read
+            reservation, error = reserve_upload(request, file.get('owner_id'))
+            if error:
+                return error
             
-            # Generate a unique filename for the new version
-            file_extension = os.path.splitext(uploaded_file.name)[1]
-            unique_filename = f"{uuid.uuid4()}{file_extension}"
-            
-            # Save file to disk
-            file_path = os.path.join(settings.DOCUMENT_STORAGE_PATH, unique_filename)
-            with open(file_path, 'wb+') as destination:
-                for chunk in uploaded_file.chunks():
-                    destination.write(chunk)
-            
-            # Get next version number
-            versions = file.get('versions', [])
-            next_version = 1
-            if versions:
-                next_version = max(v.get('version_number', 0) for v in versions) + 1
-            
-            # Create new version
-            now = datetime.now()
-            new_version = {
-                'id': str(uuid.uuid4()),
-                'file_path': unique_filename,
-                'version_number': next_version,
-                'size': uploaded_file.size,
-                'created_at': now,
-                'created_by': str(request.user.id)
-            }
+            if 'file' not in request.FILES:
+                return Response({'detail': 'File is required.'}, status=status.HTTP_400_BAD_REQUEST)
             
-            # Update file with new version
-            collection.update_one(
-                {'_id': file_id},
-                {
-                    '$push': {
-                        'versions': new_version,
-                        'activities': {
-                            'id': str(uuid.uuid4()),
-                            'user_id': str(request.user.id),
-                            'action': 'version',
-                            'timestamp': now,
-                            'details': {'version_number': next_version}
-                        }
-                    },
-                    '$set': {
-                        'file_path': unique_filename,  # Update main file to point to newest version
-                        'size': uploaded_file.size,
-                        'updated_at': now
-                    }
-                }
-            )
+            uploaded_file = request.FILES['file']
             
-            # Add user details to the response
-            new_version['created_by_username'] = request.user.username
-            new_version['created_by_name'] = f"{request.user.first_name} {request.user.last_name}".strip() or request.user.username
+            # Checked before storing the upload, and again atomically when the number is allocated
+            try:
+                revision = expected_revision(request)
+            except ValueError:
+                return Response({'detail': 'Invalid revision.'}, status=status.HTTP_400_BAD_REQUEST)
+            if revision is not None and revision != file.get('revision', 0):
+                return precondition_failed(file_id)
             
-            # Create notification for the file owner if version was added by someone else
-            if file.get('owner_id') != str(request.user.id):
-                notification = {
-                    'user_id': file.get('owner_id'),
-                    'type': 'edit',
-                    'message': f"{request.user.username} added a new version to your file '{file.get('title')}'",
-                    'file': file_id,
-                    'created_at': now,
-                    'is_read': False,
-                    'details': {'version_number': next_version}
-                }
-                
-                notifications_collection = get_collection('notifications')
-                notifications_collection.insert_one(notification)
+            # Save file to disk under a unique filename, hashing it on the way
+            unique_filename, blob = store_upload(uploaded_file)
             
-            return Response(new_version)
+            try:
+                new_version, revision = add_version(
+                    request, file, unique_filename, uploaded_file.size, blob, reservation, revision
+                )
+            except RevisionConflict:
+                get_storage().delete(unique_filename)
+                return precondition_failed(file_id)
+            
+            return set_revision_etag(Response(new_version), revision)
         except Exception as e:
             return Response({'detail': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        finally:
+            if reservation:
+                reservation.release()
 
 class FileVersionDetailView(APIView):
     permission_classes = [permissions.IsAuthenticated]
@@ -1362,9 +1400,10 @@ class FileVersionDetailView(APIView):
                 return Response({'detail': 'Version not found.'}, status=status.HTTP_404_NOT_FOUND)
             
             # Get the file path for the version
-            file_path = os.path.join(settings.DOCUMENT_STORAGE_PATH, version.get('file_path'))
+            file_path = version.get('file_path')
             
-            if not os.path.exists(file_path):
+            stored = get_storage().stat(file_path)
+            if stored is None:
                 return Response({'detail': 'Version file not found on server.'}, status=status.HTTP_404_NOT_FOUND)
             
             # Determine content type
@@ -1372,15 +1411,13 @@ class FileVersionDetailView(APIView):
             if not content_type:
                 content_type = 'application/octet-stream'
             
-            # Create file response
-            response = FileResponse(
-                open(file_path, 'rb'),
-                content_type=content_type,
+            return blob_response(
+                request, stored, content_type,
                 as_attachment=True,
-                filename=f"{os.path.splitext(file.get('original_filename'))[0]}_v{version.get('version_number')}{os.path.splitext(file.get('original_filename'))[1]}"
+                filename=f"{os.path.splitext(file.get('original_filename'))[0]}_v{version.get('version_number')}{os.path.splitext(file.get('original_filename'))[1]}",
+                encoding=version.get('encoding'),
+                size=version.get('size')
             )
-            
-            return response
         except Exception as e:
             return Response({'detail': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
@@ -1422,6 +1459,7 @@ class FileVersionDetailView(APIView):
                     '$set': {
                         'file_path': version.get('file_path'),
                         'size': version.get('size'),
+                        **blob_fields(version),
                         'updated_at': datetime.now()
                     },
                     '$push': {
@@ -1435,6 +1473,7 @@ class FileVersionDetailView(APIView):
                     }
                 }
             )
+            bump_for_files(file)
             
             return Response({'detail': f"Restored to version {version.get('version_number')}."})
         except Exception as e:
@@ -1446,8 +1485,12 @@ class FileActivityView(APIView):
     def get(self, request, file_id):
         file_id = ObjectId(file_id)
         try:
-            collection = get_collection('documents')
-            file = collection.find_one({'_id': file_id})
+            try:
+                offset, limit = page_params(request)
+            except ValueError:
+                return Response({'detail': 'Invalid offset or limit.'}, status=status.HTTP_400_BAD_REQUEST)
+            # Only the requested page of the activities array leaves the server
+            file = queries.fetch_one(queries.embedded_page(file_id, 'activities', offset, limit))
             
             if not file:
                 return Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
@@ -1464,7 +1507,7 @@ class FileActivityView(APIView):
                     return Response({'detail': 'You do not have permission to view file activity.'}, 
                                    status=status.HTTP_403_FORBIDDEN)
             
-            activities = file.get('activities', [])
+            activities = queries.newest_first(file, 'activities', offset, limit)
             
             # Add user details to activities
             for activity in activities:
@@ -1480,7 +1523,7 @@ class FileActivityView(APIView):
             activities.sort(key=lambda x: x.get('timestamp', ''), reverse=True)
             
             serializer = FileActivitySerializer(activities, many=True)
-            return Response(serializer.data)
+            return set_offset_link(Response(serializer.data), request, offset, limit, file.get('count', 0))
         except Exception as e:
             return Response({'detail': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -1539,22 +1582,16 @@ class RecentFilesView(APIView):
             collection = get_collection('documents')
             
             # Find recently opened files (where the user is either owner or has permissions)
-            recent_files = list(collection.find({
+            recent_files = collection.find({
                 '$or': [
                     {'owner_id': str(request.user.id)},
                     {'permissions.user_id': str(request.user.id)}
                 ],
                 'is_trashed': False,
                 'last_opened': {'$exists': True}
-            }).sort('last_opened', -1).limit(10))
-            
-            # Convert MongoDB _id to string id for serialization
-            for file in recent_files:
-                file['id'] = str(file.get('_id'))
-                del file['_id']
+            }, FILE_LIST.projection).sort('last_opened', -1).limit(10)
             
-            serializer = FileListSerializer(recent_files, many=True)
-            return Response(serializer.data)
+            return Response(FILE_LIST.many(recent_files))
         except Exception as e:
             return Response({'detail': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         
@@ -1625,19 +1662,14 @@ class FileSortByDateView(APIView):
             # Traiter les résultats
             serialized_files = []
             for file in files:
-                file_id = str(file.pop('_id'))
-                reordered_file = {'id': file_id, **file}
-                
                 # Ajouter des informations sur l'accès si c'est un fichier partagé
                 if include_shared and file.get('owner_id') != str(request.user.id):
                     for perm in file.get('permissions', []):
                         if perm.get('user_id') == str(request.user.id):
-                            reordered_file['access_level'] = perm.get('access_level')
+                            file['access_level'] = perm.get('access_level')
                             break
                 
-                from ..serializers import FileListSerializer
-                serializer = FileListSerializer(instance=reordered_file)
-                serialized_files.append(serializer.data)
+                serialized_files.append(FILE_LIST(file))
             
             return Response({
                 'files': serialized_files,
@@ -1725,8 +1757,6 @@ class FileSortBySizeView(APIView):
             serialized_files = []
             
             for file in files:
-                file_id = str(file.pop('_id'))
-                reordered_file = {'id': file_id, **file}
                 total_size += file.get('size', 0)
                 
                 # Ajouter des informations lisibles sur la taille
@@ -1740,18 +1770,16 @@ class FileSortBySizeView(APIView):
                 else:
                     size_human = f"{size_bytes / (1024 * 1024 * 1024):.1f} GB"
                 
-                reordered_file['size_human'] = size_human
+                file['size_human'] = size_human
                 
                 # Ajouter des informations sur l'accès si c'est un fichier partagé
                 if include_shared and file.get('owner_id') != str(request.user.id):
                     for perm in file.get('permissions', []):
                         if perm.get('user_id') == str(request.user.id):
-                            reordered_file['access_level'] = perm.get('access_level')
+                            file['access_level'] = perm.get('access_level')
                             break
                 
-                from ..serializers import FileListSerializer
-                serializer = FileListSerializer(instance=reordered_file)
-                serialized_files.append(serializer.data)
+                serialized_files.append(FILE_LIST(file))
             
             # Calculer la taille totale lisible
             if total_size < 1024:
@@ -1836,9 +1864,6 @@ class FileSortByTypeView(APIView):
             type_counts = {}
             
             for file in files:
-                file_id = str(file.pop('_id'))
-                reordered_file = {'id': file_id, **file}
-                
                 # Compter les types
                 file_type = file.get('type', 'other')
                 type_counts[file_type] = type_counts.get(file_type, 0) + 1
@@ -1847,12 +1872,10 @@ class FileSortByTypeView(APIView):
                 if include_shared and file.get('owner_id') != str(request.user.id):
                     for perm in file.get('permissions', []):
                         if perm.get('user_id') == str(request.user.id):
-                            reordered_file['access_level'] = perm.get('access_level')
+                            file['access_level'] = perm.get('access_level')
                             break
                 
-                from ..serializers import FileListSerializer
-                serializer = FileListSerializer(instance=reordered_file)
-                serialized_files.append(serializer.data)
+                serialized_files.append(FILE_LIST(file))
             
             # Grouper par type si demandé
             if group_by_type:
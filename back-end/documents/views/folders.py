@@ -6,8 +6,10 @@ from datetime import datetime
 import uuid
 from bson import ObjectId
 from ..models import Folder, File
-from ..serializers import FolderSerializer, FileListSerializer
+from ..serializers import FolderSerializer
+from ..projectors import FILE_LIST
 from ..utils.mongodb import get_collection
+from ..utils.cache import cached_response, bump_for_files, bump_for_folder
 from bson import ObjectId
 from datetime import datetime
 from rest_framework.response import Response
@@ -101,6 +103,7 @@ class FolderListView(APIView):
             }
 
             result = folder_collection.insert_one(folder_data)
+            bump_for_folder(folder_data)
 
             response_data = {
                 'id': str(result.inserted_id),
@@ -230,6 +233,9 @@ class FolderDetailView(APIView):
             if updates:
                 updates['updated_at'] = datetime.now()
                 collection.update_one({'_id': folder_id}, {'$set': updates})
+                # Ancien et nouveau parent en cas de déplacement
+                bump_for_folder(folder)
+                bump_for_folder({**folder, **updates})
             
             # Get updated folder
             updated_folder = collection.find_one({'_id': folder_id})
@@ -273,8 +279,13 @@ class FolderDetailView(APIView):
                 }
             )
             
+            bump_for_folder(folder)
+            
             # Also move all files in this folder to trash
             files_collection = get_collection('documents')
+            files = list(files_collection.find(
+                {'folder': folder_id, 'is_trashed': False}, {'owner_id': 1, 'permissions.user_id': 1, 'folder': 1}
+            ))
             files_collection.update_many(
                 {'folder': folder_id, 'is_trashed': False},
                 {
@@ -284,6 +295,8 @@ class FolderDetailView(APIView):
                     }
                 }
             )
+            # Après la mise à jour : le journal des changements doit voir l'état final
+            bump_for_files(*files)
             
             # Also move all sub-folders to trash
             def trash_subfolders(parent_id):
@@ -303,6 +316,10 @@ class FolderDetailView(APIView):
                     )
                     
                     # Move files in subfolder to trash
+                    bump_for_folder(subfolder)
+                    files = list(files_collection.find(
+                        {'folder': subfolder_id, 'is_trashed': False}, {'owner_id': 1, 'permissions.user_id': 1, 'folder': 1}
+                    ))
                     files_collection.update_many(
                         {'folder': subfolder_id, 'is_trashed': False},
                         {
@@ -312,6 +329,7 @@ class FolderDetailView(APIView):
                             }
                         }
                     )
+                    bump_for_files(*files)
                     
                     # Recursively trash sub-subfolders
                     trash_subfolders(subfolder_id)
@@ -325,6 +343,7 @@ class FolderDetailView(APIView):
 class FolderFilesView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     
+    @cached_response
     def get(self, request, folder_id):
         folder_id = ObjectId(folder_id)
         try:
@@ -354,16 +373,9 @@ class FolderFilesView(APIView):
             files_cursor = files_collection.find({
                 'folder': str(folder_id),
                 'is_trashed': False
-            }).sort('title', 1)
+            }, FILE_LIST.projection).sort('title', 1)
 
-            files = list(files_cursor)
-            
-            # Convert MongoDB _id to string id for serialization
-            for file in files:
-                file['id'] = str(file.get('_id'))
-                del file['_id']
-            
-            serializer = FileListSerializer(files, many=True)
+            files = FILE_LIST.many(files_cursor)
             
             # Get subfolders
             subfolders = list(folders_collection.find({
@@ -382,7 +394,7 @@ class FolderFilesView(APIView):
                     'name': str(folder.get('name')),
                     'parent_folder': str(folder.get('parent_folder'))
                 },
-                'files': serializer.data,
+                'files': files,
                 'subfolders': subfolders
             })
         except Exception as e:
@@ -0,0 +1,45 @@
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework import status, permissions
+
+from ..utils.mongodb import get_collection
+
+class IntegrityReportView(APIView):
+    """
+    Problems found by `manage.py scrub_storage` (admin only)
+    Query parameters:
+    - status: 'missing', 'mismatch' ou 'unreadable' (optionnel)
+    - owner_id: limiter aux fichiers d'un utilisateur (optionnel)
+    - limit: nombre maximum de résultats (default: 100)
+    """
+    permission_classes = [permissions.IsAdminUser]
+    
+    def get(self, request):
+        try:
+            collection = get_collection('integrity_reports')
+            
+            query = {}
+            if request.query_params.get('status'):
+                query['status'] = request.query_params['status']
+            if request.query_params.get('owner_id'):
+                query['owner_id'] = request.query_params['owner_id']
+            limit = int(request.query_params.get('limit', 100))
+            
+            reports = list(collection.find(query).sort('last_seen_at', -1).limit(limit))
+            for report in reports:
+                report['id'] = str(report.pop('_id'))
+                report['file_id'] = str(report['file_id'])
+            
+            counts = {
+                row['_id']: row['count']
+                for row in collection.aggregate([{'$group': {'_id': '$status', 'count': {'$sum': 1}}}])
+            }
+            checkpoint = get_collection('scrub_checkpoints').find_one({'_id': 'storage_scrub'}, {'_id': 0})
+            
+            return Response({
+                'counts': counts,
+                'last_scrub': checkpoint,
+                'results': reports
+            })
+        except Exception as e:
+            return Response({'detail': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
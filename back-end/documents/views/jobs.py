@@ -0,0 +1,33 @@
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework import status, permissions
+from bson import ObjectId
+from bson.errors import InvalidId
+
+from ..utils.mongodb import get_collection
+
+class JobDetailView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get(self, request, job_id):
+        try:
+            try:
+                job_id = ObjectId(job_id)
+            except InvalidId:
+                return Response({'detail': 'Invalid job id.'}, status=status.HTTP_400_BAD_REQUEST)
+            
+            collection = get_collection('jobs')
+            
+            # Hide the manifest unless asked for, it can hold thousands of entries
+            projection = {'traceback': 0, 'staged_files': 0}
+            if request.query_params.get('manifest', 'false').lower() != 'true':
+                projection['manifest'] = 0
+            
+            job = collection.find_one({'_id': job_id, 'owner_id': str(request.user.id)}, projection)
+            if not job:
+                return Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+            
+            job['id'] = str(job.pop('_id'))
+            return Response(job)
+        except Exception as e:
+            return Response({'detail': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
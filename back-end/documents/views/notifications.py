@@ -1,91 +1,118 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, permissions
-from datetime import datetime
+from django.conf import settings
+from bson import ObjectId
+from bson.errors import InvalidId
+
+from .. import queries
+from ..utils.notifications import get_digest_frequency, get_unread_count, mark_read, set_digest_frequency
+
+
+def feed_params(request):
+    """(unread_only, limit, before) of a notifications request.
+
+    ValueError with the message for the client on a bad limit or cursor; the
+    limit is clamped to 1..NOTIFICATION_PAGE_MAX so every page is bounded.
+    """
+    unread_only = request.GET.get('unread', 'false').lower() == 'true'
+    try:
+        limit = int(request.GET.get('limit', settings.NOTIFICATION_PAGE_SIZE))
+    except ValueError:
+        raise ValueError('limit must be a number.') from None
+    limit = min(max(limit, 1), settings.NOTIFICATION_PAGE_MAX)
+    before = request.GET.get('before')
+    try:
+        before = queries.parse_page_cursor(before) if before else None
+    except ValueError:
+        raise ValueError('Invalid cursor.') from None
+    return unread_only, limit, before
+
+
+def set_next_link(response, request, items, limit):
+    """Link header to the next page (keyset cursor), when this one is full."""
+    if limit and len(items) == limit:
+        cursor = queries.page_cursor(items[-1])
+        if cursor:
+            params = request.GET.copy()
+            params['before'] = cursor
+            response['Link'] = f'<{request.build_absolute_uri(request.path)}?{params.urlencode()}>; rel="next"'
+    return response
 
-from ..serializers import NotificationSerializer
-from ..utils.mongodb import get_collection
 
 class NotificationsView(APIView):
     permission_classes = [permissions.IsAuthenticated]
-    
+
     def get(self, request):
         try:
-            collection = get_collection('notifications')
-            
             # Get query parameters
-            unread_only = request.query_params.get('unread', 'false').lower() == 'true'
-            limit = int(request.query_params.get('limit', 50))
-            
-            # Base query
-            query = {'user_id': str(request.user.id)}
-            
-            # Add unread filter if requested
-            if unread_only:
-                query['is_read'] = False
-            
-            # Get notifications
-            notifications = list(collection.find(query).sort('created_at', -1).limit(limit))
-            
-            # Convert MongoDB _id to string id for serialization
-            for notification in notifications:
-                notification['id'] = str(notification.get('_id'))
-                del notification['_id']
-            
-            serializer = NotificationSerializer(notifications, many=True)
-            return Response(serializer.data)
+            try:
+                unread_only, limit, before = feed_params(request)
+            except ValueError as e:
+                return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+            notifications = queries.fetch(queries.notifications(str(request.user.id), unread_only, limit, before))
+            return set_next_link(Response(notifications), request, notifications, limit)
+        except Exception as e:
+            return Response({'detail': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+class UnreadNotificationCountView(APIView):
+    """Unread badge: one counter document, no count over the notifications."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        try:
+            return Response({'unread': get_unread_count(str(request.user.id))})
+        except Exception as e:
+            return Response({'detail': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+class NotificationPreferencesView(APIView):
+    """Comments and edits as they happen (digest null) or summarised hourly / daily."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        try:
+            return Response({'digest': get_digest_frequency(str(request.user.id))})
+        except Exception as e:
+            return Response({'detail': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    def put(self, request):
+        try:
+            digest = request.data.get('digest')
+            if digest is not None and digest not in settings.NOTIFICATION_DIGEST_INTERVALS:
+                return Response({'detail': f"digest must be null or one of {', '.join(settings.NOTIFICATION_DIGEST_INTERVALS)}."},
+                                status=status.HTTP_400_BAD_REQUEST)
+            set_digest_frequency(str(request.user.id), digest)
+            return Response({'digest': digest})
         except Exception as e:
             return Response({'detail': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 class MarkNotificationsReadView(APIView):
     permission_classes = [permissions.IsAuthenticated]
-    
+
     def post(self, request):
         try:
-            collection = get_collection('notifications')
-            
             # Get notification IDs to mark as read
             notification_ids = request.data.get('notification_ids', [])
             mark_all = request.data.get('mark_all', False)
-            
+
             if mark_all:
                 # Mark all user's notifications as read
-                result = collection.update_many(
-                    {'user_id': str(request.user.id), 'is_read': False},
-                    {
-                        '$set': {
-                            'is_read': True,
-                            'read_at': datetime.now()
-                        }
-                    }
-                )
-                
-                return Response({
-                    'detail': f'Marked {result.modified_count} notifications as read.',
-                    'count': result.modified_count
-                })
+                count = mark_read(str(request.user.id))
             elif notification_ids:
-                # Mark specific notifications as read
-                result = collection.update_many(
-                    {
-                        '_id': {'$in': notification_ids},
-                        'user_id': str(request.user.id),  # Ensure user only updates their own notifications
-                        'is_read': False
-                    },
-                    {
-                        '$set': {
-                            'is_read': True,
-                            'read_at': datetime.now()
-                        }
-                    }
-                )
-                
-                return Response({
-                    'detail': f'Marked {result.modified_count} notifications as read.',
-                    'count': result.modified_count
-                })
+                # Mark specific notifications as read (only the user's own, see mark_read)
+                try:
+                    notification_ids = [ObjectId(notification_id) for notification_id in notification_ids]
+                except (InvalidId, TypeError):
+                    return Response({'detail': 'Invalid notification id.'}, status=status.HTTP_400_BAD_REQUEST)
+                count = mark_read(str(request.user.id), notification_ids)
             else:
-                return Response({'detail': 'Either notification_ids or mark_all must be provided.'}, 
+                return Response({'detail': 'Either notification_ids or mark_all must be provided.'},
                               status=status.HTTP_400_BAD_REQUEST)
+
+            return Response({
+                'detail': f'Marked {count} notifications as read.',
+                'count': count
+            })
         except Exception as e:
-            return Response({'detail': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+            return Response({'detail': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
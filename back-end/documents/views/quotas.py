@@ -0,0 +1,77 @@
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework import status, permissions
+
+from ..utils.quotas import InsufficientStorage, QuotaExceeded, Reservation, get_quota, set_limit
+
+
+def reserve_upload(request, owner_id, amount=None):
+    """Reserve the request body size (or `amount`) on the owner's quota before the upload is parsed.
+
+    Returns (reservation, None) or (None, error response).
+    """
+    try:
+        amount = request.META.get('CONTENT_LENGTH') if amount is None else amount
+        reservation = Reservation(owner_id, amount).acquire()
+    except QuotaExceeded as e:
+        return None, Response({'detail': str(e), 'quota': _serialize(get_quota(owner_id))},
+                              status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+    except InsufficientStorage as e:
+        return None, Response({'detail': str(e)}, status=status.HTTP_507_INSUFFICIENT_STORAGE)
+    return reservation, None
+
+
+def _serialize(quota):
+    limit = quota.get('limit')
+    return {
+        'user_id': quota['_id'],
+        'limit': limit,
+        'used': quota['used'],
+        'reserved': quota['reserved'],
+        'available': max(quota['available'], 0) if limit is not None else None,
+        'usage_percent': round(100 * quota['used'] / limit, 2) if limit else None,
+        'uploads_in_progress': len(quota.get('reservations', [])),
+        'reconciled_at': quota.get('reconciled_at'),
+    }
+
+
+class QuotaView(APIView):
+    """Storage quota of the current user (bytes actually stored, all versions and trash included)"""
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get(self, request):
+        try:
+            return Response(_serialize(get_quota(str(request.user.id))))
+        except Exception as e:
+            return Response({'detail': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class AdminQuotaView(APIView):
+    """
+    Quota of any user (admin only)
+    PUT body: {"limit": <bytes>} ou {"limit": null} pour un quota illimité
+    """
+    permission_classes = [permissions.IsAdminUser]
+    
+    def get(self, request, user_id):
+        try:
+            return Response(_serialize(get_quota(user_id)))
+        except Exception as e:
+            return Response({'detail': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    
+    def put(self, request, user_id):
+        try:
+            if 'limit' not in request.data:
+                return Response({'detail': 'limit is required.'}, status=status.HTTP_400_BAD_REQUEST)
+            limit = request.data['limit']
+            if limit is not None:
+                try:
+                    limit = int(limit)
+                except (TypeError, ValueError):
+                    limit = -1
+                if limit < 0:
+                    return Response({'detail': 'limit must be a number of bytes or null.'},
+                                   status=status.HTTP_400_BAD_REQUEST)
+            return Response(_serialize(set_limit(user_id, limit)))
+        except Exception as e:
+            return Response({'detail': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -0,0 +1,118 @@
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework import status, permissions
+from bson import ObjectId
+from pymongo import ReturnDocument
+from datetime import datetime
+
+from ..utils.mongodb import get_collection
+from ..utils.retention import RULES
+
+
+def _parse_rules(data):
+    """Validated rules from the request body, raises ValueError."""
+    rules = {}
+    for rule in RULES:
+        value = data.get(rule)
+        if value in (None, ''):
+            rules[rule] = None
+            continue
+        value = int(value)
+        if rule == 'keep_last' and value < 1:
+            raise ValueError('keep_last must be at least 1.')
+        if rule != 'keep_last' and value < -1:
+            raise ValueError(f'{rule} must be a number of periods, or -1 to keep forever.')
+        rules[rule] = value or None
+    if not any(rules.values()):
+        raise ValueError(f"At least one rule is required: {', '.join(RULES)}.")
+    return rules
+
+
+def _serialize(policy):
+    policy['id'] = str(policy.pop('_id'))
+    return policy
+
+
+class RetentionPolicyListView(APIView):
+    """
+    Version retention policies of the current user
+    A policy without folder_id applies to all the user's files, a folder policy
+    overrides it for the files of that folder. Rules (combined):
+    - keep_last: N most recent versions
+    - keep_daily / keep_weekly / keep_monthly: newest version of each day / week / month
+      over the last N periods (-1 = forever)
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get(self, request):
+        try:
+            policies = get_collection('retention_policies').find({'owner_id': str(request.user.id)})
+            return Response([_serialize(policy) for policy in policies])
+        except Exception as e:
+            return Response({'detail': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    
+    def post(self, request):
+        try:
+            try:
+                rules = _parse_rules(request.data)
+            except ValueError as e:
+                return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            
+            folder_id = request.data.get('folder_id') or None
+            if folder_id:
+                folder = get_collection('folders').find_one({'_id': ObjectId(folder_id), 'owner_id': str(request.user.id)})
+                if not folder:
+                    return Response({'detail': 'Folder not found.'}, status=status.HTTP_404_NOT_FOUND)
+            
+            collection = get_collection('retention_policies')
+            if collection.find_one({'owner_id': str(request.user.id), 'folder_id': folder_id}):
+                return Response({'detail': 'A policy already exists for this scope, update it instead.'},
+                               status=status.HTTP_400_BAD_REQUEST)
+            
+            now = datetime.now()
+            policy = {
+                'owner_id': str(request.user.id),
+                'folder_id': folder_id,
+                **rules,
+                'versions_pruned_total': 0,
+                'bytes_reclaimed_total': 0,
+                'created_at': now,
+                'updated_at': now
+            }
+            collection.insert_one(policy)
+            return Response(_serialize(policy), status=status.HTTP_201_CREATED)
+        except Exception as e:
+            return Response({'detail': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class RetentionPolicyDetailView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def put(self, request, policy_id):
+        try:
+            try:
+                rules = _parse_rules(request.data)
+            except ValueError as e:
+                return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            
+            policy = get_collection('retention_policies').find_one_and_update(
+                {'_id': ObjectId(policy_id), 'owner_id': str(request.user.id)},
+                {'$set': {**rules, 'updated_at': datetime.now()}},
+                return_document=ReturnDocument.AFTER
+            )
+            if not policy:
+                return Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+            return Response(_serialize(policy))
+        except Exception as e:
+            return Response({'detail': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    
+    def delete(self, request, policy_id):
+        try:
+            result = get_collection('retention_policies').delete_one(
+                {'_id': ObjectId(policy_id), 'owner_id': str(request.user.id)}
+            )
+            if not result.deleted_count:
+                return Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        except Exception as e:
+            return Response({'detail': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
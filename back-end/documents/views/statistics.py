@@ -5,10 +5,12 @@ from datetime import datetime, timedelta
 
 from ..serializers import FileStatisticsSerializer
 from ..utils.mongodb import get_collection
+from ..utils.cache import cached_response
 
 class StatisticsView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     
+    @cached_response
     def get(self, request):
         try:
             collection = get_collection('documents')
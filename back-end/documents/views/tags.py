@@ -3,10 +3,12 @@ from rest_framework.response import Response
 from rest_framework import status, permissions
 
 from ..utils.mongodb import get_collection
+from ..utils.cache import cached_response
 
 class TagsView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     
+    @cached_response
     def get(self, request):
         try:
             collection = get_collection('documents')
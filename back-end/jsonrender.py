@@ -1,6 +1,12 @@
-from json import JSONEncoder
 from bson import ObjectId
 from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # optionnel : on retombe sur l'encodeur de la stdlib
+    orjson = None
+
 
 class MongoJSONEncoder(JSONEncoder):
     def default(self, obj):
@@ -11,5 +17,37 @@ class MongoJSONEncoder(JSONEncoder):
             return obj.isoformat()
         return super().default(obj)
 
+
+def _orjson_default(obj):
+    # orjson encodes datetime, date, UUID, dict/list subclasses natively:
+    # this hook only sees what it doesn't know, ObjectId first and foremost
+    if type(obj) is ObjectId:
+        return str(obj)
+    if hasattr(obj, 'isoformat'):
+        return obj.isoformat()
+    raise TypeError
+
+
 class MongoJSONRenderer(JSONRenderer):
-    encoder_class = MongoJSONEncoder
\ No newline at end of file
+    """JSON renderer for raw Mongo documents, encodes with orjson when it is installed.
+
+    Falls back to MongoJSONEncoder for indented output (browsable API) and for
+    payloads orjson refuses (non-string keys, integers over 64 bits, other types).
+    """
+    encoder_class = MongoJSONEncoder
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=_orjson_default)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Same escaping as DRF: U+2028 / U+2029 are valid JSON but not valid JavaScript
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
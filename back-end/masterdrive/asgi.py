@@ -1,11 +1,14 @@
 """
 ASGI config for masterdrive project.
+
+Serves the async views (documents/views/async_views.py), e.g.
+uvicorn masterdrive.asgi:application --workers 4
 """
 
 import os
 
 from django.core.asgi import get_asgi_application
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'masterdrive.settings')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'masterdrive.settings_asgi')
 
 application = get_asgi_application()
\ No newline at end of file
@@ -163,9 +163,121 @@ FILE_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
 
 # Document storage settings
+# Where blobs live: 'documents.storage.local.LocalStorage' (below) or
+# 'documents.storage.s3.S3Storage' for any S3-compatible object store (needs boto3), e.g.
+# DOCUMENT_STORAGE_OPTIONS = {'bucket': 'sunudrive', 'endpoint_url': 'http://minio:9000',
+#                             'access_key': '...', 'secret_key': '...'}
+DOCUMENT_STORAGE_BACKEND = os.environ.get('DOCUMENT_STORAGE_BACKEND', 'documents.storage.local.LocalStorage')
+DOCUMENT_STORAGE_OPTIONS = {}
 DOCUMENT_STORAGE_PATH = os.path.join(MEDIA_ROOT, 'documents')
+# 'sharded' stores blobs as ab/cd/<name>, 'flat' directly in DOCUMENT_STORAGE_PATH.
+# Both layouts are always readable, see `manage.py migrate_storage_layout`.
+DOCUMENT_STORAGE_LAYOUT = 'sharded'
 AUTHORIZED_DOCUMENT_TYPES = ["pdf", "video", "image"]
 
+# Compression at rest (needs the optional `zstandard` package, blobs are stored raw without it).
+# The head of each upload is test-compressed, the blob is stored as zstd if it shrinks enough.
+STORAGE_COMPRESSION = True
+STORAGE_COMPRESSION_LEVEL = 3
+STORAGE_COMPRESSION_SAMPLE_SIZE = 64 * 1024  # bytes probed at upload
+STORAGE_COMPRESSION_MIN_SIZE = 4 * 1024  # smaller files are not worth it
+STORAGE_COMPRESSION_MIN_RATIO = 1.3  # original / compressed size of the sample
+STORAGE_COMPRESSION_GZIP_LEVEL = 1  # zstd blobs re-encoded on the fly for clients accepting only gzip
+
+# Versions stored as deltas against the previous full snapshot (encoded in a background job)
+VERSION_DELTA_ENABLED = True
+VERSION_DELTA_MIN_SIZE = 1024 * 1024  # smaller versions are always stored whole
+VERSION_DELTA_MAX_RATIO = 0.5  # keep the full copy if the delta is bigger than this share of it
+VERSION_SNAPSHOT_INTERVAL = 10  # one full snapshot every N versions bounds rebuild cost
+VERSION_PRUNE_INTERVAL = 6 * 60 * 60  # seconds between two `prune_versions --loop` runs
+
+# Storage quotas, in stored bytes (see `manage.py reconcile_quotas`)
+STORAGE_QUOTA_DEFAULT = 10 * 1024 * 1024 * 1024  # per user, None for unlimited
+STORAGE_QUOTA_RESERVATION_TTL = 6 * 60 * 60  # seconds before an unfinished upload's reservation is dropped
+STORAGE_DISK_HIGH_WATERMARK = 0.95  # refuse uploads past this share of the volume
+STORAGE_DISK_MIN_FREE = 1024 * 1024 * 1024  # ... or leaving less than this free
+
+# Batch / archive uploads
+DATA_UPLOAD_MAX_NUMBER_FILES = 5000  # Django defaults to 100 parts per request
+UPLOAD_STAGING_PATH = os.path.join(MEDIA_ROOT, 'staging')  # archives waiting for extraction
+UPLOAD_CLASSIFY_WORKERS = 4  # threads running libmagic on uploaded files
+UPLOAD_INSERT_BATCH_SIZE = 200  # documents per insert_many
+UPLOAD_ARCHIVE_MAX_MEMBERS = 10000
+UPLOAD_ARCHIVE_MAX_SIZE = 10 * 1024 * 1024 * 1024  # 10GB once extracted
+
+# Background jobs (see `manage.py fail_stale_jobs --loop`)
+JOB_HEARTBEAT_INTERVAL = 60  # seconds between two updated_at refreshes of a running job
+JOB_STALE_AFTER = 10 * 60  # jobs without a heartbeat for this long are failed
+JOB_SWEEP_INTERVAL = 5 * 60
+
+# Trash retention (see `manage.py purge_trash --loop`)
+TRASH_RETENTION_DAYS = 30
+TRASH_PURGE_INTERVAL = 60 * 60  # seconds between two scheduled purges
+TRASH_PURGE_BATCH_SIZE = 500
+TRASH_PURGE_UNLINKS_PER_SECOND = 200
+TRASH_PURGE_STALLED_AFTER = 15 * 60  # purge jobs (empty trash, retention) without progress for this long are resumed
+
+# Orphaned blob collection (see `manage.py collect_garbage`)
+GC_GRACE_PERIOD = 24 * 60 * 60  # seconds, protects uploads still being written
+GC_SPILL_THRESHOLD = 1000000  # referenced names kept in memory before spilling to disk
+GC_SPILL_PATH = os.path.join(MEDIA_ROOT, 'gc')
+GC_QUARANTINE_PATH = os.path.join(MEDIA_ROOT, 'quarantine')
+GC_UNLINKS_PER_SECOND = 200
+
+# Storage integrity scrubbing (see `manage.py scrub_storage`)
+SCRUB_WORKERS = 4
+SCRUB_BATCH_SIZE = 200  # documents between two checkpoints
+SCRUB_BYTES_PER_SECOND = 50 * 1024 * 1024  # read bandwidth cap, None for unlimited
+
+# Listing response cache (files, folder contents, shared, tags, statistics), see documents/utils/cache.py.
+# Set REDIS_URL to share it between workers, each process keeps its own copy otherwise.
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+RESPONSE_CACHE_TIMEOUT = 5 * 60  # seconds, also bounds how stale time-based data can get
+
+# Notifications
+NOTIFICATION_PAGE_SIZE = 50  # notifications per page by default (?limit=)
+NOTIFICATION_PAGE_MAX = 200  # largest ?limit= accepted
+NOTIFICATION_READ_RETENTION_DAYS = 90  # read notifications are deleted by a TTL index after this
+NOTIFICATION_COALESCE_WINDOW = 60 * 60  # seconds, comments / edits on a file within it make one notification
+NOTIFICATION_DIGEST_INTERVALS = {'hourly': 60 * 60, 'daily': 24 * 60 * 60}  # seconds
+NOTIFICATION_DIGEST_CHECK_INTERVAL = 5 * 60  # seconds between two `send_notification_digests --loop` runs
+
+# Notification stream (GET /api/v1/notifications/stream/, ASGI server only)
+NOTIFICATION_STREAM_POLL_INTERVAL = 2  # seconds, notifications created by other processes wait up to this
+NOTIFICATION_STREAM_HEARTBEAT = 15  # seconds of silence before a keep-alive comment
+NOTIFICATION_STREAM_BUFFER = 100  # events queued for a slow client before it is disconnected
+NOTIFICATION_STREAM_BACKLOG = 100  # missed notifications replayed on reconnection
+NOTIFICATION_STREAM_RETRY = 5000  # ms, reconnection delay advertised to EventSource
+
+# File detail (GET /api/v1/files/<id>/): latest versions / activities and first grantees returned
+FILE_DETAIL_SLICE = 10
+
+# Block-level version uploads (files/<id>/versions/sync/)
+CHUNK_SYNC_SESSION_TTL = 24 * 60 * 60  # seconds, unfinished uploads and their chunks are dropped after this
+
+# Idempotency-Key header on uploads, shares and comments (documents/utils/idempotency.py)
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60  # seconds a key and its response are kept
+IDEMPOTENCY_LOCK_TIMEOUT = 10 * 60  # seconds before a retry may take over a request that never finished
+
+# Change journal (GET /api/v1/changes/)
+CHANGES_PAGE_SIZE = 500  # journal entries read per poll
+CHANGES_SETTLE_DELAY = 5  # seconds a gap in the sequence is waited for before being skipped
+CHANGES_RETENTION_DAYS = 30  # older tokens need a full resync
+CHANGES_COMPACT_INTERVAL = 60 * 60  # seconds between two `compact_changes --loop` runs
+
 # Ensure required directories exist
 os.makedirs(DOCUMENT_STORAGE_PATH, exist_ok=True)
 
@@ -189,7 +301,7 @@ SIMPLE_JWT = {
 AUTH_USER_MODEL = 'authentication.User'
 
 # settings.py
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
 EMAIL_HOST = 'smtp.gmail.com'
 EMAIL_PORT = 587
 EMAIL_USE_TLS = True
@@ -197,6 +309,16 @@ EMAIL_HOST_USER = "diopmedoune480@gmail.com" # utilsation temporaire
 EMAIL_HOST_PASSWORD = "fdhl hqal imei rzka " # ce mot de passe sera révoqué trés bientôt
 DEFAULT_FROM_EMAIL = 'AgriConnect <no-reply@agriconnect.com>'
 
+# Email outbox (see `manage.py send_outbox --loop`, documents/utils/outbox.py)
+EMAIL_OUTBOX_BATCH_SIZE = 100  # messages claimed per run
+EMAIL_OUTBOX_RATE = 10  # messages per second, None for unlimited
+EMAIL_OUTBOX_MAX_ATTEMPTS = 5
+EMAIL_OUTBOX_RETRY_DELAY = 60  # seconds before the first retry, doubled each time
+EMAIL_OUTBOX_CLAIM_TIMEOUT = 10 * 60  # messages claimed by a sender silent for this long are requeued
+EMAIL_OUTBOX_INTERVAL = 5  # seconds between two runs
+EMAIL_DIGEST_DELAY = 10 * 60  # notification emails of a recipient within it are sent as one
+NOTIFICATION_EMAIL_TYPES = ('share', 'comment')
+
 
 AUTHENTICATION_BACKENDS = [
     'authentication.auth_backend.EmailOrCellphoneBackend', # classic users authentication
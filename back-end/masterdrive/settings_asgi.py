@@ -0,0 +1,7 @@
+"""
+Settings of the ASGI server (masterdrive/asgi.py), see masterdrive/urls_asgi.py.
+"""
+
+from .settings import *  # noqa: F401,F403
+
+ROOT_URLCONF = 'masterdrive.urls_asgi'
@@ -0,0 +1,12 @@
+"""
+URL configuration of the ASGI server: the async views for the high traffic endpoints.
+"""
+
+from django.urls import include, path
+
+from . import urls
+
+urlpatterns = [
+    path('api/v1/', include('documents.urls_async')) if str(pattern.pattern) == 'api/v1/' else pattern
+    for pattern in urls.urlpatterns
+]